@@ -0,0 +1,129 @@
+"""
+Control de admisión de las predicciones
+
+Cada endpoint admite hasta `limit` cálculos a la vez (consultas a la base
+de datos y modelos) y una cola corta de `queue_size` peticiones que
+esperan un lugar. Una petición se rechaza en seguida (429) si la cola
+está llena o si, según la latencia observada de los cálculos recientes,
+su espera superaría `max_wait`; si espera y no obtiene lugar en `max_wait`
+segundos, se rechaza con 503. Los rechazos traen el tiempo sugerido para
+reintentar (cabecera Retry-After), calculado con la misma latencia.
+
+Así, en un pico de tráfico las peticiones que no se pueden atender a
+tiempo fallan rápido en lugar de acumularse detrás de los hilos del
+servidor y de las conexiones a PostgreSQL.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    """Petición rechazada por el control de admisión"""
+
+    def __init__(self, status, retry_after, reason):
+        super().__init__(f'servidor saturado ({reason}), reintentar en {retry_after} s')
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    Lugares para cálculos simultáneos de un endpoint, con cola FIFO acotada.
+    `limit=0` desactiva el control (se admite todo).
+    """
+
+    def __init__(self, name, limit=8, queue_size=16, max_wait=0.5, smoothing=0.2):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.smoothing = smoothing
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.latency = None    # Media móvil exponencial de la duración de los cálculos (segundos)
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_latency = 0
+        self.timeouts = 0
+
+    def _expected_wait(self, position):
+        """Espera estimada de la petición en la posición `position` de la cola"""
+        return position * (self.latency or 0.0) / self.limit
+
+    def _retry_after(self):
+        """Segundos sugeridos para reintentar: lo que tardaría en vaciarse la cola"""
+        return max(1, math.ceil(self._expected_wait(self.in_flight + self.waiting)))
+
+    def acquire(self):
+        """Ocupar un lugar o lanzar Overloaded"""
+        if self.limit <= 0:
+            return
+        with self._cond:
+            if self.in_flight < self.limit and self.waiting == 0:
+                self.in_flight += 1
+                self.admitted += 1
+                return
+            if self.waiting >= self.queue_size:
+                self.rejected_queue_full += 1
+                raise Overloaded(429, self._retry_after(), 'cola llena')
+            if self._expected_wait(self.waiting + 1) > self.max_wait:
+                self.rejected_latency += 1
+                raise Overloaded(429, self._retry_after(), 'latencia')
+
+            self.waiting += 1
+            self.queued += 1
+            deadline = time.monotonic() + self.max_wait
+            try:
+                while self.in_flight >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise Overloaded(503, self._retry_after(), 'tiempo de espera agotado')
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+
+    def release(self, seconds):
+        """Liberar el lugar de un cálculo que duró `seconds`"""
+        if self.limit <= 0:
+            return
+        with self._cond:
+            self.in_flight -= 1
+            self.latency = seconds if self.latency is None else (
+                self.smoothing * seconds + (1 - self.smoothing) * self.latency)
+            self._cond.notify()
+
+    @contextmanager
+    def admit(self):
+        """`with controller.admit(): ...` ejecuta el bloque en un lugar (o lanza Overloaded)"""
+        self.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    def stats(self):
+        """Estado del control de admisión para /api/health y /metrics"""
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'queue_size': self.queue_size,
+                'max_wait': self.max_wait,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'latency_ms': (self.latency or 0.0) * 1000,
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'rejected_queue_full': self.rejected_queue_full,
+                'rejected_latency': self.rejected_latency,
+                'timeouts': self.timeouts
+            }
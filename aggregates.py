@@ -0,0 +1,167 @@
+"""
+Tablas de agregados por enfrentamiento mantenidas por la base de datos
+
+Para cada tabla de características se crea agregado_<nombre> con una fila
+por cruce (equipo_local_id, equipo_visitante_id) que ya contiene los AVG de
+todas sus columnas. Si el cruce directo no tiene partidos, la fila guarda
+los promedios del cruce inverso (directo = false), así que una búsqueda por
+clave primaria resuelve el mismo orden directo/inverso que las consultas
+originales. Triggers por sentencia recalculan solo los cruces afectados
+por cada INSERT/UPDATE/DELETE.
+"""
+
+from feature_store import TABLES, SQL_AVG_TABLES
+
+AGGREGATE_TABLES = {table: TABLES[table] for table in sorted(SQL_AVG_TABLES)}
+
+
+def aggregate_name(table):
+    """ganador_resultado_tabla -> agregado_ganador_resultado"""
+    return 'agregado_' + table[:-len('_tabla')]
+
+
+def _select_pair_sql(table, columns, local, visitante):
+    """Promedios del cruce (local, visitante) o, si no tiene partidos, del inverso"""
+    averages = ',\n            '.join(f"AVG({col}) AS {col}" for col in columns)
+    return f"""
+        SELECT
+            equipo_local_id = {local} AS directo,
+            COUNT(*) AS num_partidos,
+            MAX(fecha) AS fecha_max,
+            COUNT(*) - COUNT(fecha) AS partidos_sin_fecha,
+            {averages}
+        FROM {table}
+        WHERE (equipo_local_id = {local} AND equipo_visitante_id = {visitante})
+           OR (equipo_local_id = {visitante} AND equipo_visitante_id = {local})
+        GROUP BY equipo_local_id, equipo_visitante_id
+        ORDER BY equipo_local_id = {local} DESC
+        LIMIT 1"""
+
+
+def _create_sql(table, columns):
+    name = aggregate_name(table)
+    return f"""
+    CREATE TABLE {name} AS
+    SELECT 0::integer AS equipo_local_id, 0::integer AS equipo_visitante_id, s.*
+    FROM ({_select_pair_sql(table, columns, '0', '0')}) s
+    WITH NO DATA;
+
+    ALTER TABLE {name} ADD PRIMARY KEY (equipo_local_id, equipo_visitante_id);
+    """
+
+
+def _functions_sql(table, columns):
+    name = aggregate_name(table)
+    return f"""
+    CREATE INDEX IF NOT EXISTS {table}_enfrentamiento_idx
+        ON {table} (equipo_local_id, equipo_visitante_id, fecha);
+
+    -- Recalcular los dos sentidos de un cruce
+    CREATE OR REPLACE FUNCTION refrescar_{name}(a INTEGER, b INTEGER) RETURNS void AS $$
+    BEGIN
+        DELETE FROM {name}
+        WHERE (equipo_local_id = a AND equipo_visitante_id = b)
+           OR (equipo_local_id = b AND equipo_visitante_id = a);
+
+        INSERT INTO {name}
+        SELECT par.l, par.v, s.*
+        FROM (SELECT DISTINCT * FROM (VALUES (a, b), (b, a)) p(l, v)) par
+        CROSS JOIN LATERAL ({_select_pair_sql(table, columns, 'par.l', 'par.v')}) s;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION trigger_{name}() RETURNS trigger AS $$
+    DECLARE
+        par RECORD;
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            DELETE FROM {name};
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            FOR par IN SELECT DISTINCT equipo_local_id, equipo_visitante_id FROM filas_nuevas
+                       WHERE equipo_local_id IS NOT NULL AND equipo_visitante_id IS NOT NULL LOOP
+                PERFORM refrescar_{name}(par.equipo_local_id, par.equipo_visitante_id);
+            END LOOP;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            FOR par IN SELECT DISTINCT equipo_local_id, equipo_visitante_id FROM filas_anteriores
+                       WHERE equipo_local_id IS NOT NULL AND equipo_visitante_id IS NOT NULL LOOP
+                PERFORM refrescar_{name}(par.equipo_local_id, par.equipo_visitante_id);
+            END LOOP;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS {name}_insert ON {table};
+    DROP TRIGGER IF EXISTS {name}_update ON {table};
+    DROP TRIGGER IF EXISTS {name}_delete ON {table};
+    DROP TRIGGER IF EXISTS {name}_truncate ON {table};
+
+    CREATE TRIGGER {name}_insert AFTER INSERT ON {table}
+        REFERENCING NEW TABLE AS filas_nuevas
+        FOR EACH STATEMENT EXECUTE FUNCTION trigger_{name}();
+    CREATE TRIGGER {name}_update AFTER UPDATE ON {table}
+        REFERENCING OLD TABLE AS filas_anteriores NEW TABLE AS filas_nuevas
+        FOR EACH STATEMENT EXECUTE FUNCTION trigger_{name}();
+    CREATE TRIGGER {name}_delete AFTER DELETE ON {table}
+        REFERENCING OLD TABLE AS filas_anteriores
+        FOR EACH STATEMENT EXECUTE FUNCTION trigger_{name}();
+    CREATE TRIGGER {name}_truncate AFTER TRUNCATE ON {table}
+        FOR EACH STATEMENT EXECUTE FUNCTION trigger_{name}();
+    """
+
+
+def rebuild_aggregates(cursor, table):
+    """Recalcular todos los cruces de una tabla"""
+    name = aggregate_name(table)
+    cursor.execute(f"DELETE FROM {name}")
+    cursor.execute(f"""
+        SELECT refrescar_{name}(equipo_local_id, equipo_visitante_id)
+        FROM (SELECT DISTINCT equipo_local_id, equipo_visitante_id FROM {table}
+              WHERE equipo_local_id IS NOT NULL AND equipo_visitante_id IS NOT NULL) pares
+    """)
+
+
+def ensure_aggregates(connection, tables=None):
+    """
+    Crear (si no existen) las tablas de agregados, sus funciones y triggers,
+    y poblarlas. Es idempotente: se puede llamar en cada arranque.
+    """
+    tables = tables or AGGREGATE_TABLES
+    with connection.cursor() as cursor:
+        for table, columns in tables.items():
+            name = aggregate_name(table)
+            cursor.execute("SELECT to_regclass(%s)", (name,))
+            created = cursor.fetchone()[0] is None
+            if created:
+                cursor.execute(_create_sql(table, columns))
+            cursor.execute(_functions_sql(table, columns))
+            if created:
+                rebuild_aggregates(cursor, table)
+    connection.commit()
+
+
+def aggregate_average(cursor, table, equipo_local_id, equipo_visitante_id, fecha_corte=None):
+    """
+    Promedios de un enfrentamiento leídos de la tabla de agregados.
+    Devuelve (cubre, resultado): si cubre es False la fecha de corte cae dentro
+    de los partidos del cruce y hay que calcular el promedio con la tabla original.
+    """
+    columns = AGGREGATE_TABLES[table]
+    cubre = "partidos_sin_fecha = 0 AND fecha_max < %s" if fecha_corte else "TRUE"
+    cursor.execute(
+        f"SELECT {', '.join(columns)}, num_partidos, directo, {cubre} AS cubre "
+        f"FROM {aggregate_name(table)} WHERE equipo_local_id = %s AND equipo_visitante_id = %s",
+        ([fecha_corte] if fecha_corte else []) + [equipo_local_id, equipo_visitante_id]
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return True, None
+    row = dict(row)
+    if not row.pop('cubre'):
+        return False, None
+    row.pop('directo')
+    return True, row
+
@@ -1,84 +1,467 @@
-from flask import Flask, request, jsonify, send_from_directory
+# Medir el arranque en frío desde la primera línea (incluye los imports)
+import time
+_startup_started = time.perf_counter()
+
+from flask import Flask, request, jsonify, send_from_directory, g, Response
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import psycopg2
 import psycopg2.extras
-import pickle
-import joblib
-import pandas as pd
 import numpy as np
-from datetime import datetime
+from datetime import date, datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 import os
+import re
+import sys
+import functools
+import logging
+import threading
 from dotenv import load_dotenv
+from db_pool import PostgresPool, db_config_from_env
+from feature_store import FeatureStore
+from snapshot import SnapshotFile, SnapshotError
+from matchup_matrix import MatchupMatrix
+from prediction_cache import PredictionCache, LastValues
+from aggregates import aggregate_average, ensure_aggregates
+from migrate import SCHEMA_VERSION, current_version
+from logging_config import ACCESS_LOG, setup_logging, restart_after_fork
+from model_manager import ModelManager
+from micro_batch import MicroBatcher
+from single_flight import SingleFlight
+from admission import AdmissionController, Overloaded
+import deadline
+from deadline import DeadlineExceeded, Degraded
+import metrics
+
+# Segundos de cada fase del arranque (se publican en /api/health y /metrics)
+startup_timings = {'imports': time.perf_counter() - _startup_started}
 
 # Cargar variables de entorno
 load_dotenv()
+setup_logging()
+logger = logging.getLogger(__name__)
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Serializador JSON de Flask que mide la etapa 'serialize'"""
+
+    def dumps(self, obj, **kwargs):
+        with metrics.stage('serialize'):
+            return super().dumps(obj, **kwargs)
 
 app = Flask(__name__, static_folder='public')
+app.json = TimedJSONProvider(app)
 CORS(app)
 
+# Plazo de cada petición (deadline.py) en milisegundos; 0 lo desactiva
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE_MS', 2000)) / 1000
+BATCH_DEADLINE = float(os.getenv('BATCH_DEADLINE_MS', 10000)) / 1000
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics.start_request()
+    endpoint = request.url_rule.rule if request.url_rule else 'sin_ruta'
+    deadline.start(BATCH_DEADLINE if endpoint == '/api/predict-batch' else REQUEST_DEADLINE, endpoint)
+
+@app.after_request
+def record_request_metrics(response):
+    """Histogramas por endpoint y cabecera Server-Timing con el tiempo de cada etapa"""
+    timings = metrics.current_request()
+    if timings is None:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule else 'sin_ruta'
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - timings.started, endpoint, request.method)
+    metrics.REQUESTS.inc(endpoint, request.method, str(response.status_code))
+    response.headers['Server-Timing'] = timings.server_timing()
+    return response
+
+@app.teardown_request
+def end_request_metrics(exc):
+    metrics.end_request()
+    deadline.clear()
+
+@app.after_request
+def log_request(response):
+    """Una sola línea de log por petición (INFO para la API, DEBUG para archivos estáticos)"""
+    duration_ms = (time.perf_counter() - g.get('request_started', time.perf_counter())) * 1000
+    level = logging.INFO if request.path.startswith('/api/') else logging.DEBUG
+    if logger.isEnabledFor(level):
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 2)
+        }
+        fields.update(g.get('log_fields', {}))
+        fields[ACCESS_LOG] = True
+        logger.log(level, "%s %s %d %.1f ms", request.method, request.path,
+                   response.status_code, duration_ms, extra=fields)
+    return response
+
 # Configuración de la base de datos PostgreSQL
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'user',
-    'password': 'ups_bet05',
-    'database': 'UPS_BET',
-    'port': 5432
+DB_CONFIG = db_config_from_env()
+
+# Pool de conexiones compartido (las conexiones se abren bajo demanda)
+db_pool = PostgresPool(
+    DB_CONFIG,
+    minconn=int(os.getenv('DB_POOL_MIN', 1)),
+    maxconn=int(os.getenv('DB_POOL_MAX', 10)),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', 5)),
+    health_check_interval=float(os.getenv('DB_POOL_HEALTH_CHECK', 30)),
+    idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300))
+)
+
+def new_query_executor():
+    return ThreadPoolExecutor(
+        max_workers=int(os.getenv('QUERY_WORKERS', 8)),
+        thread_name_prefix='consultas'
+    )
+
+# Hilos para lanzar en paralelo las consultas de /api/predict-all y /api/predict-batch
+query_executor = new_query_executor()
+
+# Máximo de partidos por petición a /api/predict-batch (240 = todos los cruces de 16 equipos)
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 240))
+
+# Equipos de la LigaPro (mismos IDs que equipos_dict en public/js/script.js)
+EQUIPOS_LIGAPRO = {
+    "Barcelona SC": 0,
+    "El Nacional": 2,
+    "Emelec": 4,
+    "LDU de Quito": 5,
+    "Mushuc Runa SC": 6,
+    "IDV": 7,
+    "Tecnico Universitario": 8,
+    "Delfin": 9,
+    "Deportivo Cuenca": 10,
+    "Aucas": 12,
+    "U Catolica": 13,
+    "Macara": 14,
+    "Orense": 15,
+    "Manta": 17,
+    "Libertad": 20,
+    "Vinotinto": 22
 }
 
-# Cargar modelos
-def load_models():
+MODEL_DIR = 'modelos'
+
+# Predictores compilados (tree_predictor.py) para las llamadas con pocas filas;
+# con más filas el predict de la librería es más rápido
+TREE_PREDICTOR_MAX_ROWS = int(os.getenv('TREE_PREDICTOR_MAX_ROWS', 4))
+
+# Hilos de LightGBM/XGBoost por predict. Con 1 las peticiones concurrentes no
+# se reparten los núcleos entre los hilos internos de cada librería; 0 deja
+# el valor por defecto (todos los núcleos)
+MODEL_THREADS = int(os.getenv('MODEL_THREADS', 1))
+
+def validate_models(models):
+    """
+    Predicción de prueba antes de poner en uso una versión de los modelos:
+    filas de ceros por el camino compilado y por el de la librería, que deben
+    dar resultados finitos e iguales
+    """
+    n_resultados = len(models.resultados['feature_columns'])
+    n_tarjetas = getattr(models.tarjetas, 'n_features_in_', None) or models.tarjetas.num_feature()
+    outputs = []
+    for rows in (1, TREE_PREDICTOR_MAX_ROWS + 1):
+        goles_local, goles_visitante = score_results(np.zeros((rows, n_resultados)), models)
+        corners = score_corners(np.zeros((rows, models.escalador.n_features_in_)), [0] * rows, [0] * rows, models)
+        tarjetas = score_tarjetas(np.zeros((rows, n_tarjetas)), models)
+        outputs.append(np.array([goles_local, goles_visitante, corners, tarjetas], dtype=float))
+    for output in outputs:
+        if not np.all(np.isfinite(output)):
+            raise ValueError(f'predicción de prueba no finita: {output[:, 0].tolist()}')
+    if not np.array_equal(outputs[0][:, 0], outputs[1][:, 0]):
+        raise ValueError('los predictores compilados no coinciden con los modelos')
+
+# Los modelos se cargan en un hilo: el servidor termina de arrancar (base de
+# datos, almacén de características) sin esperar a lightgbm/xgboost, y la
+# primera predicción espera a que la carga termine (wait_for_models). Después
+# model_manager recarga en caliente las versiones nuevas de modelos/
+model_manager = ModelManager(MODEL_DIR, validate=validate_models,
+                             compile_trees=TREE_PREDICTOR_MAX_ROWS > 0,
+                             settle=float(os.getenv('MODEL_RELOAD_SETTLE', 2)),
+                             threads=MODEL_THREADS)
+_models_loaded = threading.Event()
+
+def load_models_in_background():
     try:
-        print("=" * 50)
-        print("CARGANDO MODELOS DE MACHINE LEARNING")
-        print("=" * 50)
-        
-        # Cargar modelo de resultados
-        print("Cargando modelo de predicción de resultados...")
-        modelo_dict = joblib.load('modelos/modelo_ligapro.pkl')
-        model_resultados = modelo_dict  # Guardamos todo el diccionario
-        print(f"Modelo de resultados cargado: {type(modelo_dict).__name__}")
-        print(f"Contiene: {list(modelo_dict.keys())}")
-        
-        # Cargar modelo de corners
-        print("Cargando modelo de predicción de corners...")
-        with open('modelos/prediccion_corners_totales.pkl', 'rb') as f:
-            model_corners = pickle.load(f)
-        print(f"Modelo de corners cargado: {type(model_corners).__name__}")
-        
-        # Cargar modelo de tarjetas
-        print("Cargando modelo de predicción de tarjetas...")
-        with open('modelos/modelo_lightgbm_final.pkl', 'rb') as f:
-            model_tarjetas = pickle.load(f)
-        print(f"Modelo de tarjetas cargado: {type(model_tarjetas).__name__}")
-        
-        # Cargar escalador de corners
-        print("Cargando escalador de datos...")
-        with open('modelos/escalador_corners.pkl', 'rb') as f:
-            scaler_corners = pickle.load(f)
-        print(f"Escalador cargado: {type(scaler_corners).__name__}")
-        
-        print("=" * 50)
-        print("TODOS LOS MODELOS CARGADOS EXITOSAMENTE")
-        print("=" * 50)
-        
-        return model_resultados, model_corners, model_tarjetas, scaler_corners
+        models = model_manager.reload()
+        if models is not None:
+            startup_timings['models'] = models.info['total_ms'] / 1000
+    finally:
+        _models_loaded.set()
+
+def wait_for_models(timeout=None):
+    """Esperar a que termine la carga de los modelos; False si se agotó el timeout"""
+    return _models_loaded.wait(timeout)
+
+def compiled_predictor(models, name, features):
+    """Predictor compilado de name si conviene para estas filas; None para usar el modelo original"""
+    if len(features) <= TREE_PREDICTOR_MAX_ROWS:
+        return models.predictors.get(name)
+    return None
+
+def model_versions(models):
+    """Versión de cada modelo para las respuestas (None si no están cargados)"""
+    if models is None:
+        return {campo: None for campo in ('resultado', 'corners', 'tarjetas')}
+    return dict(models.versions)
+
+# Tablas de características en memoria: las predicciones no consultan la base de datos
+feature_store = FeatureStore(db_pool)
+
+# Snapshot columnar de las tablas (snapshot.py): si se configura, el almacén
+# se lee de ese archivo mapeado en memoria y no de PostgreSQL
+FEATURE_SNAPSHOT = os.getenv('FEATURE_SNAPSHOT')
+if FEATURE_SNAPSHOT:
+    feature_store.use_snapshot(SnapshotFile(FEATURE_SNAPSHOT))
+
+def init_feature_store():
+    """Cargar el almacén de características y vigilar cambios en las tablas"""
+    if os.getenv('FEATURE_STORE', '1') == '0':
+        logger.info("Almacén de características deshabilitado (FEATURE_STORE=0)")
+        return
+    try:
+        feature_store.load()
+    except (SnapshotError, OSError) as e:
+        feature_store.last_error = str(e)
+        # Mientras tanto las consultas van a la base de datos; el hilo de
+        # actualización vuelve a leer el snapshot cuando cambie
+        logger.error("No se pudo cargar el snapshot %s: %s", FEATURE_SNAPSHOT, e)
     except Exception as e:
-        print(f"Error cargando modelos: {e}")
-        print(f"Tipo de error: {type(e)}")
-        return None, None, None, None
+        feature_store.last_error = str(e)
+        # El hilo de actualización (start_background_threads) lo vuelve a intentar
+        logger.error("No se pudo cargar el almacén de características: %s", e)
+
+# Predicciones precalculadas de todos los cruces; se reconstruyen cuando
+# cambian las tablas (nueva versión del almacén) o los modelos
+matchup_matrix = MatchupMatrix(
+    EQUIPOS_LIGAPRO,
+    build=lambda partidos: predict_batch(partidos),
+    version=lambda: (feature_store.version, model_manager.version)
+)
+
+def rebuild_matchup_matrix(changed):
+    matchup_matrix.invalidate()
+    matchup_matrix.rebuild_in_background()
+
+# Caché de predicciones por (modelo, equipos, fecha de corte, versión de datos y de modelos)
+prediction_cache = PredictionCache(
+    maxsize=int(os.getenv('PREDICTION_CACHE_SIZE', 4096)),
+    ttl=float(os.getenv('PREDICTION_CACHE_TTL', 300))
+)
+feature_store.on_refresh(prediction_cache.invalidate)
+
+# Coalescencia (single_flight.py): las peticiones iguales que llegan mientras
+# se calcula la misma predicción (o los mismos datos históricos) esperan ese
+# cálculo en lugar de repetir consultas y modelos; la clave es la de la caché
+inflight = {campo: SingleFlight() for campo in ('resultado', 'corners', 'tarjetas', 'historico')}
+
+# Control de admisión (admission.py) de las predicciones que van a la base de
+# datos y a los modelos: hasta ADMISSION_LIMIT a la vez por endpoint y una
+# cola corta; las demás se rechazan con 429/503 y Retry-After (o reciben la
+# última predicción guardada del cruce). Los aciertos de la matriz y de la
+# caché nunca se rechazan
+ADMISSION_LIMIT = int(os.getenv('ADMISSION_LIMIT', 8))
+ADMISSION_QUEUE = int(os.getenv('ADMISSION_QUEUE', 16))
+ADMISSION_MAX_WAIT = float(os.getenv('ADMISSION_MAX_WAIT_MS', 500)) / 1000
+admission = {
+    name: AdmissionController(name, ADMISSION_LIMIT, ADMISSION_QUEUE, ADMISSION_MAX_WAIT)
+    for name in ('predict', 'predict_corners', 'predict_tarjetas', 'predict_all', 'predict_batch')
+}
+
+def run_admitted(admit, fn, *args):
+    """fn(*args) dentro de `with admit()` (sin control de admisión si admit es None)"""
+    if admit is None:
+        return fn(*args)
+    with admit():
+        return fn(*args)
+
+def prediction_cache_key(campo, equipo_local_id, equipo_visitante_id, fecha_corte, models):
+    """Clave de la caché, o None si los IDs no se pueden usar como clave"""
+    if not all(isinstance(value, (int, float, str)) or value is None
+               for value in (equipo_local_id, equipo_visitante_id, fecha_corte)):
+        return None
+    return (campo, equipo_local_id, equipo_visitante_id, fecha_corte,
+            feature_store.version, models.version if models is not None else None)
+
+def stale_cache_key(cache_key):
+    """Clave de la última predicción de un cruce, sin versiones de datos ni modelos"""
+    return cache_key[:4] if cache_key is not None else None
+
+def finish_prediction(result, cache_key, degraded):
+    """
+    Guardar en la caché una predicción recién calculada. Las calculadas con
+    datos de respaldo (plazo agotado) se marcan como degradadas y no se guardan
+    """
+    if degraded:
+        result['degraded'] = True
+    else:
+        prediction_cache.put(cache_key, result, stale_cache_key(cache_key))
+    return result
+
+def lookup_matchup_matrix(equipo_local_id, equipo_visitante_id, fecha_corte, campo):
+    """
+    Predicción precalculada de un cruce. Solo se usa si la fecha de corte es
+    posterior a todos los partidos cargados (la matriz se calcula sin corte).
+    """
+    try:
+        if not matchup_matrix.ready or not feature_store.covers(fecha_corte):
+            return None
+    except ValueError:
+        # Fecha no interpretable: se responde con el cálculo en vivo
+        return None
+    return matchup_matrix.get(equipo_local_id, equipo_visitante_id, campo)
 
-model_resultados, model_corners, model_tarjetas, scaler_corners = load_models()
 
 def get_db_connection():
-    """Crear conexión a la base de datos PostgreSQL"""
+    """
+    Tomar una conexión del pool de PostgreSQL. La espera por una conexión
+    libre no pasa del plazo de la petición (lanza DeadlineExceeded)
+    """
+    timeout = deadline.bound(db_pool.timeout, 'db_connection')
     try:
-        connection = psycopg2.connect(**DB_CONFIG)
-        return connection
+        with metrics.stage('db_connection'):
+            return db_pool.get(timeout)
     except Exception as e:
-        print(f"Error conectando a la base de datos: {e}")
-        print(f"Tipo de error: {type(e)}")
+        left = deadline.remaining()
+        if left is not None and left <= 0:
+            raise deadline.expired('db_connection') from None
+        logger.error("Error conectando a la base de datos (%s): %s", type(e).__name__, e)
         return None
 
+class TimedDictCursor(psycopg2.extras.RealDictCursor):
+    """
+    Cursor de diccionarios que mide las consultas en la etapa 'db_query'.
+    Con plazo de petición, cada consulta lleva el tiempo restante como
+    statement_timeout de la transacción (en el mismo envío) y lanza
+    DeadlineExceeded si PostgreSQL la cancela por eso
+    """
+
+    def execute(self, query, vars=None):
+        timeout = deadline.bound(None, 'db_query')
+        if timeout is not None:
+            query = f"SET LOCAL statement_timeout = {max(1, int(timeout * 1000))}; {query}"
+        with metrics.stage('db_query'):
+            try:
+                return super().execute(query, vars)
+            except psycopg2.extensions.QueryCanceledError:
+                if timeout is None:
+                    raise
+                raise deadline.expired('db_query') from None
+
+    def fetchone(self):
+        with metrics.stage('db_query'):
+            return super().fetchone()
+
+    def fetchall(self):
+        with metrics.stage('db_query'):
+            return super().fetchall()
+
+def release_db_connection(connection):
+    """Devolver una conexión al pool"""
+    db_pool.put(connection)
+
+# Última lectura buena de cada enfrentamiento (promedios e historial), para
+# responder con ella cuando se agota el plazo de la petición
+last_known_aggregates = LastValues(4096)
+
+def last_known_good(table):
+    """
+    Guardar la última lectura buena de cada enfrentamiento (y fecha de corte)
+    de `table` y devolverla como Degraded si la lectura agota el plazo
+    """
+    def decorate(read):
+        @functools.wraps(read)
+        def wrapper(equipo_local_id, equipo_visitante_id, *args):
+            key = (table, equipo_local_id, equipo_visitante_id) + args
+            try:
+                hash(key)
+            except TypeError:
+                return read(equipo_local_id, equipo_visitante_id, *args)
+            try:
+                result = read(equipo_local_id, equipo_visitante_id, *args)
+            except DeadlineExceeded as e:
+                # La misma fecha de corte o, si no, la última lectura del cruce
+                fallback = last_known_aggregates.get(key) or last_known_aggregates.get(key[:3])
+                if fallback is None:
+                    raise
+                logger.warning("Plazo agotado en %s leyendo %s de %s vs %s: se usan los últimos datos leídos",
+                               e.stage, table, equipo_local_id, equipo_visitante_id)
+                return Degraded(fallback)
+            if result:
+                last_known_aggregates.put(key, result)
+                last_known_aggregates.put(key[:3], result)
+            return result
+        return wrapper
+    return decorate
+
+# Versión del esquema encontrada al arrancar (None si no se pudo consultar)
+schema_version = None
+
+def check_schema_version():
+    """Comparar la versión del esquema con la que espera el servidor"""
+    global schema_version
+    connection = get_db_connection()
+    if not connection:
+        return
+    try:
+        schema_version = current_version(connection)
+        if schema_version < SCHEMA_VERSION:
+            logger.warning("El esquema de la base de datos está en la versión %s y el servidor "
+                           "espera la %s. Ejecuta: python migrate.py", schema_version, SCHEMA_VERSION)
+        elif schema_version > SCHEMA_VERSION:
+            logger.warning("El esquema de la base de datos (versión %s) es más nuevo que el que "
+                           "conoce el servidor (%s)", schema_version, SCHEMA_VERSION)
+        else:
+            logger.info("Esquema de la base de datos en la versión %s", schema_version)
+    except Exception as e:
+        logger.error("No se pudo verificar la versión del esquema: %s", e)
+    finally:
+        release_db_connection(connection)
+
+# Tablas agregado_* disponibles (las crea init_aggregates al arrancar)
+aggregates_ready = False
+
+def init_aggregates():
+    """Crear o actualizar las tablas de agregados por enfrentamiento y sus triggers"""
+    global aggregates_ready
+    if os.getenv('AGGREGATE_TABLES', '1') == '0':
+        logger.info("Tablas de agregados deshabilitadas (AGGREGATE_TABLES=0)")
+        return
+    connection = get_db_connection()
+    if not connection:
+        return
+    try:
+        ensure_aggregates(connection)
+        aggregates_ready = True
+        logger.info("Tablas de agregados por enfrentamiento listas")
+    except Exception as e:
+        connection.rollback()
+        logger.error("No se pudieron crear las tablas de agregados: %s", e)
+    finally:
+        release_db_connection(connection)
+
+def read_aggregate(connection, cursor, table, equipo_local_id, equipo_visitante_id, fecha_corte):
+    """
+    Promedios de un enfrentamiento desde la tabla de agregados.
+    Devuelve (cubre, resultado); con cubre=False hay que consultar la tabla original.
+    """
+    if not aggregates_ready:
+        return False, None
+    try:
+        cubre, result = aggregate_average(cursor, table, equipo_local_id, equipo_visitante_id, fecha_corte)
+    except psycopg2.Error as e:
+        connection.rollback()
+        logger.warning("Error leyendo agregados de %s: %s", table, e)
+        return False, None
+    if cubre and result:
+        logger.debug("Encontrados %s partidos (agregados de %s)", result['num_partidos'], table)
+    elif cubre:
+        logger.debug("No se encontraron partidos históricos para este enfrentamiento (%s)", table)
+    return cubre, result
+
 def get_historical_data(fecha_corte=None):
     """
     Obtener todos los datos históricos hasta la fecha de corte
@@ -92,7 +475,7 @@ def get_historical_data(fecha_corte=None):
         return None
     
     try:
-        with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+        with connection.cursor(cursor_factory=TimedDictCursor) as cursor:
             sql = """
             SELECT * FROM ganador_resultado_tabla 
             WHERE fecha < %s 
@@ -106,21 +489,36 @@ def get_historical_data(fecha_corte=None):
             return []
             
     except Exception as e:
-        print(f"Error en consulta de base de datos: {e}")
+        logger.error("Error en consulta de base de datos: %s", e)
         return None
     finally:
-        connection.close()
+        release_db_connection(connection)
 
+@last_known_good('ganador_resultado_tabla')
 def get_average_result_data(equipo_local_id, equipo_visitante_id, fecha_corte=None):
     """
     Obtener el promedio de todos los registros de un enfrentamiento específico en ganador_resultado_tabla
     """
+    # Responder desde memoria si el almacén de características está cargado
+    if feature_store.ready:
+        try:
+            with metrics.stage('feature_lookup'):
+                return feature_store.average_result(equipo_local_id, equipo_visitante_id, fecha_corte)
+        except ValueError as e:
+            logger.warning("Fecha de corte no interpretable (%s), consultando la base de datos", e)
+    
     connection = get_db_connection()
     if not connection:
         return None
     
     try:
-        with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+        with connection.cursor(cursor_factory=TimedDictCursor) as cursor:
+            # Lectura por clave primaria en la tabla de agregados (directo o inverso)
+            cubre, result = read_aggregate(connection, cursor, 'ganador_resultado_tabla',
+                                           equipo_local_id, equipo_visitante_id, fecha_corte)
+            if cubre:
+                return result
+            
             # Construir la consulta con filtro de fecha si se proporciona
             fecha_filter = ""
             params = [equipo_local_id, equipo_visitante_id]
@@ -173,7 +571,7 @@ def get_average_result_data(equipo_local_id, equipo_visitante_id, fecha_corte=No
             result = cursor.fetchone()
             
             if result and result['num_partidos'] > 0:
-                print(f"Encontrados {result['num_partidos']} partidos directos (resultados)")
+                logger.debug("Encontrados %s partidos directos (resultados)", result['num_partidos'])
                 return dict(result)
             
             # Si no existe, buscar enfrentamiento inverso y calcular promedios
@@ -224,17 +622,19 @@ def get_average_result_data(equipo_local_id, equipo_visitante_id, fecha_corte=No
             result = cursor.fetchone()
             
             if result and result['num_partidos'] > 0:
-                print(f"Encontrados {result['num_partidos']} partidos inversos (resultados)")
+                logger.debug("Encontrados %s partidos inversos (resultados)", result['num_partidos'])
                 return dict(result)
             
-            print("No se encontraron partidos históricos para este enfrentamiento (resultados)")
+            logger.debug("No se encontraron partidos históricos para este enfrentamiento (resultados)")
             return None
             
+    except DeadlineExceeded:
+        raise
     except Exception as e:
-        print(f"Error en consulta de resultados: {e}")
+        logger.error("Error en consulta de resultados: %s", e)
         return None
     finally:
-        connection.close()
+        release_db_connection(connection)
 
 def get_team_stats(df_corte, equipo_id, is_local=True):
     """
@@ -278,18 +678,20 @@ def get_team_stats(df_corte, equipo_id, is_local=True):
     
     return stats
 
-def prepare_features(equipo_local_id, equipo_visitante_id, fecha_corte=None):
+@metrics.stage('prepare_features')
+def prepare_features(equipo_local_id, equipo_visitante_id, fecha_corte=None, match_data=None, models=None):
     """
     Preparar características para el modelo de predicción de resultados usando promedios
     """
-    # Obtener datos promedio del enfrentamiento específico
-    match_data = get_average_result_data(equipo_local_id, equipo_visitante_id, fecha_corte)
+    # Obtener datos promedio del enfrentamiento específico (si no se recibieron ya consultados)
+    if match_data is None:
+        match_data = get_average_result_data(equipo_local_id, equipo_visitante_id, fecha_corte)
     
     if not match_data:
         return None, None
     
     # Obtener las características esperadas del modelo
-    expected_features = model_resultados['feature_columns'].tolist()
+    expected_features = (models or model_manager.current).resultados['feature_columns'].tolist()
     
     # Crear características para el modelo usando los promedios reales
     features = {}
@@ -308,19 +710,62 @@ def prepare_features(equipo_local_id, equipo_visitante_id, fecha_corte=None):
     
     features_array = np.array([[features[col] for col in expected_features]])
     
-    print(f"Características extraídas: {len(expected_features)} features")
-    print(f"Features disponibles: {expected_features}")
+    logger.debug("Características de resultados extraídas: %d features", len(expected_features))
     
     return features_array, expected_features
+
+@metrics.stage('predict')
+def score_results(features, models=None):
+    """
+    Goles predichos (local, visitante) para una matriz de características (una fila por partido)
+    """
+    models = models or model_manager.current
+    predictor_gl = compiled_predictor(models, 'model_gl', features)
+    predictor_gv = compiled_predictor(models, 'model_gv', features)
+    if predictor_gl is not None and predictor_gv is not None:
+        return predictor_gl.predict_rows(features), predictor_gv.predict_rows(features)
+    return models.predict('model_gl', features), models.predict('model_gv', features)
+
+def build_goals_prediction(goles_local_raw, goles_visitante_raw, feature_columns, models, model_version):
+    """
+    Redondear los goles predichos y determinar el resultado 1X2
+    """
+    # Redondear para obtener marcador entero
+    goles_local_rounded = round(goles_local_raw)
+    goles_visitante_rounded = round(goles_visitante_raw)
     
-    return features_array, expected_features
+    # Determinar resultado 1X2
+    if goles_local_rounded > goles_visitante_rounded:
+        resultado_1x2 = 1  # Victoria local
+    elif goles_local_rounded < goles_visitante_rounded:
+        resultado_1x2 = 2  # Victoria visitante
+    else:
+        resultado_1x2 = 0  # Empate
+    
+    return {
+        'goles_local': {
+            'raw': goles_local_raw,
+            'rounded': goles_local_rounded
+        },
+        'goles_visitante': {
+            'raw': goles_visitante_raw,
+            'rounded': goles_visitante_rounded
+        },
+        'resultado_1x2': resultado_1x2,
+        'model_type': models.info['types']['resultados'],
+        'model_version': model_version,
+        'features_used': feature_columns
+    }
 
-def predict_match_result(equipo_local_id, equipo_visitante_id, fecha_corte=None):
+def predict_match_result(equipo_local_id, equipo_visitante_id, fecha_corte=None, match_data=None, admit=None):
     """
-    Predecir resultado de un partido
+    Predecir resultado de un partido. `admit` es el control de admisión del
+    endpoint (admission[...].admit); puede lanzar Overloaded
     """
-    # Verificar que el modelo esté cargado
-    if model_resultados is None:
+    wait_for_models()
+    # Verificar que el modelo esté cargado (y usar la misma versión hasta el final)
+    models = model_manager.current
+    if models is None:
         return {
             'error': 'El modelo de predicción de resultados no está disponible. Verifica que el archivo modelo_ligapro.pkl existe y es válido.',
             'goles_local': None,
@@ -337,8 +782,47 @@ def predict_match_result(equipo_local_id, equipo_visitante_id, fecha_corte=None)
             'resultado_1x2': None
         }
     
+    cached = lookup_prediction('resultado', equipo_local_id, equipo_visitante_id, fecha_corte, models)
+    if cached is not None:
+        return cached
+    
+    cache_key = prediction_cache_key('resultado', equipo_local_id, equipo_visitante_id, fecha_corte, models)
+    
+    # Peticiones iguales simultáneas esperan el cálculo de la primera
+    return dict(inflight['resultado'].do(cache_key, run_admitted, admit, compute_match_result, equipo_local_id,
+                                         equipo_visitante_id, fecha_corte, match_data, models, cache_key))
+
+def lookup_prediction(campo, equipo_local_id, equipo_visitante_id, fecha_corte, models):
+    """
+    Predicción de campo ya calculada, con el formato de predict_*: primero la
+    matriz de enfrentamientos y luego la caché. None si hay que calcularla
+    (asgi_app.py la usa para no consultar los datos del cruce en ese caso)
+    """
+    cached = lookup_matchup_matrix(equipo_local_id, equipo_visitante_id, fecha_corte, campo)
+    if cached is not None:
+        if campo == 'corners':
+            return build_corners_prediction(cached['corners_totales'], cached['features_used'], models,
+                                            cached['model_version'])
+        if campo == 'tarjetas':
+            return build_tarjetas_prediction(cached['tarjetas_totales'], cached['features_used'], models,
+                                             cached['model_version'])
+        return dict(cached)
+    cached = prediction_cache.get(prediction_cache_key(campo, equipo_local_id, equipo_visitante_id,
+                                                       fecha_corte, models))
+    return dict(cached) if cached is not None else None
+
+def compute_match_result(equipo_local_id, equipo_visitante_id, fecha_corte, match_data, models, cache_key):
+    """
+    Calcular la predicción de resultado (sin caché) y guardarla en la caché
+    """
+    # Obtener datos promedio del enfrentamiento (si no se recibieron ya consultados)
+    if match_data is None:
+        match_data = get_average_result_data(equipo_local_id, equipo_visitante_id, fecha_corte)
+    degraded = isinstance(match_data, Degraded)
+    
     # Preparar características
-    features, feature_columns = prepare_features(equipo_local_id, equipo_visitante_id, fecha_corte)
+    features, feature_columns = prepare_features(equipo_local_id, equipo_visitante_id, fecha_corte,
+                                                 match_data or {}, models)
     
     if features is None:
         return {
@@ -349,57 +833,22 @@ def predict_match_result(equipo_local_id, equipo_visitante_id, fecha_corte=None)
         }
     
     try:
-        # Hacer predicción usando los modelos separados
-        model_gl = model_resultados['model_gl']
-        model_gv = model_resultados['model_gv']
-        
-        print("=" * 60)
-        print("REALIZANDO PREDICCIÓN DE RESULTADO")
-        print("=" * 60)
-        print(f"Modelo Local (goles): {type(model_gl).__name__}")
-        print(f"Modelo Visitante (goles): {type(model_gv).__name__}")
-        print(f"Características enviadas: {features.shape[1]} features")
-        print(f"Features: {feature_columns}")
-        print("-" * 60)
-        
-        # Predecir goles local y visitante por separado
-        print("Prediciendo goles local...")
-        goles_local_raw = float(model_gl.predict(features)[0])
-        print(f"Goles local (raw): {goles_local_raw:.4f}")
-        
-        print("Prediciendo goles visitante...")
-        goles_visitante_raw = float(model_gv.predict(features)[0])
-        print(f"Goles visitante (raw): {goles_visitante_raw:.4f}")
-        
-        print("-" * 60)
-        print(f"Predicción final: {round(goles_local_raw)} - {round(goles_visitante_raw)}")
-        print("=" * 60)
-        
-        # Redondear para obtener marcador entero
-        goles_local_rounded = round(goles_local_raw)
-        goles_visitante_rounded = round(goles_visitante_raw)
-        
-        # Determinar resultado 1X2
-        if goles_local_rounded > goles_visitante_rounded:
-            resultado_1x2 = 1  # Victoria local
-        elif goles_local_rounded < goles_visitante_rounded:
-            resultado_1x2 = 2  # Victoria visitante
-        else:
-            resultado_1x2 = 0  # Empate
-        
-        return {
-            'goles_local': {
-                'raw': goles_local_raw,
-                'rounded': goles_local_rounded
-            },
-            'goles_visitante': {
-                'raw': goles_visitante_raw,
-                'rounded': goles_visitante_rounded
-            },
-            'resultado_1x2': resultado_1x2,
-            'features_used': feature_columns
-        }
-        
+        # Predecir goles local y visitante con los modelos separados (con datos de
+        # respaldo el plazo ya se agotó y el modelo corre sin plazo)
+        with deadline.suspended(degraded):
+            goles_local, goles_visitante = infer('resultado', features, models)
+        goles_local_raw = float(goles_local[0])
+        goles_visitante_raw = float(goles_visitante[0])
+        logger.debug("Predicción de resultado %s vs %s: goles %.4f - %.4f (%d features)",
+                     equipo_local_id, equipo_visitante_id, goles_local_raw, goles_visitante_raw,
+                     features.shape[1])
+        
+        result = build_goals_prediction(goles_local_raw, goles_visitante_raw, feature_columns,
+                                        models, models.versions['resultado'])
+        return finish_prediction(result, cache_key, degraded)
+        
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         return {
             'error': f'Error en predicción: {str(e)}',
@@ -408,18 +857,36 @@ def predict_match_result(equipo_local_id, equipo_visitante_id, fecha_corte=None)
             'resultado_1x2': None
         }
 
-def get_average_match_data(equipo_local_id, equipo_visitante_id):
+@last_known_good('corners_tabla')
+def get_average_match_data(equipo_local_id, equipo_visitante_id, fecha_corte=None):
     """
     Obtener el promedio de todos los registros de un enfrentamiento específico
     """
+    if feature_store.ready:
+        try:
+            with metrics.stage('feature_lookup'):
+                return feature_store.average_corners(equipo_local_id, equipo_visitante_id, fecha_corte)
+        except ValueError as e:
+            logger.warning("Fecha de corte no interpretable (%s), consultando la base de datos", e)
+    
     connection = get_db_connection()
     if not connection:
         return None
     
     try:
-        with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+        with connection.cursor(cursor_factory=TimedDictCursor) as cursor:
+            # Lectura por clave primaria en la tabla de agregados (directo o inverso)
+            cubre, result = read_aggregate(connection, cursor, 'corners_tabla',
+                                           equipo_local_id, equipo_visitante_id, fecha_corte)
+            if cubre:
+                return result
+            
+            # Filtro de fecha de corte si se proporciona
+            fecha_filter = "AND fecha < %s" if fecha_corte else ""
+            fecha_params = [fecha_corte] if fecha_corte else []
+            
             # Buscar enfrentamiento directo y calcular promedios
-            sql = """
+            sql = f"""
             SELECT 
                 AVG(consistencia_corners_local) as consistencia_corners_local,
                 AVG(corners_por_ataque_peligroso) as corners_por_ataque_peligroso,
@@ -439,17 +906,17 @@ def get_average_match_data(equipo_local_id, equipo_visitante_id):
                 AVG(last3_vs_media_liga) as last3_vs_media_liga,
                 COUNT(*) as num_partidos
             FROM corners_tabla 
-            WHERE equipo_local_id = %s AND equipo_visitante_id = %s
+            WHERE equipo_local_id = %s AND equipo_visitante_id = %s {fecha_filter}
             """
-            cursor.execute(sql, (equipo_local_id, equipo_visitante_id))
+            cursor.execute(sql, [equipo_local_id, equipo_visitante_id] + fecha_params)
             result = cursor.fetchone()
             
             if result and result['num_partidos'] > 0:
-                print(f"📊 Encontrados {result['num_partidos']} partidos directos")
+                logger.debug("Encontrados %s partidos directos (corners)", result['num_partidos'])
                 return dict(result)
             
             # Si no existe, buscar enfrentamiento inverso y calcular promedios
-            sql = """
+            sql = f"""
             SELECT 
                 AVG(consistencia_corners_local) as consistencia_corners_local,
                 AVG(corners_por_ataque_peligroso) as corners_por_ataque_peligroso,
@@ -469,36 +936,56 @@ def get_average_match_data(equipo_local_id, equipo_visitante_id):
                 AVG(last3_vs_media_liga) as last3_vs_media_liga,
                 COUNT(*) as num_partidos
             FROM corners_tabla 
-            WHERE equipo_local_id = %s AND equipo_visitante_id = %s
+            WHERE equipo_local_id = %s AND equipo_visitante_id = %s {fecha_filter}
             """
-            cursor.execute(sql, (equipo_visitante_id, equipo_local_id))
+            cursor.execute(sql, [equipo_visitante_id, equipo_local_id] + fecha_params)
             result = cursor.fetchone()
             
             if result and result['num_partidos'] > 0:
-                print(f"Encontrados {result['num_partidos']} partidos inversos")
+                logger.debug("Encontrados %s partidos inversos (corners)", result['num_partidos'])
                 return dict(result)
             
-            print("No se encontraron partidos históricos para este enfrentamiento")
+            logger.debug("No se encontraron partidos históricos para este enfrentamiento (corners)")
             return None
             
+    except DeadlineExceeded:
+        raise
     except Exception as e:
-        print(f"Error en consulta de corners: {e}")
+        logger.error("Error en consulta de corners: %s", e)
         return None
     finally:
-        connection.close()
+        release_db_connection(connection)
 
-def get_average_tarjetas_data(equipo_local_id, equipo_visitante_id):
+@last_known_good('tarjetas_tabla')
+def get_average_tarjetas_data(equipo_local_id, equipo_visitante_id, fecha_corte=None):
     """
     Obtener el promedio de todos los registros de tarjetas de un enfrentamiento específico
     """
+    if feature_store.ready:
+        try:
+            with metrics.stage('feature_lookup'):
+                return feature_store.average_tarjetas(equipo_local_id, equipo_visitante_id, fecha_corte)
+        except ValueError as e:
+            logger.warning("Fecha de corte no interpretable (%s), consultando la base de datos", e)
+    
     connection = get_db_connection()
     if not connection:
         return None
     
     try:
-        with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+        with connection.cursor(cursor_factory=TimedDictCursor) as cursor:
+            # Lectura por clave primaria en la tabla de agregados (directo o inverso)
+            cubre, result = read_aggregate(connection, cursor, 'tarjetas_tabla',
+                                           equipo_local_id, equipo_visitante_id, fecha_corte)
+            if cubre:
+                return result
+            
+            # Filtro de fecha de corte si se proporciona
+            fecha_filter = "AND fecha < %s" if fecha_corte else ""
+            fecha_params = [fecha_corte] if fecha_corte else []
+            
             # Buscar enfrentamiento directo y calcular promedios
-            sql = """
+            sql = f"""
             SELECT 
                 AVG(loc_for_prev5) as loc_for_prev5,
                 AVG(loc_against_prev5) as loc_against_prev5,
@@ -514,17 +1001,17 @@ def get_average_tarjetas_data(equipo_local_id, equipo_visitante_id):
                 AVG(diff_against_prev10) as diff_against_prev10,
                 COUNT(*) as num_partidos
             FROM tarjetas_tabla 
-            WHERE equipo_local_id = %s AND equipo_visitante_id = %s
+            WHERE equipo_local_id = %s AND equipo_visitante_id = %s {fecha_filter}
             """
-            cursor.execute(sql, (equipo_local_id, equipo_visitante_id))
+            cursor.execute(sql, [equipo_local_id, equipo_visitante_id] + fecha_params)
             result = cursor.fetchone()
             
             if result and result['num_partidos'] > 0:
-                print(f"Encontrados {result['num_partidos']} partidos directos de tarjetas")
+                logger.debug("Encontrados %s partidos directos (tarjetas)", result['num_partidos'])
                 return dict(result)
             
             # Si no existe, buscar enfrentamiento inverso y calcular promedios
-            sql = """
+            sql = f"""
             SELECT 
                 AVG(loc_for_prev5) as loc_for_prev5,
                 AVG(loc_against_prev5) as loc_against_prev5,
@@ -540,24 +1027,27 @@ def get_average_tarjetas_data(equipo_local_id, equipo_visitante_id):
                 AVG(diff_against_prev10) as diff_against_prev10,
                 COUNT(*) as num_partidos
             FROM tarjetas_tabla 
-            WHERE equipo_local_id = %s AND equipo_visitante_id = %s
+            WHERE equipo_local_id = %s AND equipo_visitante_id = %s {fecha_filter}
             """
-            cursor.execute(sql, (equipo_visitante_id, equipo_local_id))
+            cursor.execute(sql, [equipo_visitante_id, equipo_local_id] + fecha_params)
             result = cursor.fetchone()
             
             if result and result['num_partidos'] > 0:
-                print(f"Encontrados {result['num_partidos']} partidos inversos de tarjetas")
+                logger.debug("Encontrados %s partidos inversos (tarjetas)", result['num_partidos'])
                 return dict(result)
             
-            print("No se encontraron partidos históricos de tarjetas para este enfrentamiento")
+            logger.debug("No se encontraron partidos históricos para este enfrentamiento (tarjetas)")
             return None
             
+    except DeadlineExceeded:
+        raise
     except Exception as e:
-        print(f"Error en consulta de tarjetas: {e}")
+        logger.error("Error en consulta de tarjetas: %s", e)
         return None
     finally:
-        connection.close()
+        release_db_connection(connection)
 
+@metrics.stage('prepare_features')
 def prepare_corners_features(match_data):
     """
     Preparar características para el modelo de corners
@@ -598,11 +1088,11 @@ def prepare_corners_features(match_data):
     feature_columns = sorted(features.keys())
     features_array = np.array([[features[col] for col in feature_columns]])
     
-    print(f"Características extraídas: {len(feature_columns)} features")
-    print(f"Features disponibles: {feature_columns}")
+    logger.debug("Características de corners extraídas: %d features", len(feature_columns))
     
     return features_array, feature_columns
 
+@metrics.stage('prepare_features')
 def prepare_tarjetas_features(match_data, equipo_local_id, equipo_visitante_id):
     """
     Preparar características para el modelo de tarjetas
@@ -643,17 +1133,119 @@ def prepare_tarjetas_features(match_data, equipo_local_id, equipo_visitante_id):
     feature_columns = sorted(features.keys())
     features_array = np.array([[features[col] for col in feature_columns]])
     
-    print(f"Características de tarjetas extraídas: {len(feature_columns)} features")
-    print(f"Features disponibles: {feature_columns}")
+    logger.debug("Características de tarjetas extraídas: %d features", len(feature_columns))
     
     return features_array, feature_columns
 
-def predict_corners(equipo_local_id, equipo_visitante_id):
+@metrics.stage('predict')
+def score_corners(features, equipo_local_ids, equipo_visitante_ids, models=None):
+    """
+    Corners totales predichos para una matriz de características (una fila por partido)
+    """
+    models = models or model_manager.current
+    # Escalar características
+    features_scaled = models.escalador.transform(features)
+    
+    # Agregar IDs de equipos (no escalados) como últimas columnas
+    equipo_local_array = np.asarray(equipo_local_ids, dtype=float).reshape(-1, 1)
+    equipo_visitante_array = np.asarray(equipo_visitante_ids, dtype=float).reshape(-1, 1)
+    features_final = np.hstack([features_scaled, equipo_local_array, equipo_visitante_array])
+    
+    predictor = compiled_predictor(models, 'corners', features_final)
+    if predictor is not None:
+        return predictor.predict_rows(features_final)
+    return models.predict('corners', features_final)
+
+@metrics.stage('predict')
+def score_tarjetas(features, models=None):
+    """
+    Tarjetas totales predichas para una matriz de características (una fila por partido)
+    """
+    models = models or model_manager.current
+    predictor = compiled_predictor(models, 'tarjetas', features)
+    if predictor is not None:
+        return predictor.predict_rows(features)
+    return models.predict('tarjetas', features)
+
+# Micro-lotes (micro_batch.py): las predicciones de peticiones concurrentes que
+# van al predict de la librería se juntan en un solo predict por modelo. El
+# hilo de cada modelo llama a las funciones sin la etapa 'predict', que ya
+# mide la petición que espera
+INFERENCE_BATCH_WINDOW = float(os.getenv('INFERENCE_BATCH_WINDOW_MS', 1)) / 1000
+INFERENCE_MAX_BATCH = int(os.getenv('INFERENCE_MAX_BATCH', 64))
+inference_batchers = {
+    'resultado': MicroBatcher(
+        'resultado', lambda features, row_args, models: score_results.__wrapped__(features, models),
+        INFERENCE_BATCH_WINDOW, INFERENCE_MAX_BATCH),
+    'corners': MicroBatcher(
+        'corners', lambda features, row_args, models: score_corners.__wrapped__(features, *row_args, models),
+        INFERENCE_BATCH_WINDOW, INFERENCE_MAX_BATCH),
+    'tarjetas': MicroBatcher(
+        'tarjetas', lambda features, row_args, models: score_tarjetas.__wrapped__(features, models),
+        INFERENCE_BATCH_WINDOW, INFERENCE_MAX_BATCH),
+}
+INFERENCE_SCORERS = {'resultado': score_results, 'corners': score_corners, 'tarjetas': score_tarjetas}
+# Filas de infer() por camino: 'compilado' (árboles compilados en el hilo de
+# la petición), 'micro_lote' o 'directo' (predict de la librería en el hilo
+# de la petición, con INFERENCE_MAX_BATCH=0)
+INFERENCE_ROWS = metrics.Counter(
+    'upsbet_inference_rows_total', 'Filas predichas por campo y camino de inferencia', ('campo', 'camino'))
+# Predictores compilados que usa cada campo
+INFERENCE_PREDICTORS = {'resultado': ('model_gl', 'model_gv'), 'corners': ('corners',), 'tarjetas': ('tarjetas',)}
+
+def infer(campo, features, models, *row_args):
+    """
+    Predicción de campo ('resultado', 'corners' o 'tarjetas') para las filas
+    de una petición. Si hay predictores compilados para esas filas se predice
+    en el hilo de la petición (cuesta unos microsegundos, menos que pasar la
+    fila a otro hilo); si no, va al próximo micro-lote del modelo. Con la
+    configuración por defecto las peticiones de una fila usan siempre los
+    árboles compilados: los micro-lotes son el camino de respaldo (modelos
+    que no se pudieron compilar o TREE_PREDICTOR_MAX_ROWS=0). Con
+    INFERENCE_MAX_BATCH=0 nunca se usan los micro-lotes. La espera del
+    micro-lote se acota al plazo de la petición
+    """
+    deadline.check('predict')
+    compiled = (len(features) <= TREE_PREDICTOR_MAX_ROWS
+                and all(name in models.predictors for name in INFERENCE_PREDICTORS[campo]))
+    if compiled or INFERENCE_MAX_BATCH <= 0:
+        INFERENCE_ROWS.inc(campo, 'compilado' if compiled else 'directo', amount=len(features))
+        return INFERENCE_SCORERS[campo](features, *row_args, models)
+    INFERENCE_ROWS.inc(campo, 'micro_lote', amount=len(features))
+    with metrics.stage('predict'):
+        try:
+            return inference_batchers[campo].submit(features, models, *row_args,
+                                                    timeout=deadline.bound(None, 'predict'))
+        except FutureTimeout:
+            raise deadline.expired('predict') from None
+
+def build_corners_prediction(corners_totales, feature_columns, models, model_version):
+    return {
+        'corners_totales': corners_totales,
+        'model_type': models.info['types']['corners'],
+        'model_version': model_version,
+        'scaler_type': models.info['types']['escalador'],
+        'prediction_note': 'Predicción de corners generada usando modelo de Machine Learning real',
+        'features_used': feature_columns
+    }
+
+def build_tarjetas_prediction(tarjetas_totales, feature_columns, models, model_version):
+    return {
+        'tarjetas_totales': tarjetas_totales,
+        'model_type': models.info['types']['tarjetas'],
+        'model_version': model_version,
+        'prediction_note': 'Predicción de tarjetas generada usando modelo de Machine Learning real',
+        'features_used': feature_columns
+    }
+
+def predict_corners(equipo_local_id, equipo_visitante_id, fecha_corte=None, match_data=None, admit=None):
     """
-    Predecir corners totales del partido
+    Predecir corners totales del partido (`admit` como en predict_match_result)
     """
-    # Verificar que los modelos estén cargados
-    if model_corners is None or scaler_corners is None:
+    wait_for_models()
+    # Verificar que los modelos estén cargados (y usar la misma versión hasta el final)
+    models = model_manager.current
+    if models is None:
         return {
             'error': 'Los modelos de corners no están disponibles. Verifica que los archivos prediccion_corners_totales.pkl y escalador_corners.pkl existen y son válidos.',
             'corners_totales': None
@@ -666,8 +1258,24 @@ def predict_corners(equipo_local_id, equipo_visitante_id):
             'corners_totales': None
         }
     
+    cached = lookup_prediction('corners', equipo_local_id, equipo_visitante_id, fecha_corte, models)
+    if cached is not None:
+        return cached
+    
+    cache_key = prediction_cache_key('corners', equipo_local_id, equipo_visitante_id, fecha_corte, models)
+    
+    # Peticiones iguales simultáneas esperan el cálculo de la primera
+    return dict(inflight['corners'].do(cache_key, run_admitted, admit, compute_corners, equipo_local_id,
+                                       equipo_visitante_id, fecha_corte, match_data, models, cache_key))
+
+def compute_corners(equipo_local_id, equipo_visitante_id, fecha_corte, match_data, models, cache_key):
+    """
+    Calcular la predicción de corners (sin caché) y guardarla en la caché
+    """
     # Obtener datos promedio del enfrentamiento
-    match_data = get_average_match_data(equipo_local_id, equipo_visitante_id)
+    if match_data is None:
+        match_data = get_average_match_data(equipo_local_id, equipo_visitante_id, fecha_corte)
+    degraded = isinstance(match_data, Degraded)
     
     if not match_data:
         return {
@@ -685,59 +1293,32 @@ def predict_corners(equipo_local_id, equipo_visitante_id):
         }
     
     try:
-        print("=" * 60)
-        print("REALIZANDO PREDICCIÓN DE CORNERS")
-        print("=" * 60)
-        print(f"Modelo de corners: {type(model_corners).__name__}")
-        print(f"Escalador: {type(scaler_corners).__name__}")
-        print(f"Características enviadas: {features.shape[1]} features")
-        print(f"Features: {feature_columns}")
-        print("-" * 60)
-        
-        # Escalar características
-        print("Escalando características...")
-        features_scaled = scaler_corners.transform(features)
-        print(f"Características escaladas: {features_scaled.shape}")
-        
-        # Agregar IDs de equipos (no escalados)
-        equipo_local_array = np.array([[equipo_local_id]])
-        equipo_visitante_array = np.array([[equipo_visitante_id]])
-        
-        # Combinar características escaladas con IDs
-        features_final = np.hstack([features_scaled, equipo_local_array, equipo_visitante_array])
-        print(f"Características finales: {features_final.shape}")
-        
-        # Hacer predicción
-        print("Prediciendo corners totales...")
-        prediction = model_corners.predict(features_final)
+        # Escalar características, agregar IDs de equipos (no escalados) y predecir
+        with deadline.suspended(degraded):
+            prediction = infer('corners', features, models, [equipo_local_id], [equipo_visitante_id])
         corners_totales = float(prediction[0])
-        print(f"Corners totales predichos: {corners_totales:.2f}")
-        
-        print("-" * 60)
-        print(f"Predicción final: {corners_totales:.1f} corners totales")
-        print("=" * 60)
+        logger.debug("Predicción de corners %s vs %s: %.2f (%d features)",
+                     equipo_local_id, equipo_visitante_id, corners_totales, features.shape[1])
         
-        return {
-            'corners_totales': corners_totales,
-            'model_type': type(model_corners).__name__,
-            'model_version': 'corners_v1',
-            'scaler_type': type(scaler_corners).__name__,
-            'prediction_note': 'Predicción de corners generada usando modelo de Machine Learning real',
-            'features_used': feature_columns
-        }
+        result = build_corners_prediction(corners_totales, feature_columns, models, models.versions['corners'])
+        return finish_prediction(result, cache_key, degraded)
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         return {
             'error': f'Error en predicción de corners: {str(e)}',
             'corners_totales': None
         }
 
-def predict_tarjetas(equipo_local_id, equipo_visitante_id):
+def predict_tarjetas(equipo_local_id, equipo_visitante_id, fecha_corte=None, match_data=None, admit=None):
     """
-    Predecir tarjetas totales del partido
+    Predecir tarjetas totales del partido (`admit` como en predict_match_result)
     """
-    # Verificar que el modelo esté cargado
-    if model_tarjetas is None:
+    wait_for_models()
+    # Verificar que el modelo esté cargado (y usar la misma versión hasta el final)
+    models = model_manager.current
+    if models is None:
         return {
             'error': 'El modelo de tarjetas no está disponible. Verifica que el archivo modelo_lightgbm_final.pkl existe y es válido.',
             'tarjetas_totales': None
@@ -750,8 +1331,24 @@ def predict_tarjetas(equipo_local_id, equipo_visitante_id):
             'tarjetas_totales': None
         }
     
+    cached = lookup_prediction('tarjetas', equipo_local_id, equipo_visitante_id, fecha_corte, models)
+    if cached is not None:
+        return cached
+    
+    cache_key = prediction_cache_key('tarjetas', equipo_local_id, equipo_visitante_id, fecha_corte, models)
+    
+    # Peticiones iguales simultáneas esperan el cálculo de la primera
+    return dict(inflight['tarjetas'].do(cache_key, run_admitted, admit, compute_tarjetas, equipo_local_id,
+                                        equipo_visitante_id, fecha_corte, match_data, models, cache_key))
+
+def compute_tarjetas(equipo_local_id, equipo_visitante_id, fecha_corte, match_data, models, cache_key):
+    """
+    Calcular la predicción de tarjetas (sin caché) y guardarla en la caché
+    """
     # Obtener datos promedio del enfrentamiento
-    match_data = get_average_tarjetas_data(equipo_local_id, equipo_visitante_id)
+    if match_data is None:
+        match_data = get_average_tarjetas_data(equipo_local_id, equipo_visitante_id, fecha_corte)
+    degraded = isinstance(match_data, Degraded)
     
     if not match_data:
         return {
@@ -769,38 +1366,144 @@ def predict_tarjetas(equipo_local_id, equipo_visitante_id):
         }
     
     try:
-        print("=" * 60)
-        print("REALIZANDO PREDICCIÓN DE TARJETAS")
-        print("=" * 60)
-        print(f"Modelo de tarjetas: {type(model_tarjetas).__name__}")
-        print(f"Características enviadas: {features.shape[1]} features")
-        print(f"Features: {feature_columns}")
-        print("-" * 60)
-        
         # Hacer predicción (sin escalador para tarjetas)
-        print("Prediciendo tarjetas totales...")
-        prediction = model_tarjetas.predict(features)
+        with deadline.suspended(degraded):
+            prediction = infer('tarjetas', features, models)
         tarjetas_totales = float(prediction[0])
-        print(f"Tarjetas totales predichas: {tarjetas_totales:.2f}")
+        logger.debug("Predicción de tarjetas %s vs %s: %.2f (%d features)",
+                     equipo_local_id, equipo_visitante_id, tarjetas_totales, features.shape[1])
         
-        print("-" * 60)
-        print(f"Predicción final: {tarjetas_totales:.1f} tarjetas totales")
-        print("=" * 60)
-        
-        return {
-            'tarjetas_totales': tarjetas_totales,
-            'model_type': type(model_tarjetas).__name__,
-            'model_version': 'tarjetas_v1',
-            'prediction_note': 'Predicción de tarjetas generada usando modelo de Machine Learning real',
-            'features_used': feature_columns
-        }
+        result = build_tarjetas_prediction(tarjetas_totales, feature_columns, models, models.versions['tarjetas'])
+        return finish_prediction(result, cache_key, degraded)
         
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         return {
             'error': f'Error en predicción de tarjetas: {str(e)}',
             'tarjetas_totales': None
         }
 
+FECHA_RE = re.compile(r'\d{4}-\d{2}-\d{2}', re.ASCII)
+
+class InvalidFecha(ValueError):
+    """Fecha de una petición que no tiene el formato YYYY-MM-DD"""
+
+def get_fecha_corte(fecha_request=None):
+    """
+    Determinar la fecha de corte: la mínima entre la fecha del request y hoy.
+    Lanza InvalidFecha (respuesta 400) si la fecha del request no es
+    exactamente YYYY-MM-DD
+    """
+    hoy = date.today()
+    if not fecha_request:
+        return hoy.isoformat()
+    try:
+        # fromisoformat también admite 20230601 o fechas con hora: se exige la forma exacta
+        if not FECHA_RE.fullmatch(fecha_request):
+            raise ValueError(fecha_request)
+        fecha = date.fromisoformat(fecha_request)
+    except (TypeError, ValueError):
+        raise InvalidFecha(f'Fecha inválida: {fecha_request!r} (formato YYYY-MM-DD)') from None
+    return min(fecha, hoy).isoformat()
+
+def mark_degraded(response, *sources):
+    """
+    Marcar la respuesta como degradada si alguno de sus datos es de respaldo
+    (Degraded) o viene de una predicción degradada
+    """
+    if any(isinstance(source, Degraded) or (isinstance(source, dict) and source.get('degraded'))
+           for source in sources):
+        response['degraded'] = True
+    return response
+
+def build_result_response(result, fecha_corte):
+    """Respuesta JSON de la predicción de resultado"""
+    return mark_degraded({
+        'as_of': fecha_corte,
+        'goles_local': result['goles_local'],
+        'goles_visitante': result['goles_visitante'],
+        'resultado_1x2': result['resultado_1x2'],
+        'model_version': result['model_version'],
+        'model_type': result['model_type'],
+        'features_used': result.get('features_used', []),
+        'cut_note': f'Predicción calculada solo con datos anteriores a {fecha_corte}',
+        'prediction_note': 'Predicción generada usando modelo de Machine Learning real'
+    }, result)
+
+def build_corners_response(result, fecha_corte=None):
+    """Respuesta JSON de la predicción de corners"""
+    return mark_degraded({
+        'as_of': fecha_corte,
+        'corners_totales': result['corners_totales'],
+        'model_version': result['model_version'],
+        'model_type': result['model_type'],
+        'scaler_type': result['scaler_type'],
+        'features_used': result.get('features_used', []),
+        'prediction_note': 'Predicción generada usando modelo de Machine Learning real'
+    }, result)
+
+def build_tarjetas_response(result, fecha_corte=None):
+    """Respuesta JSON de la predicción de tarjetas"""
+    return mark_degraded({
+        'as_of': fecha_corte,
+        'tarjetas_totales': result['tarjetas_totales'],
+        'model_version': result['model_version'],
+        'model_type': result['model_type'],
+        'features_used': result.get('features_used', []),
+        'prediction_note': ' Predicción generada usando modelo de Machine Learning real'
+    }, result)
+
+def build_historical_response(result_data, corners_data, enfrentamiento_data):
+    """Respuesta JSON con los datos históricos de un enfrentamiento"""
+    return mark_degraded({
+        'resultados_historicos': {
+            'ataques_local_promedio': float(result_data.get('ataques_local', 0)) if result_data else 0,
+            'ataques_visitante_promedio': float(result_data.get('ataques_visitante', 0)) if result_data else 0,
+            'posesion_local_promedio': float(result_data.get('posesion_local', 0)) if result_data else 50,
+            'posesion_visitante_promedio': float(result_data.get('posesion_visitante', 0)) if result_data else 50,
+            'corners_local_promedio': float(result_data.get('corners_local', 0)) if result_data else 0,
+            'corners_visitante_promedio': float(result_data.get('corners_visitante', 0)) if result_data else 0,
+            'num_partidos_resultados': int(result_data.get('num_partidos', 0)) if result_data else 0
+        },
+        'corners_historicos': {
+            'corners_promedio_hist': float(corners_data.get('corners_vs_rival_hist', 0)) if corners_data else 0,
+            'num_partidos_corners': int(corners_data.get('num_partidos', 0)) if corners_data else 0
+        },
+        'enfrentamiento_historico': {
+            'total_partidos': int(enfrentamiento_data.get('total_partidos', 0)) if enfrentamiento_data else 0,
+            'posesion_local_promedio': float(enfrentamiento_data.get('posesion_local_promedio', 0)) if enfrentamiento_data else 50,
+            'posesion_visitante_promedio': float(enfrentamiento_data.get('posesion_visitante_promedio', 0)) if enfrentamiento_data else 50,
+            'corners_promedio': float(enfrentamiento_data.get('corners_promedio', 0)) if enfrentamiento_data else 0,
+            'goles_promedio': float(enfrentamiento_data.get('goles_promedio', 0)) if enfrentamiento_data else 0,
+            'tarjetas_promedio': float(enfrentamiento_data.get('tarjetas_promedio', 0)) if enfrentamiento_data else 0,
+            'victorias_local': int(enfrentamiento_data.get('victorias_local', 0)) if enfrentamiento_data else 0,
+            'victorias_visitante': int(enfrentamiento_data.get('victorias_visitante', 0)) if enfrentamiento_data else 0,
+            'empates': int(enfrentamiento_data.get('empates', 0)) if enfrentamiento_data else 0
+        }
+    }, result_data, corners_data, enfrentamiento_data)
+
+def unavailable_response(error, campo=None, equipo_local_id=None, equipo_visitante_id=None, fecha_corte=None,
+                         build_response=None, empty_fields=None):
+    """
+    Respuesta a una petición rechazada por el control de admisión (Overloaded)
+    o que agotó su plazo sin datos de respaldo (DeadlineExceeded): la última
+    predicción guardada del cruce si existe (marcada con stale), o el error
+    con la cabecera Retry-After
+    """
+    g.log_fields = dict(g.get('log_fields', {}), shed=error.reason)
+    if campo is not None:
+        cache_key = prediction_cache_key(campo, equipo_local_id, equipo_visitante_id, fecha_corte, None)
+        stale = prediction_cache.get_stale(stale_cache_key(cache_key))
+        if stale is not None:
+            response = jsonify(dict(build_response(dict(stale), fecha_corte), stale=True))
+            response.headers['Warning'] = '110 - "Response is Stale"'
+            return response, 200
+    mensaje = 'Plazo de la petición agotado' if isinstance(error, DeadlineExceeded) else 'Servidor saturado'
+    response = jsonify(dict({'error': f'{mensaje}, reintenta en {error.retry_after} s'}, **(empty_fields or {})))
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, error.status
+
 @app.route('/api/predict', methods=['POST'])
 def predict():
     """
@@ -809,39 +1512,31 @@ def predict():
     Devuelve: predicción de resultado del partido
     """
     try:
-        print("\n" + "=" * 80)
-        print("PETICIÓN RECIBIDA: /api/predict")
-        print("=" * 80)
-        
         data = request.get_json()
         
         if not data:
-            print("Error: No se recibieron datos")
             return jsonify({'error': 'No se recibieron datos'}), 400
         
         equipo_local_id = data.get('equipo_local_id')
         equipo_visitante_id = data.get('equipo_visitante_id')
         fecha_request = data.get('fecha')  # Opcional
         
-        print(f"Equipo Local ID: {equipo_local_id}")
-        print(f"quipo Visitante ID: {equipo_visitante_id}")
-        print(f"Fecha Request: {fecha_request}")
+        g.log_fields = {'equipo_local_id': equipo_local_id, 'equipo_visitante_id': equipo_visitante_id}
         
         if equipo_local_id is None or equipo_visitante_id is None:
-            print("Error: Faltan IDs de equipos")
             return jsonify({'error': 'Faltan IDs de equipos'}), 400
         
-        # Determinar fecha de corte
-        if fecha_request:
-            # Si se proporciona fecha, usar la mínima entre la fecha del request y hoy
-            fecha_hoy = datetime.now().strftime('%Y-%m-%d')
-            fecha_corte = min(fecha_request, fecha_hoy)
-        else:
-            # Si no se proporciona fecha, usar hoy
-            fecha_corte = datetime.now().strftime('%Y-%m-%d')
+        # Determinar fecha de corte (hoy si no se proporciona)
+        fecha_corte = get_fecha_corte(fecha_request)
         
         # Hacer predicción de resultado
-        result = predict_match_result(equipo_local_id, equipo_visitante_id, fecha_corte)
+        try:
+            result = predict_match_result(equipo_local_id, equipo_visitante_id, fecha_corte,
+                                          admit=admission['predict'].admit)
+        except (Overloaded, DeadlineExceeded) as e:
+            return unavailable_response(e, 'resultado', equipo_local_id, equipo_visitante_id, fecha_corte,
+                                        build_result_response,
+                                        {'goles_local': None, 'goles_visitante': None, 'resultado_1x2': None})
         
         if 'error' in result:
             return jsonify({
@@ -851,54 +1546,46 @@ def predict():
                 'resultado_1x2': None
             }), 400
         
-        # Preparar respuesta
-        response = {
-            'as_of': fecha_corte,
-            'goles_local': result['goles_local'],
-            'goles_visitante': result['goles_visitante'],
-            'resultado_1x2': result['resultado_1x2'],
-            'model_version': 'ligapro_v1',
-            'model_type': type(model_resultados).__name__,
-            'features_used': result.get('features_used', []),
-            'cut_note': f'Predicción calculada solo con datos anteriores a {fecha_corte}',
-            'prediction_note': 'Predicción generada usando modelo de Machine Learning real'
-        }
+        return jsonify(build_result_response(result, fecha_corte)), 200
         
-        return jsonify(response), 200
+    except InvalidFecha as e:
+        return jsonify({'error': str(e)}), 400
         
     except Exception as e:
+        logger.exception("Error interno en %s", request.path)
         return jsonify({'error': f'Error interno: {str(e)}'}), 500
 
 @app.route('/api/predict-corners', methods=['POST'])
 def predict_corners_endpoint():
     """
     Endpoint para predicción de corners
-    Recibe: {equipo_local_id, equipo_visitante_id}
+    Recibe: {equipo_local_id, equipo_visitante_id, fecha?}
     Devuelve: predicción de corners totales
     """
     try:
-        print("\n" + "=" * 80)
-        print("PETICIÓN RECIBIDA: /api/predict-corners")
-        print("=" * 80)
-        
         data = request.get_json()
         
         if not data:
-            print("Error: No se recibieron datos")
             return jsonify({'error': 'No se recibieron datos'}), 400
         
         equipo_local_id = data.get('equipo_local_id')
         equipo_visitante_id = data.get('equipo_visitante_id')
         
-        print(f"Equipo Local ID: {equipo_local_id}")
-        print(f"Equipo Visitante ID: {equipo_visitante_id}")
+        g.log_fields = {'equipo_local_id': equipo_local_id, 'equipo_visitante_id': equipo_visitante_id}
         
         if equipo_local_id is None or equipo_visitante_id is None:
-            print("Error: Faltan IDs de equipos")
             return jsonify({'error': 'Faltan IDs de equipos'}), 400
         
+        # Determinar fecha de corte (hoy si no se proporciona)
+        fecha_corte = get_fecha_corte(data.get('fecha'))
+        
         # Hacer predicción de corners
-        result = predict_corners(equipo_local_id, equipo_visitante_id)
+        try:
+            result = predict_corners(equipo_local_id, equipo_visitante_id, fecha_corte,
+                                     admit=admission['predict_corners'].admit)
+        except (Overloaded, DeadlineExceeded) as e:
+            return unavailable_response(e, 'corners', equipo_local_id, equipo_visitante_id, fecha_corte,
+                                        build_corners_response, {'corners_totales': None})
         
         if 'error' in result:
             return jsonify({
@@ -906,51 +1593,46 @@ def predict_corners_endpoint():
                 'corners_totales': None
             }), 400
         
-        # Preparar respuesta
-        response = {
-            'corners_totales': result['corners_totales'],
-            'model_version': 'corners_v1',
-            'model_type': type(model_corners).__name__,
-            'scaler_type': type(scaler_corners).__name__,
-            'features_used': result.get('features_used', []),
-            'prediction_note': 'Predicción generada usando modelo de Machine Learning real'
-        }
+        return jsonify(build_corners_response(result, fecha_corte)), 200
         
-        return jsonify(response), 200
+    except InvalidFecha as e:
+        return jsonify({'error': str(e)}), 400
         
     except Exception as e:
+        logger.exception("Error interno en %s", request.path)
         return jsonify({'error': f'Error interno: {str(e)}'}), 500
 
 @app.route('/api/predict-tarjetas', methods=['POST'])
 def predict_tarjetas_endpoint():
     """
     Endpoint para predicción de tarjetas
-    Recibe: {equipo_local_id, equipo_visitante_id}
+    Recibe: {equipo_local_id, equipo_visitante_id, fecha?}
     Devuelve: predicción de tarjetas totales
     """
     try:
-        print("\n" + "=" * 80)
-        print("PETICIÓN RECIBIDA: /api/predict-tarjetas")
-        print("=" * 80)
-        
         data = request.get_json()
         
         if not data:
-            print("Error: No se recibieron datos")
             return jsonify({'error': 'No se recibieron datos'}), 400
         
         equipo_local_id = data.get('equipo_local_id')
         equipo_visitante_id = data.get('equipo_visitante_id')
         
-        print(f"Equipo Local ID: {equipo_local_id}")
-        print(f"Equipo Visitante ID: {equipo_visitante_id}")
+        g.log_fields = {'equipo_local_id': equipo_local_id, 'equipo_visitante_id': equipo_visitante_id}
         
         if equipo_local_id is None or equipo_visitante_id is None:
-            print("Error: Faltan IDs de equipos")
             return jsonify({'error': 'Faltan IDs de equipos'}), 400
         
+        # Determinar fecha de corte (hoy si no se proporciona)
+        fecha_corte = get_fecha_corte(data.get('fecha'))
+        
         # Hacer predicción de tarjetas
-        result = predict_tarjetas(equipo_local_id, equipo_visitante_id)
+        try:
+            result = predict_tarjetas(equipo_local_id, equipo_visitante_id, fecha_corte,
+                                      admit=admission['predict_tarjetas'].admit)
+        except (Overloaded, DeadlineExceeded) as e:
+            return unavailable_response(e, 'tarjetas', equipo_local_id, equipo_visitante_id, fecha_corte,
+                                        build_tarjetas_response, {'tarjetas_totales': None})
         
         if 'error' in result:
             return jsonify({
@@ -958,100 +1640,131 @@ def predict_tarjetas_endpoint():
                 'tarjetas_totales': None
             }), 400
         
-        # Preparar respuesta
-        response = {
-            'tarjetas_totales': result['tarjetas_totales'],
-            'model_version': 'tarjetas_v1',
-            'model_type': type(model_tarjetas).__name__,
-            'features_used': result.get('features_used', []),
-            'prediction_note': ' Predicción generada usando modelo de Machine Learning real'
-        }
+        return jsonify(build_tarjetas_response(result, fecha_corte)), 200
         
-        return jsonify(response), 200
+    except InvalidFecha as e:
+        return jsonify({'error': str(e)}), 400
         
     except Exception as e:
+        logger.exception("Error interno en %s", request.path)
         return jsonify({'error': f'Error interno: {str(e)}'}), 500
 
+def get_historical_response(equipo_local_id, equipo_visitante_id):
+    """
+    Consultar los datos históricos de un enfrentamiento y armar la respuesta
+    """
+    # Obtener datos históricos de resultados
+    result_data = get_average_result_data(equipo_local_id, equipo_visitante_id)
+    
+    # Obtener datos históricos de corners
+    corners_data = get_average_match_data(equipo_local_id, equipo_visitante_id)
+    
+    # Obtener estadísticas del enfrentamiento
+    enfrentamiento_data = get_enfrentamiento_stats(equipo_local_id, equipo_visitante_id)
+    
+    # Preparar respuesta con datos históricos
+    return build_historical_response(result_data, corners_data, enfrentamiento_data)
+
 @app.route('/api/historical-data', methods=['POST'])
 def get_historical_data_endpoint():
     """
     Endpoint para obtener datos históricos de un enfrentamiento
     """
     try:
-        print("\n" + "=" * 80)
-        print("PETICIÓN RECIBIDA: /api/historical-data")
-        print("=" * 80)
-        
         data = request.get_json()
         
         if not data:
-            print("Error: No se recibieron datos")
             return jsonify({'error': 'No se recibieron datos'}), 400
         
         equipo_local_id = data.get('equipo_local_id')
         equipo_visitante_id = data.get('equipo_visitante_id')
         
-        print(f"Equipo Local ID: {equipo_local_id}")
-        print(f"Equipo Visitante ID: {equipo_visitante_id}")
+        g.log_fields = {'equipo_local_id': equipo_local_id, 'equipo_visitante_id': equipo_visitante_id}
         
         if equipo_local_id is None or equipo_visitante_id is None:
-            print("Error: Faltan IDs de equipos")
             return jsonify({'error': 'Faltan IDs de equipos'}), 400
         
-        # Obtener datos históricos de resultados
-        result_data = get_average_result_data(equipo_local_id, equipo_visitante_id)
-        
-        # Obtener datos históricos de corners
-        corners_data = get_average_match_data(equipo_local_id, equipo_visitante_id)
-        
-        # Obtener estadísticas del enfrentamiento
-        enfrentamiento_data = get_enfrentamiento_stats(equipo_local_id, equipo_visitante_id)
-        
-        # Preparar respuesta con datos históricos
-        response = {
-            'resultados_historicos': {
-                'ataques_local_promedio': float(result_data.get('ataques_local', 0)) if result_data else 0,
-                'ataques_visitante_promedio': float(result_data.get('ataques_visitante', 0)) if result_data else 0,
-                'posesion_local_promedio': float(result_data.get('posesion_local', 0)) if result_data else 50,
-                'posesion_visitante_promedio': float(result_data.get('posesion_visitante', 0)) if result_data else 50,
-                'corners_local_promedio': float(result_data.get('corners_local', 0)) if result_data else 0,
-                'corners_visitante_promedio': float(result_data.get('corners_visitante', 0)) if result_data else 0,
-                'num_partidos_resultados': int(result_data.get('num_partidos', 0)) if result_data else 0
-            },
-            'corners_historicos': {
-                'corners_promedio_hist': float(corners_data.get('corners_vs_rival_hist', 0)) if corners_data else 0,
-                'num_partidos_corners': int(corners_data.get('num_partidos', 0)) if corners_data else 0
-            },
-            'enfrentamiento_historico': {
-                'total_partidos': int(enfrentamiento_data.get('total_partidos', 0)) if enfrentamiento_data else 0,
-                'posesion_local_promedio': float(enfrentamiento_data.get('posesion_local_promedio', 0)) if enfrentamiento_data else 50,
-                'posesion_visitante_promedio': float(enfrentamiento_data.get('posesion_visitante_promedio', 0)) if enfrentamiento_data else 50,
-                'corners_promedio': float(enfrentamiento_data.get('corners_promedio', 0)) if enfrentamiento_data else 0,
-                'goles_promedio': float(enfrentamiento_data.get('goles_promedio', 0)) if enfrentamiento_data else 0,
-                'tarjetas_promedio': float(enfrentamiento_data.get('tarjetas_promedio', 0)) if enfrentamiento_data else 0,
-                'victorias_local': int(enfrentamiento_data.get('victorias_local', 0)) if enfrentamiento_data else 0,
-                'victorias_visitante': int(enfrentamiento_data.get('victorias_visitante', 0)) if enfrentamiento_data else 0,
-                'empates': int(enfrentamiento_data.get('empates', 0)) if enfrentamiento_data else 0
-            }
-        }
-        
-        print(f"Datos históricos obtenidos: {response['resultados_historicos']['num_partidos_resultados']} partidos resultados, {response['corners_historicos']['num_partidos_corners']} partidos corners")
+        # Peticiones iguales simultáneas comparten las consultas
+        cache_key = prediction_cache_key('historico', equipo_local_id, equipo_visitante_id, None, None)
+        try:
+            response = inflight['historico'].do(cache_key, get_historical_response, equipo_local_id, equipo_visitante_id)
+        except DeadlineExceeded as e:
+            return unavailable_response(e)
         
         return jsonify(response), 200
         
     except Exception as e:
+        logger.exception("Error interno en %s", request.path)
         return jsonify({'error': f'Error interno: {str(e)}'}), 500
 
+def summarize_enfrentamiento(partidos):
+    """
+    Estadísticas del historial a partir de las filas de resultado_historico_tabla
+    de ambos sentidos del enfrentamiento (lanza TypeError si faltan valores)
+    """
+    # Calcular estadísticas
+    total_partidos = len(partidos)
+    posesion_local_total = 0
+    posesion_visitante_total = 0
+    corners_total = 0
+    goles_total = 0
+    tarjetas_total = 0
+    victorias_local = 0
+    victorias_visitante = 0
+    empates = 0
+    
+    for partido in partidos:
+        # Posesión (convertir de decimal a porcentaje)
+        posesion_local_total += float(partido['posesion_local']) * 100
+        posesion_visitante_total += float(partido['posesion_visitante']) * 100
+        
+        # Corners totales (suma de local + visitante)
+        corners_total += float(partido['corners_local']) + float(partido['corners_visitante'])
+        
+        # Goles totales (suma de local + visitante)
+        goles_total += float(partido['goles_local']) + float(partido['goles_visitante'])
+        
+        # Tarjetas totales
+        tarjetas_total += float(partido['tarjetas_totales'])
+        
+        # Victorias
+        if partido['resultado_1x2'] == 1:
+            victorias_local += 1
+        elif partido['resultado_1x2'] == 2:
+            victorias_visitante += 1
+        else:
+            empates += 1
+    
+    # Calcular promedios
+    result = {
+        'total_partidos': total_partidos,
+        'posesion_local_promedio': posesion_local_total / total_partidos,
+        'posesion_visitante_promedio': posesion_visitante_total / total_partidos,
+        'corners_promedio': corners_total / (total_partidos * 2),  # Dividir por 2 porque sumamos local + visitante
+        'goles_promedio': goles_total / (total_partidos * 2),      # Dividir por 2 porque sumamos local + visitante
+        'tarjetas_promedio': tarjetas_total / (total_partidos * 2), # Dividir por 2 porque tarjetas_totales ya es el total
+        'victorias_local': victorias_local,
+        'victorias_visitante': victorias_visitante,
+        'empates': empates
+    }
+    
+    return result
+
+@last_known_good('resultado_historico_tabla')
 def get_enfrentamiento_stats(equipo_local_id, equipo_visitante_id):
     """
     Obtener estadísticas del enfrentamiento histórico entre dos equipos
     """
+    if feature_store.ready:
+        with metrics.stage('feature_lookup'):
+            return feature_store.enfrentamiento_stats(equipo_local_id, equipo_visitante_id)
+    
     connection = get_db_connection()
     if not connection:
         return None
     
     try:
-        with connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+        with connection.cursor(cursor_factory=TimedDictCursor) as cursor:
             # Primero obtener todos los partidos entre los dos equipos
             sql = """
             SELECT * FROM resultado_historico_tabla 
@@ -1062,96 +1775,383 @@ def get_enfrentamiento_stats(equipo_local_id, equipo_visitante_id):
             partidos = cursor.fetchall()
             
             if not partidos:
-                print("No se encontraron partidos históricos para este enfrentamiento")
+                logger.debug("No se encontraron partidos históricos para este enfrentamiento (historial)")
                 return None
             
-            print(f"Encontrados {len(partidos)} partidos totales entre ambos equipos")
+            logger.debug("Encontrados %d partidos totales entre ambos equipos", len(partidos))
             
-            # Calcular estadísticas
-            total_partidos = len(partidos)
-            posesion_local_total = 0
-            posesion_visitante_total = 0
-            corners_total = 0
-            goles_total = 0
-            tarjetas_total = 0
-            victorias_local = 0
-            victorias_visitante = 0
-            empates = 0
-            
-            for partido in partidos:
-                # Posesión (convertir de decimal a porcentaje)
-                posesion_local_total += float(partido['posesion_local']) * 100
-                posesion_visitante_total += float(partido['posesion_visitante']) * 100
-                
-                # Corners totales (suma de local + visitante)
-                corners_total += float(partido['corners_local']) + float(partido['corners_visitante'])
-                
-                # Goles totales (suma de local + visitante)
-                goles_total += float(partido['goles_local']) + float(partido['goles_visitante'])
-                
-                # Tarjetas totales
-                tarjetas_total += float(partido['tarjetas_totales'])
-                
-                # Victorias
-                if partido['resultado_1x2'] == 1:
-                    victorias_local += 1
-                elif partido['resultado_1x2'] == 2:
-                    victorias_visitante += 1
-                else:
-                    empates += 1
-            
-            # Calcular promedios
-            result = {
-                'total_partidos': total_partidos,
-                'posesion_local_promedio': posesion_local_total / total_partidos,
-                'posesion_visitante_promedio': posesion_visitante_total / total_partidos,
-                'corners_promedio': corners_total / (total_partidos * 2),  # Dividir por 2 porque sumamos local + visitante
-                'goles_promedio': goles_total / (total_partidos * 2),      # Dividir por 2 porque sumamos local + visitante
-                'tarjetas_promedio': tarjetas_total / (total_partidos * 2), # Dividir por 2 porque tarjetas_totales ya es el total
-                'victorias_local': victorias_local,
-                'victorias_visitante': victorias_visitante,
-                'empates': empates
-            }
-            
-            return result
+            return summarize_enfrentamiento(partidos)
             
+    except DeadlineExceeded:
+        raise
     except Exception as e:
-        print(f"Error en consulta de enfrentamiento: {e}")
+        logger.error("Error en consulta de enfrentamiento: %s", e)
         return None
     finally:
-        connection.close()
+        release_db_connection(connection)
+
+def fetch_match_data(equipo_local_id, equipo_visitante_id, fecha_corte=None):
+    """
+    Consultar en paralelo todos los datos de un enfrentamiento:
+    promedios de resultados, corners y tarjetas y estadísticas del historial
+    """
+    futures = {
+        'resultados': query_executor.submit(metrics.bind_request(get_average_result_data), equipo_local_id, equipo_visitante_id, fecha_corte),
+        'corners': query_executor.submit(metrics.bind_request(get_average_match_data), equipo_local_id, equipo_visitante_id, fecha_corte),
+        'tarjetas': query_executor.submit(metrics.bind_request(get_average_tarjetas_data), equipo_local_id, equipo_visitante_id, fecha_corte),
+        'enfrentamiento': query_executor.submit(metrics.bind_request(get_enfrentamiento_stats), equipo_local_id, equipo_visitante_id)
+    }
+    return {name: future.result() for name, future in futures.items()}
+
+@app.route('/api/predict-all', methods=['POST'])
+def predict_all_endpoint():
+    """
+    Endpoint combinado: resultado 1X2, corners, tarjetas e historial en una sola petición
+    Recibe: {equipo_local_id, equipo_visitante_id, fecha?}
+    Devuelve: la respuesta de /api/predict con los campos corners_data,
+    tarjetas_data e historicos (null si alguna predicción no está disponible)
+    """
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': 'No se recibieron datos'}), 400
+        
+        equipo_local_id = data.get('equipo_local_id')
+        equipo_visitante_id = data.get('equipo_visitante_id')
+        fecha_corte = get_fecha_corte(data.get('fecha'))
+        
+        g.log_fields = {'equipo_local_id': equipo_local_id, 'equipo_visitante_id': equipo_visitante_id}
+        
+        if equipo_local_id is None or equipo_visitante_id is None:
+            return jsonify({'error': 'Faltan IDs de equipos'}), 400
+        
+        try:
+            with admission['predict_all'].admit():
+                # Todas las consultas a la base de datos se lanzan a la vez
+                match_data = fetch_match_data(equipo_local_id, equipo_visitante_id, fecha_corte)
+                
+                # Un diccionario vacío indica "consultado sin resultados" y evita repetir la consulta
+                result = predict_match_result(equipo_local_id, equipo_visitante_id, fecha_corte,
+                                              match_data['resultados'] or {})
+                corners = predict_corners(equipo_local_id, equipo_visitante_id, fecha_corte,
+                                          match_data['corners'] or {})
+                tarjetas = predict_tarjetas(equipo_local_id, equipo_visitante_id, fecha_corte,
+                                            match_data['tarjetas'] or {})
+        except (Overloaded, DeadlineExceeded) as e:
+            return unavailable_response(e, empty_fields={'goles_local': None, 'goles_visitante': None,
+                                                         'resultado_1x2': None})
+        
+        if 'error' in result:
+            response = {
+                'error': result['error'],
+                'goles_local': None,
+                'goles_visitante': None,
+                'resultado_1x2': None
+            }
+            status = 400
+        else:
+            response = build_result_response(result, fecha_corte)
+            status = 200
+        
+        response['corners_data'] = None if 'error' in corners else build_corners_response(corners, fecha_corte)
+        response['tarjetas_data'] = None if 'error' in tarjetas else build_tarjetas_response(tarjetas, fecha_corte)
+        response['historicos'] = build_historical_response(
+            match_data['resultados'], match_data['corners'], match_data['enfrentamiento']
+        )
+        mark_degraded(response, *match_data.values())
+        
+        return jsonify(response), status
+        
+    except InvalidFecha as e:
+        return jsonify({'error': str(e)}), 400
+        
+    except Exception as e:
+        logger.exception("Error interno en %s", request.path)
+        return jsonify({'error': f'Error interno: {str(e)}'}), 500
+
+def score_batch(predicciones, campo, filas, indices, scorer, build):
+    """
+    Ejecutar un modelo una sola vez sobre todas las filas válidas del lote y
+    guardar el resultado de cada partido en predicciones[i][campo]
+    """
+    if not filas:
+        return
+    try:
+        outputs = scorer(np.vstack(filas), indices)
+        for k, i in enumerate(indices):
+            predicciones[i][campo] = build(k, outputs)
+    except Exception as e:
+        for i in indices:
+            predicciones[i][campo] = {'error': f'Error en predicción: {str(e)}'}
+
+def predict_batch(partidos, models=None):
+    """
+    Predecir resultado, corners y tarjetas de una lista de partidos
+    Cada partido es {equipo_local_id, equipo_visitante_id, fecha_corte}.
+    Se arma una matriz de características por modelo y cada modelo se llama
+    una sola vez para todo el lote; los errores se reportan por partido.
+    Todo el lote usa la misma versión de los modelos (`models`, por defecto
+    la actual) y cada predicción lleva su model_version.
+    """
+    predicciones = [{
+        'equipo_local_id': partido['equipo_local_id'],
+        'equipo_visitante_id': partido['equipo_visitante_id'],
+        'as_of': partido['fecha_corte']
+    } for partido in partidos]
+    
+    validos = []
+    for i, partido in enumerate(partidos):
+        if partido['equipo_local_id'] is None or partido['equipo_visitante_id'] is None:
+            predicciones[i]['error'] = 'Faltan IDs de equipos'
+        elif partido['equipo_local_id'] == partido['equipo_visitante_id']:
+            predicciones[i]['error'] = 'Los equipos local y visitante no pueden ser iguales'
+        else:
+            validos.append(i)
+    
+    # Lanzar todas las consultas del lote en paralelo
+    futures = {}
+    for i in validos:
+        local_id = partidos[i]['equipo_local_id']
+        visitante_id = partidos[i]['equipo_visitante_id']
+        futures[i] = (
+            query_executor.submit(metrics.bind_request(get_average_result_data), local_id, visitante_id, partidos[i]['fecha_corte']),
+            query_executor.submit(metrics.bind_request(get_average_match_data), local_id, visitante_id, partidos[i]['fecha_corte']),
+            query_executor.submit(metrics.bind_request(get_average_tarjetas_data), local_id, visitante_id, partidos[i]['fecha_corte'])
+        )
+    
+    # Los modelos pueden seguir cargándose mientras corren las consultas
+    wait_for_models()
+    models = models or model_manager.current
+    
+    # Armar una matriz de características por modelo
+    disponibles = {campo: models is not None for campo in ('resultado', 'corners', 'tarjetas')}
+    filas = {campo: [] for campo in disponibles}
+    indices = {campo: [] for campo in disponibles}
+    columnas = {}
+    for i in validos:
+        local_id = partidos[i]['equipo_local_id']
+        visitante_id = partidos[i]['equipo_visitante_id']
+        try:
+            result_data, corners_data, tarjetas_data = [future.result() for future in futures[i]]
+        except DeadlineExceeded:
+            predicciones[i]['error'] = 'Plazo de la petición agotado sin datos de respaldo'
+            continue
+        mark_degraded(predicciones[i], result_data, corners_data, tarjetas_data)
+        
+        preparados = {
+            'resultado': lambda: prepare_features(local_id, visitante_id, partidos[i]['fecha_corte'], result_data or {},
+                                                  models),
+            'corners': lambda: prepare_corners_features(corners_data),
+            'tarjetas': lambda: prepare_tarjetas_features(tarjetas_data, local_id, visitante_id)
+        }
+        for campo, preparar in preparados.items():
+            if not disponibles[campo]:
+                predicciones[i][campo] = {'error': 'El modelo no está disponible'}
+                continue
+            features, feature_columns = preparar()
+            if features is None:
+                predicciones[i][campo] = {'error': 'No se encontraron datos históricos para este enfrentamiento'}
+            else:
+                columnas[campo] = feature_columns
+                filas[campo].append(features)
+                indices[campo].append(i)
+    
+    score_batch(predicciones, 'resultado', filas['resultado'], indices['resultado'],
+                lambda features, idx: score_results(features, models),
+                lambda k, outputs: build_goals_prediction(float(outputs[0][k]), float(outputs[1][k]),
+                                                          columnas['resultado'], models,
+                                                          models.versions['resultado']))
+    score_batch(predicciones, 'corners', filas['corners'], indices['corners'],
+                lambda features, idx: score_corners(
+                    features,
+                    [partidos[i]['equipo_local_id'] for i in idx],
+                    [partidos[i]['equipo_visitante_id'] for i in idx],
+                    models
+                ),
+                lambda k, outputs: {'corners_totales': float(outputs[k]),
+                                    'model_version': models.versions['corners'],
+                                    'features_used': columnas['corners']})
+    score_batch(predicciones, 'tarjetas', filas['tarjetas'], indices['tarjetas'],
+                lambda features, idx: score_tarjetas(features, models),
+                lambda k, outputs: {'tarjetas_totales': float(outputs[k]),
+                                    'model_version': models.versions['tarjetas'],
+                                    'features_used': columnas['tarjetas']})
+    
+    return predicciones
+
+@app.route('/api/predict-batch', methods=['POST'])
+def predict_batch_endpoint():
+    """
+    Endpoint para predecir una lista de partidos (por ejemplo una jornada completa)
+    Recibe: {partidos: [{equipo_local_id, equipo_visitante_id, fecha?}, ...], fecha?}
+    Devuelve: una predicción por partido con sus propios errores
+    """
+    try:
+        data = request.get_json()
+        
+        if not data or not isinstance(data.get('partidos'), list) or not data['partidos']:
+            return jsonify({'error': 'Se requiere una lista de partidos no vacía'}), 400
+        
+        if len(data['partidos']) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'Máximo {MAX_BATCH_SIZE} partidos por petición'}), 400
+        
+        partidos = []
+        for partido in data['partidos']:
+            partido = partido if isinstance(partido, dict) else {}
+            partidos.append({
+                'equipo_local_id': partido.get('equipo_local_id'),
+                'equipo_visitante_id': partido.get('equipo_visitante_id'),
+                'fecha_corte': get_fecha_corte(partido.get('fecha') or data.get('fecha'))
+            })
+        
+        g.log_fields = {'partidos': len(partidos)}
+        
+        wait_for_models()
+        models = model_manager.current
+        try:
+            with admission['predict_batch'].admit():
+                predicciones = predict_batch(partidos, models)
+        except (Overloaded, DeadlineExceeded) as e:
+            return unavailable_response(e)
+        for prediccion in predicciones:
+            for campo in ('resultado', 'corners', 'tarjetas'):
+                prediccion.get(campo, {}).pop('features_used', None)
+                prediccion.get(campo, {}).pop('model_version', None)
+                prediccion.get(campo, {}).pop('model_type', None)
+        errores = sum(
+            1 for p in predicciones
+            if 'error' in p or any('error' in p.get(campo, {}) for campo in ('resultado', 'corners', 'tarjetas'))
+        )
+        
+        return jsonify({
+            'total': len(predicciones),
+            'con_errores': errores,
+            'model_versions': model_versions(models),
+            'predicciones': predicciones
+        }), 200
+        
+    except InvalidFecha as e:
+        return jsonify({'error': str(e)}), 400
+        
+    except Exception as e:
+        logger.exception("Error interno en %s", request.path)
+        return jsonify({'error': f'Error interno: {str(e)}'}), 500
+
+@app.route('/api/matchup-matrix', methods=['GET'])
+def matchup_matrix_endpoint():
+    """
+    Predicciones precalculadas de todos los cruces entre los equipos de la LigaPro
+    Devuelve: matrices [local][visitante] (en el orden de 'equipos') de goles,
+    resultado 1X2, corners y tarjetas; null en la diagonal y en cruces sin datos
+    """
+    try:
+        if not matchup_matrix.ready:
+            return jsonify({'error': 'La matriz de enfrentamientos se está calculando, intenta de nuevo en unos segundos'}), 503
+        
+        return jsonify(matchup_matrix.as_dict()), 200
+        
+    except Exception as e:
+        logger.exception("Error interno en %s", request.path)
+        return jsonify({'error': f'Error interno: {str(e)}'}), 500
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Endpoint de salud del servidor"""
+    """
+    Endpoint de salud del servidor (liveness): solo lee estado en memoria,
+    sin consultas ni predicciones; la disponibilidad está en /api/ready
+    """
+    models = model_manager.current
     return jsonify({
         'status': 'ok',
-        'models_loaded': model_resultados is not None,
+        'models_loaded': models is not None,
+        'models_loading': not _models_loaded.is_set(),
+        'ready': warmup_state['ready'],
         'models_info': {
-            'resultados_model': {
-                'loaded': model_resultados is not None,
-                'type': type(model_resultados).__name__ if model_resultados else None,
-                'file': 'modelos/modelo_ligapro.pkl'
-            },
-            'corners_model': {
-                'loaded': model_corners is not None,
-                'type': type(model_corners).__name__ if model_corners else None,
-                'file': 'modelos/prediccion_corners_totales.pkl'
-            },
-            'tarjetas_model': {
-                'loaded': model_tarjetas is not None,
-                'type': type(model_tarjetas).__name__ if model_tarjetas else None,
-                'file': 'modelos/modelo_lightgbm_final.pkl'
-            },
-            'corners_scaler': {
-                'loaded': scaler_corners is not None,
-                'type': type(scaler_corners).__name__ if scaler_corners else None,
-                'file': 'modelos/escalador_corners.pkl'
+            key: {
+                'loaded': models is not None,
+                'type': models.info['types'][name] if models is not None else None,
+                'file': ', '.join(models.info['files'][name]) if models is not None else None
             }
+            for key, name in (('resultados_model', 'resultados'), ('corners_model', 'corners'),
+                              ('tarjetas_model', 'tarjetas'), ('corners_scaler', 'escalador'))
         },
+        'models_format': models.info['format'] if models is not None else None,
+        'models': model_manager.stats(),
+        'tree_predictors': {'models': sorted(models.predictors) if models is not None else [],
+                            'max_rows': TREE_PREDICTOR_MAX_ROWS},
+        'inference_batches': {campo: batcher.stats() for campo, batcher in inference_batchers.items()},
+        'single_flight': {campo: flight.stats() for campo, flight in inflight.items()},
+        'admission': {name: controller.stats() for name, controller in admission.items()},
+        'deadlines_ms': {'request': REQUEST_DEADLINE * 1000, 'batch': BATCH_DEADLINE * 1000,
+                         'last_known_aggregates': len(last_known_aggregates)},
+        'startup_ms': {phase: round(seconds * 1000, 1) for phase, seconds in startup_timings.items()},
+        'db_pool': db_pool.stats(),
+        'schema': {'version': schema_version, 'expected': SCHEMA_VERSION},
+        'feature_store': feature_store.stats(),
+        'matchup_matrix': matchup_matrix.stats(),
+        'prediction_cache': prediction_cache.stats(),
         'timestamp': datetime.now().isoformat()
     }), 200
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """
+    Listo para recibir tráfico: 200 cuando terminó el calentamiento, 503
+    mientras tanto (para el balanceador o el orquestador)
+    """
+    status = {key: value for key, value in warmup_state.items() if key != 'running'}
+    status['steps_ms'] = dict(status['steps_ms'])
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus"""
+    lines = []
+    for metric in (metrics.REQUESTS, metrics.REQUEST_SECONDS, metrics.STAGE_SECONDS, deadline.EXPIRATIONS,
+                   INFERENCE_ROWS):
+        lines.extend(metric.render())
+    lines.extend(metrics.render_stats(
+        'upsbet_db_pool', 'Pool de conexiones PostgreSQL', db_pool.stats(),
+        counters={'borrows', 'waits', 'timeouts', 'connections_created', 'connections_discarded',
+                  'connect_errors', 'health_check_failures', 'idle_closed', 'wait_time_total'}
+    ))
+    lines.extend(metrics.render_stats(
+        'upsbet_prediction_cache', 'Caché de predicciones', prediction_cache.stats(),
+        counters={'hits', 'misses', 'evictions', 'expirations', 'invalidations', 'stale_hits'}
+    ))
+    lines.extend(metrics.render_stats(
+        'upsbet_matchup_matrix', 'Matriz de enfrentamientos', matchup_matrix.stats(),
+        counters={'builds', 'hits', 'misses'}
+    ))
+    lines.extend(metrics.render_stats(
+        'upsbet_feature_store', 'Almacén de características', feature_store.stats()
+    ))
+    lines.extend(metrics.render_stats(
+        'upsbet_models', 'Versiones de los modelos', model_manager.stats(),
+        counters={'reloads', 'failed_reloads'}
+    ))
+    for campo, batcher in inference_batchers.items():
+        lines.extend(metrics.render_stats(
+            f'upsbet_inference_{campo}', f'Micro-lotes de inferencia ({campo})', batcher.stats(),
+            counters={'batches', 'requests', 'rows', 'errors'}
+        ))
+    for campo, flight in inflight.items():
+        lines.extend(metrics.render_stats(
+            f'upsbet_single_flight_{campo}', f'Peticiones iguales coalescidas ({campo})', flight.stats(),
+            counters={'calls', 'shared', 'errors'}
+        ))
+    for name, controller in admission.items():
+        lines.extend(metrics.render_stats(
+            f'upsbet_admission_{name}', f'Control de admisión (/api/{name.replace("_", "-")})', controller.stats(),
+            counters={'admitted', 'queued', 'rejected_queue_full', 'rejected_latency', 'timeouts'}
+        ))
+    lines.extend(metrics.render_stats(
+        'upsbet_startup', 'Arranque en frío (segundos)',
+        {f'{phase}_seconds': seconds for phase, seconds in startup_timings.items()}
+    ))
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     """Servir la página principal"""
@@ -1162,15 +2162,280 @@ def static_files(filename):
     """Servir archivos estáticos"""
     return send_from_directory('public', filename)
 
+# Estado del calentamiento: /api/ready responde 200 solo cuando terminó
+warmup_state = {'ready': False, 'running': False, 'reason': 'calentamiento pendiente', 'steps_ms': {}}
+
+def warm_up_pairs(count):
+    """Cruces para el calentamiento: cada equipo una vez como local"""
+    ids = sorted(EQUIPOS_LIGAPRO.values())
+    return [(ids[i], ids[(i + 1) % len(ids)]) for i in range(min(count, len(ids)))]
+
+class WarmupInterrupted(Exception):
+    """El proceso terminó durante el calentamiento"""
+
+def process_exiting():
+    """True si el intérprete está terminando (el hilo principal ya salió)"""
+    return sys.is_finalizing() or not threading.main_thread().is_alive()
+
+def warm_up():
+    """
+    Dejar el proceso listo para recibir tráfico: esperar los modelos, abrir
+    las conexiones mínimas del pool, pasar filas sintéticas por cada modelo
+    (inicialización perezosa de LightGBM/XGBoost), predecir algunos cruces con
+    la fecha de hoy en lote y uno a uno (hilos de consultas, conexiones,
+    almacén y caché de predicciones) y esperar la matriz de enfrentamientos. Al terminar /api/ready pasa a responder 200.
+    """
+    warmup_state.update(ready=False, running=True, reason='calentando', steps_ms={}, started_at=datetime.now().isoformat())
+    started = time.perf_counter()
+
+    def step(name, fn):
+        if process_exiting():
+            raise WarmupInterrupted()
+        step_started = time.perf_counter()
+        try:
+            fn()
+        finally:
+            warmup_state['steps_ms'][name] = round((time.perf_counter() - step_started) * 1000, 1)
+
+    try:
+        step('models', wait_for_models)
+        models = model_manager.current
+        if models is None:
+            warmup_state.update(reason='modelos no cargados')
+            logger.error("Calentamiento detenido: hay modelos sin cargar")
+            return
+
+        def fill_pool():
+            if feature_store.snapshot is not None:
+                # Con snapshot las conexiones se abren solo si alguna consulta las necesita
+                return
+            try:
+                db_pool.fill()
+            except psycopg2.Error as e:
+                logger.warning("Calentamiento: no se pudo abrir el pool de conexiones (%s)", e)
+        step('db_pool', fill_pool)
+
+        def synthetic_inference():
+            n_tarjetas = getattr(models.tarjetas, 'n_features_in_', None) or models.tarjetas.num_feature()
+            for rows in (1, len(EQUIPOS_LIGAPRO) * (len(EQUIPOS_LIGAPRO) - 1)):
+                score_results(np.zeros((rows, len(models.resultados['feature_columns']))), models)
+                score_corners(np.zeros((rows, models.escalador.n_features_in_)), [0] * rows, [0] * rows, models)
+                score_tarjetas(np.zeros((rows, n_tarjetas)), models)
+        step('inference', synthetic_inference)
+
+        def predictions():
+            fecha_corte = get_fecha_corte(None)
+            pairs = warm_up_pairs(int(os.getenv('WARMUP_PAIRS', 16)))
+            # Lote con consultas en paralelo: crea los hilos de query_executor y abre
+            # las conexiones que usan /api/predict-all y /api/predict-batch
+            predict_batch([{'equipo_local_id': local_id, 'equipo_visitante_id': visitante_id,
+                            'fecha_corte': fecha_corte} for local_id, visitante_id in pairs])
+            for local_id, visitante_id in pairs:
+                if process_exiting():
+                    raise WarmupInterrupted()
+                result = predict_match_result(local_id, visitante_id, fecha_corte)
+                predict_corners(local_id, visitante_id, fecha_corte)
+                predict_tarjetas(local_id, visitante_id, fecha_corte)
+                if 'error' not in result:
+                    app.json.dumps(build_result_response(result, fecha_corte))
+        step('predictions', predictions)
+
+        if os.getenv('MATCHUP_MATRIX', '1') != '0' and feature_store.ready:
+            step('matchup_matrix', lambda: matchup_matrix.wait_for_build(float(os.getenv('WARMUP_TIMEOUT', 60))))
+
+        warmup_state.update(ready=True, reason=None)
+        logger.info("Calentamiento terminado en %.0f ms", (time.perf_counter() - started) * 1000,
+                    extra={'warmup_ms': warmup_state['steps_ms']})
+    except Exception as e:
+        if isinstance(e, WarmupInterrupted) or process_exiting():
+            # El intérprete está terminando: el ejecutor de consultas ya no acepta tareas
+            warmup_state.update(reason='proceso terminando')
+            logger.info("Calentamiento interrumpido: el proceso está terminando")
+            return
+        warmup_state.update(reason=f'error en el calentamiento: {e}')
+        logger.exception("Error en el calentamiento: %s", e)
+    finally:
+        warmup_state.update(running=False, duration_ms=round((time.perf_counter() - started) * 1000, 1))
+
+def start_warm_up():
+    """Calentar en un hilo (WARMUP=0 solo espera los modelos)"""
+    if warmup_state['running']:
+        return
+    if os.getenv('WARMUP', '1') == '0':
+        def models_only():
+            wait_for_models()
+            loaded = model_manager.current is not None
+            warmup_state.update(ready=loaded, reason=None if loaded else 'modelos no cargados')
+        target = models_only
+    else:
+        target = warm_up
+    threading.Thread(target=target, name='calentamiento', daemon=True).start()
+
+# Modo pre-fork (gunicorn.conf.py): el maestro es el único que vigila los datos
+# y los modelos (start_master_refresh); los workers solo se calientan
+SERVER_PREFORK = os.getenv('SERVER_PREFORK') == '1'
+
+def start_background_threads():
+    """Calentamiento e hilos de actualización de los modelos, del almacén de características y de la matriz"""
+    start_warm_up()
+    if SERVER_PREFORK:
+        return
+    model_manager.start_watcher(float(os.getenv('MODEL_RELOAD_CHECK', 30)))
+    if os.getenv('FEATURE_STORE', '1') != '0':
+        feature_store.start_auto_refresh(float(os.getenv('FEATURE_STORE_REFRESH', 60)))
+    if os.getenv('MATCHUP_MATRIX', '1') != '0':
+        matchup_matrix.start_watcher(float(os.getenv('MATCHUP_MATRIX_CHECK', 30)))
+
+# Lo toma el maestro mientras actualiza los datos o los modelos y antes de
+# cada fork, para que ningún worker nazca a mitad de una actualización
+_fork_lock = threading.Lock()
+_fork_pending = False
+
+def _release_fork_lock():
+    global _fork_pending
+    if _fork_pending:
+        _fork_pending = False
+        _fork_lock.release()
+
+os.register_at_fork(after_in_parent=_release_fork_lock, after_in_child=_release_fork_lock)
+
+def start_master_refresh(recycle_workers):
+    """
+    Vigilar el almacén de características y la carpeta de modelos desde el
+    maestro de un servidor pre-fork (gunicorn.conf.py, when_ready). Si algo
+    cambia, el maestro recarga una sola vez, espera a la matriz de
+    enfrentamientos y llama a `recycle_workers`: los workers nuevos nacen con
+    la versión nueva y la comparten copy-on-write. Así la base de datos recibe
+    una sola consulta de huella por intervalo y no una por worker, y un
+    worker reciclado por max_requests nunca nace con datos del arranque.
+    """
+    checks = [(float(os.getenv('MODEL_RELOAD_CHECK', 30)), 'modelos', model_manager.reload_if_changed)]
+    if os.getenv('FEATURE_STORE', '1') != '0':
+        checks.append((float(os.getenv('FEATURE_STORE_REFRESH', 60)), 'almacén de características',
+                       feature_store.refresh_if_changed))
+    checks = [check for check in checks if check[0] > 0]
+    if not checks:
+        return
+
+    def run():
+        due = [time.monotonic() + interval for interval, _, _ in checks]
+        while True:
+            time.sleep(max(0.0, min(due) - time.monotonic()))
+            changed = []
+            with _fork_lock:
+                for k, (interval, name, check) in enumerate(checks):
+                    if time.monotonic() < due[k]:
+                        continue
+                    due[k] = time.monotonic() + interval
+                    try:
+                        if check():
+                            changed.append(name)
+                    except Exception as e:
+                        logger.error("Error actualizando %s en el proceso maestro: %s", name, e)
+                if changed:
+                    matchup_matrix.wait_for_build()
+            if changed:
+                logger.info("Nueva versión de %s en el proceso maestro: reciclando los workers", ', '.join(changed))
+                recycle_workers()
+
+    threading.Thread(target=run, name='actualizacion-maestro', daemon=True).start()
+
+def before_fork():
+    """
+    Preparar el proceso maestro de un servidor pre-fork (gunicorn.conf.py):
+    terminar la carga de modelos, la matriz en construcción y la preparación
+    de la base de datos y cerrar las conexiones abiertas, para que los workers compartan los modelos y no
+    hereden ni locks tomados ni sockets compartidos. El lock de actualización
+    queda tomado hasta el fork (se libera en el maestro y en el hijo)
+    """
+    global _fork_pending
+    _fork_lock.acquire()
+    _fork_pending = True
+    try:
+        wait_for_models()
+        matchup_matrix.wait_for_build(timeout=60)
+        if database_init is not None:
+            database_init.join()
+        db_pool.close_all()
+    except BaseException:
+        _release_fork_lock()
+        raise
+
+def after_fork():
+    """
+    Inicializar un worker recién creado: los hilos del maestro no existen en
+    el hijo, así que se vuelven a lanzar el log, el ejecutor de consultas y
+    el calentamiento. Los modelos y los datos ya cargados se comparten con el
+    maestro (copy-on-write); las versiones nuevas llegan reciclando los
+    workers (start_master_refresh), no con hilos de actualización en cada uno.
+    """
+    global query_executor
+    db_pool.check_pid()
+    restart_after_fork()
+    query_executor = new_query_executor()
+    start_background_threads()
+
+# Cargar modelos y datos cuando todas las funciones de predicción ya están
+# definidas (la validación de los modelos predice; la matriz de
+# enfrentamientos se construye al terminar la carga)
+model_manager.on_reload(prediction_cache.invalidate)
+if os.getenv('MATCHUP_MATRIX', '1') != '0':
+    feature_store.on_refresh(rebuild_matchup_matrix)
+    model_manager.on_reload(rebuild_matchup_matrix)
+
+threading.Thread(target=load_models_in_background, name='carga-modelos', daemon=True).start()
+if os.getenv('MODEL_LOADING', 'background') == 'eager':
+    wait_for_models()
+
+def run_startup_phase(phase, init):
+    phase_started = time.perf_counter()
+    init()
+    startup_timings[phase] = time.perf_counter() - phase_started
+
+# Las herramientas que importan app solo por sus funciones (benchmark.py,
+# loadtest.py) usan SERVER_TASKS=0: no se prepara la base de datos ni se
+# lanzan el calentamiento y los hilos de actualización
+SERVER_TASKS = os.getenv('SERVER_TASKS', '1') != '0'
+
+def init_database():
+    """Verificar la versión del esquema y preparar las tablas de agregados"""
+    if not SERVER_TASKS:
+        return
+    for phase, init in (('schema', check_schema_version), ('aggregates', init_aggregates)):
+        run_startup_phase(phase, init)
+
+# Con snapshot las lecturas no necesitan la base de datos: se prepara en
+# segundo plano (solo la usan las consultas de respaldo) y no retrasa el arranque
+database_init = None
+if FEATURE_SNAPSHOT:
+    run_startup_phase('feature_store', init_feature_store)
+    database_init = threading.Thread(target=init_database, name='inicio-base-de-datos', daemon=True)
+    database_init.start()
+else:
+    init_database()
+    run_startup_phase('feature_store', init_feature_store)
+
+startup_timings['total'] = time.perf_counter() - _startup_started
+logger.info("Arranque en frío: %.0f ms (imports %.0f ms, esquema %.0f ms, agregados %.0f ms, almacén %.0f ms; "
+            "modelos %s)",
+            *(startup_timings.get(phase, 0.0) * 1000
+              for phase in ('total', 'imports', 'schema', 'aggregates', 'feature_store')),
+            'cargados' if _models_loaded.is_set() else 'cargando en segundo plano',
+            extra={'startup_ms': {phase: round(seconds * 1000, 1) for phase, seconds in startup_timings.items()}})
+
+# En modo pre-fork el calentamiento se lanza en cada worker (after_fork) y la
+# actualización en el maestro (start_master_refresh)
+if SERVER_TASKS and not SERVER_PREFORK:
+    start_background_threads()
+
 if __name__ == '__main__':
-    print("=" * 60)
-    print("INICIANDO SERVIDOR UPSBet")
-    print("=" * 60)
-    print(f"Modelo de resultados: {'CARGADO' if model_resultados else 'NO CARGADO'}")
-    print(f"Modelo de corners: {'CARGADO' if model_corners else 'NO CARGADO'}")
-    print(f"Modelo de tarjetas: {'CARGADO' if model_tarjetas else 'NO CARGADO'}")
-    print(f"Escalador de corners: {'CARGADO' if scaler_corners else 'NO CARGADO'}")
-    print("=" * 60)
-    print("Servidor disponible en: http://localhost:5000")
-    print("=" * 60)
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    logger.info("Iniciando servidor UPSBet (modelos %s)",
+                'cargados' if _models_loaded.is_set() else 'cargando en segundo plano')
+    try:
+        db_pool.fill()
+        logger.info("Pool de conexiones: %d abiertas (max %d)", db_pool.stats()['open'], db_pool.maxconn)
+    except Exception as e:
+        logger.warning("Pool de conexiones: sin conexión inicial (%s)", e)
+    logger.info("Servidor disponible en: http://localhost:5000")
+    # Servidor de desarrollo; en producción usar gunicorn (gunicorn.conf.py)
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', host='0.0.0.0', port=5000)
@@ -0,0 +1,336 @@
+"""
+UPSBet - Servidor ASGI con PostgreSQL asíncrono
+===============================================
+Alternativa a app.py para muchas peticiones concurrentes que esperan a la
+base de datos: las consultas van por un pool de asyncpg (sin un hilo por
+petición) y solo las predicciones, que usan CPU, se ejecutan en un
+ThreadPoolExecutor acotado.
+
+Expone el mismo contrato que app.py para /api/predict, /api/predict-corners,
+/api/predict-tarjetas y /api/historical-data (mismos cuerpos, errores y
+códigos de estado), además de /api/health y /api/ready. Reutiliza los modelos, el
+almacén de características, la matriz de enfrentamientos y la caché de
+app.py; las fechas se comparan como DATE, así que requiere el esquema
+migrado (python migrate.py).
+
+No aplica el control de admisión (admission.py) ni los plazos por petición
+(deadline.py) de app.py: la concurrencia la acotan el pool de asyncpg y
+PREDICT_WORKERS, y las consultas no llevan statement_timeout.
+
+Uso:
+    pip install -r requirements-asgi.txt
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+Variables de entorno:
+    ASYNC_DB_POOL_MIN / ASYNC_DB_POOL_MAX   tamaño del pool de asyncpg (por defecto 2 / 20)
+    PREDICT_WORKERS                         hilos para las predicciones (por defecto uno por CPU)
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import asyncpg
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+import app as upsbet
+from aggregates import AGGREGATE_TABLES, aggregate_name
+from feature_store import TABLES
+from single_flight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+predict_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('PREDICT_WORKERS', os.cpu_count() or 4)),
+    thread_name_prefix='predicciones'
+)
+
+# Pool de asyncpg (se crea al arrancar el servidor)
+db_pool = None
+
+# Coalescencia de peticiones iguales en curso, con las mismas claves que app.py
+inflight = {campo: AsyncSingleFlight() for campo in upsbet.inflight}
+
+
+def json_response(payload, status=200):
+    """Mismo JSON que jsonify() de app.py (compacto, claves ordenadas)"""
+    body = upsbet.app.json.dumps(payload, separators=(',', ':'))
+    return Response(f"{body}\n", status_code=status, media_type='application/json')
+
+
+def sql_id(value):
+    """ID de equipo como entero para asyncpg (ValueError si no es un entero)"""
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"ID de equipo inválido: {value!r}")
+    return int(value)
+
+
+def avg_sql(table, with_fecha):
+    """Promedios de un enfrentamiento en un sentido (mismas columnas que las consultas de app.py)"""
+    averages = ', '.join(f"AVG({col}) AS {col}" for col in TABLES[table])
+    fecha_filter = "AND fecha < $3::text::date" if with_fecha else ""
+    return (f"SELECT {averages}, COUNT(*) AS num_partidos FROM {table} "
+            f"WHERE equipo_local_id = $1 AND equipo_visitante_id = $2 {fecha_filter}")
+
+
+async def fetch_aggregate(connection, table, local_id, visitante_id, fecha_corte):
+    """Lectura de la tabla de agregados; devuelve (cubre, resultado) como read_aggregate de app.py"""
+    columns = ', '.join(AGGREGATE_TABLES[table])
+    cubre = "partidos_sin_fecha = 0 AND fecha_max < $3::text::date" if fecha_corte else "TRUE"
+    params = [local_id, visitante_id] + ([fecha_corte] if fecha_corte else [])
+    try:
+        row = await connection.fetchrow(
+            f"SELECT {columns}, num_partidos, {cubre} AS cubre FROM {aggregate_name(table)} "
+            f"WHERE equipo_local_id = $1 AND equipo_visitante_id = $2",
+            *params
+        )
+    except asyncpg.PostgresError as e:
+        logger.warning("Error leyendo agregados de %s: %s", table, e)
+        return False, None
+    if row is None:
+        return True, None
+    row = dict(row)
+    if not row.pop('cubre'):
+        return False, None
+    return True, row
+
+
+async def fetch_average(table, average_from_store, equipo_local_id, equipo_visitante_id, fecha_corte=None):
+    """
+    Promedio de un enfrentamiento con el mismo orden que get_average_*_data de
+    app.py: almacén en memoria, tabla de agregados y por último AVG directo/inverso
+    """
+    if upsbet.feature_store.ready:
+        try:
+            return average_from_store(equipo_local_id, equipo_visitante_id, fecha_corte)
+        except ValueError as e:
+            logger.warning("Fecha de corte no interpretable (%s), consultando la base de datos", e)
+
+    if db_pool is None:
+        return None
+    try:
+        local_id, visitante_id = sql_id(equipo_local_id), sql_id(equipo_visitante_id)
+        async with db_pool.acquire() as connection:
+            if upsbet.aggregates_ready and table in AGGREGATE_TABLES:
+                cubre, result = await fetch_aggregate(connection, table, local_id, visitante_id, fecha_corte)
+                if cubre:
+                    return result
+
+            sql = avg_sql(table, bool(fecha_corte))
+            for pair in ((local_id, visitante_id), (visitante_id, local_id)):
+                params = list(pair) + ([fecha_corte] if fecha_corte else [])
+                row = await connection.fetchrow(sql, *params)
+                if row and row['num_partidos'] > 0:
+                    return dict(row)
+            return None
+    except (asyncpg.PostgresError, OSError, ValueError, TypeError) as e:
+        logger.error("Error en consulta de %s: %s", table, e)
+        return None
+
+
+async def fetch_enfrentamiento(equipo_local_id, equipo_visitante_id):
+    """Estadísticas del historial (como get_enfrentamiento_stats de app.py)"""
+    if upsbet.feature_store.ready:
+        return upsbet.feature_store.enfrentamiento_stats(equipo_local_id, equipo_visitante_id)
+    if db_pool is None:
+        return None
+    try:
+        local_id, visitante_id = sql_id(equipo_local_id), sql_id(equipo_visitante_id)
+        async with db_pool.acquire() as connection:
+            partidos = await connection.fetch(
+                """
+                SELECT * FROM resultado_historico_tabla
+                WHERE (equipo_local_id = $1 AND equipo_visitante_id = $2) OR
+                      (equipo_local_id = $2 AND equipo_visitante_id = $1)
+                """,
+                local_id, visitante_id
+            )
+        if not partidos:
+            return None
+        return upsbet.summarize_enfrentamiento(partidos)
+    except (asyncpg.PostgresError, OSError, ValueError, TypeError) as e:
+        logger.error("Error en consulta de enfrentamiento: %s", e)
+        return None
+
+
+def fetch_result_data(*args):
+    return fetch_average('ganador_resultado_tabla', upsbet.feature_store.average_result, *args)
+
+
+def fetch_corners_data(*args):
+    return fetch_average('corners_tabla', upsbet.feature_store.average_corners, *args)
+
+
+def fetch_tarjetas_data(*args):
+    return fetch_average('tarjetas_tabla', upsbet.feature_store.average_tarjetas, *args)
+
+
+async def read_ids(request):
+    """(datos, equipo_local_id, equipo_visitante_id) o una respuesta de error 400"""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data or not isinstance(data, dict):
+        return json_response({'error': 'No se recibieron datos'}, 400)
+    equipo_local_id = data.get('equipo_local_id')
+    equipo_visitante_id = data.get('equipo_visitante_id')
+    if equipo_local_id is None or equipo_visitante_id is None:
+        return json_response({'error': 'Faltan IDs de equipos'}, 400)
+    return data, equipo_local_id, equipo_visitante_id
+
+
+def prediction_endpoint(campo, fetch, predict, build_response, empty_fields):
+    """
+    Endpoint de predicción: la consulta se espera sin bloquear y la
+    predicción corre en el executor acotado. Las peticiones iguales
+    simultáneas comparten la consulta y la predicción
+    """
+    async def compute(equipo_local_id, equipo_visitante_id, fecha_corte):
+        match_data = await fetch(equipo_local_id, equipo_visitante_id, fecha_corte)
+        # Un diccionario vacío indica "consultado sin resultados"
+        return await asyncio.get_running_loop().run_in_executor(
+            predict_executor, predict, equipo_local_id, equipo_visitante_id, fecha_corte, match_data or {}
+        )
+
+    async def endpoint(request):
+        try:
+            parsed = await read_ids(request)
+            if isinstance(parsed, Response):
+                return parsed
+            data, equipo_local_id, equipo_visitante_id = parsed
+            fecha_corte = upsbet.get_fecha_corte(data.get('fecha'))
+
+            # Con la predicción en la matriz o en la caché no se consultan los datos del cruce
+            models = upsbet.model_manager.current
+            result = None
+            if models is not None and equipo_local_id != equipo_visitante_id:
+                result = upsbet.lookup_prediction(campo, equipo_local_id, equipo_visitante_id, fecha_corte, models)
+            if result is None:
+                key = upsbet.prediction_cache_key(campo, equipo_local_id, equipo_visitante_id, fecha_corte, models)
+                result = await inflight[campo].do(key, compute, equipo_local_id, equipo_visitante_id, fecha_corte)
+
+            if 'error' in result:
+                return json_response(dict({'error': result['error']}, **empty_fields), 400)
+            return json_response(build_response(result, fecha_corte))
+        except upsbet.InvalidFecha as e:
+            return json_response({'error': str(e)}, 400)
+        except Exception as e:
+            logger.exception("Error interno en %s", request.url.path)
+            return json_response({'error': f'Error interno: {str(e)}'}, 500)
+    return endpoint
+
+
+async def fetch_historical_response(equipo_local_id, equipo_visitante_id):
+    """Datos históricos de un enfrentamiento (como get_historical_response de app.py)"""
+    result_data, corners_data, enfrentamiento_data = await asyncio.gather(
+        fetch_result_data(equipo_local_id, equipo_visitante_id),
+        fetch_corners_data(equipo_local_id, equipo_visitante_id),
+        fetch_enfrentamiento(equipo_local_id, equipo_visitante_id)
+    )
+    return upsbet.build_historical_response(result_data, corners_data, enfrentamiento_data)
+
+
+async def historical_data(request):
+    try:
+        parsed = await read_ids(request)
+        if isinstance(parsed, Response):
+            return parsed
+        _, equipo_local_id, equipo_visitante_id = parsed
+        key = upsbet.prediction_cache_key('historico', equipo_local_id, equipo_visitante_id, None, None)
+        return json_response(await inflight['historico'].do(
+            key, fetch_historical_response, equipo_local_id, equipo_visitante_id))
+    except Exception as e:
+        logger.exception("Error interno en %s", request.url.path)
+        return json_response({'error': f'Error interno: {str(e)}'}, 500)
+
+
+async def ready(request):
+    """200 cuando app.py terminó el calentamiento (modelos, inferencia y cachés), 503 mientras tanto"""
+    status = {key: value for key, value in upsbet.warmup_state.items() if key != 'running'}
+    status['steps_ms'] = dict(status['steps_ms'])
+    status['async_db_pool'] = db_pool is not None
+    return json_response(status, 200 if status['ready'] else 503)
+
+
+async def health(request):
+    return json_response({
+        'status': 'ok',
+        'models_loaded': upsbet.model_manager.current is not None,
+        'models': upsbet.model_manager.stats(),
+        'ready': upsbet.warmup_state['ready'],
+        'async_db_pool': {
+            'connected': db_pool is not None,
+            'size': db_pool.get_size() if db_pool else 0,
+            'idle': db_pool.get_idle_size() if db_pool else 0,
+            'min_size': db_pool.get_min_size() if db_pool else 0,
+            'max_size': db_pool.get_max_size() if db_pool else 0,
+        },
+        'feature_store': upsbet.feature_store.stats(),
+        'matchup_matrix': upsbet.matchup_matrix.stats(),
+        'prediction_cache': upsbet.prediction_cache.stats(),
+        'inference_batches': {campo: batcher.stats() for campo, batcher in upsbet.inference_batchers.items()},
+        'single_flight': {campo: flight.stats() for campo, flight in inflight.items()},
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+async def init_connection(connection):
+    """
+    Leer REAL en formato texto como psycopg2: en binario asyncpg devuelve el
+    float32 exacto (53.14285659790039 en vez de 53.142857) y las estadísticas
+    del historial no coincidirían con las de app.py
+    """
+    await connection.set_type_codec('float4', schema='pg_catalog', encoder=str, decoder=float, format='text')
+
+
+@contextlib.asynccontextmanager
+async def lifespan(application):
+    global db_pool
+    config = upsbet.DB_CONFIG
+    try:
+        db_pool = await asyncpg.create_pool(
+            host=config['host'], port=config['port'], user=config['user'],
+            password=config['password'], database=config['database'],
+            min_size=int(os.getenv('ASYNC_DB_POOL_MIN', 2)),
+            max_size=int(os.getenv('ASYNC_DB_POOL_MAX', 20)),
+            init=init_connection
+        )
+        logger.info("Pool de asyncpg listo (%d-%d conexiones)", db_pool.get_min_size(), db_pool.get_max_size())
+    except (asyncpg.PostgresError, OSError) as e:
+        logger.error("No se pudo crear el pool de asyncpg: %s", e)
+    if upsbet.schema_version is not None and upsbet.schema_version < 1:
+        logger.warning("El servidor ASGI compara fechas como DATE: ejecuta python migrate.py")
+    try:
+        yield
+    finally:
+        if db_pool is not None:
+            await db_pool.close()
+        predict_executor.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/api/predict', prediction_endpoint(
+            'resultado', fetch_result_data, upsbet.predict_match_result, upsbet.build_result_response,
+            {'goles_local': None, 'goles_visitante': None, 'resultado_1x2': None}
+        ), methods=['POST']),
+        Route('/api/predict-corners', prediction_endpoint(
+            'corners', fetch_corners_data, upsbet.predict_corners, upsbet.build_corners_response,
+            {'corners_totales': None}
+        ), methods=['POST']),
+        Route('/api/predict-tarjetas', prediction_endpoint(
+            'tarjetas', fetch_tarjetas_data, upsbet.predict_tarjetas, upsbet.build_tarjetas_response,
+            {'tarjetas_totales': None}
+        ), methods=['POST']),
+        Route('/api/historical-data', historical_data, methods=['POST']),
+        Route('/api/health', health, methods=['GET']),
+        Route('/api/ready', ready, methods=['GET']),
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+UPSBet - Microbenchmarks del pipeline de predicción
+===================================================
+Mide por separado cada etapa de una predicción sin servidor ni PostgreSQL:
+
+    features.*   armado de características (prepare_features, prepare_corners_features,
+                 prepare_tarjetas_features)
+    predict.*    cada modelo de modelos/ con una fila y con el lote de los 240 cruces
+    db.*         consultas AVG y lecturas de agregados por enfrentamiento sobre una
+                 copia SQLite en memoria cargada desde los dumps de data/
+    store.*      promedios del almacén de características en memoria
+    json.*       serialización de las respuestas
+
+Los resultados se guardan en JSON. Con una línea base guardada, el script
+termina con código 1 si algún benchmark empeora más que el umbral.
+
+Uso:
+    python benchmark.py --update-baseline        # medir y guardar la línea base
+    python benchmark.py                          # medir y comparar con la línea base
+    python benchmark.py --threshold 0.5 --filter predict
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+from datetime import datetime
+
+# El servidor se importa solo por sus funciones: sin carga de tablas ni matriz,
+# sin base de datos y sin calentamiento
+for name, value in (('FEATURE_STORE', '0'), ('MATCHUP_MATRIX', '0'), ('AGGREGATE_TABLES', '0'),
+                    ('PREDICTION_CACHE_SIZE', '0'), ('LOG_LEVEL', 'WARNING'), ('DB_POOL_MIN', '0'),
+                    ('SERVER_TASKS', '0')):
+    os.environ.setdefault(name, value)
+
+import numpy as np
+
+import app
+from aggregates import AGGREGATE_TABLES, aggregate_name
+from feature_store import TABLES, SQL_AVG_TABLES
+from sqlite_standin import load_standin_db, load_standin_store
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+DEFAULT_OUTPUT = 'benchmark_results.json'
+
+# Clásicos y cruces habituales, recorridos en orden para no medir siempre la misma fila
+PAIRS = [(0, 4), (4, 0), (5, 12), (12, 5), (5, 7), (13, 5), (8, 10), (22, 20), (6, 14), (9, 17)]
+
+
+def avg_query(connection, table, equipo_local_id, equipo_visitante_id, fecha_corte):
+    """Consulta AVG del servidor: enfrentamiento directo y, si no hay partidos, el inverso"""
+    averages = ', '.join(f"AVG({col}) AS {col}" for col in TABLES[table])
+    sql = (f"SELECT {averages}, COUNT(*) AS num_partidos FROM {table} "
+           f"WHERE equipo_local_id = ? AND equipo_visitante_id = ? AND fecha < ?")
+    for local_id, visitante_id in ((equipo_local_id, equipo_visitante_id),
+                                   (equipo_visitante_id, equipo_local_id)):
+        row = connection.execute(sql, (local_id, visitante_id, fecha_corte)).fetchone()
+        if row['num_partidos'] > 0:
+            return dict(row)
+    return None
+
+
+def aggregate_lookup(connection, table, equipo_local_id, equipo_visitante_id, fecha_corte):
+    """Lectura por clave de la tabla de agregados, la misma que aggregates.aggregate_average"""
+    columns = ', '.join(AGGREGATE_TABLES[table])
+    sql = (f"SELECT {columns}, num_partidos, directo, partidos_sin_fecha = 0 AND fecha_max < ? AS cubre "
+           f"FROM {aggregate_name(table)} WHERE equipo_local_id = ? AND equipo_visitante_id = ?")
+    row = connection.execute(sql, (fecha_corte, equipo_local_id, equipo_visitante_id)).fetchone()
+    return dict(row) if row is not None else None
+
+
+def cycling(fn):
+    """Llamar a fn con un enfrentamiento distinto de PAIRS en cada iteración"""
+    pairs = itertools.cycle(PAIRS)
+    return lambda: fn(*next(pairs))
+
+
+def build_cases(store, connection):
+    """Diccionario nombre -> función sin argumentos a medir"""
+    ids = sorted(app.EQUIPOS_LIGAPRO.values())
+    all_pairs = [(l, v) for l in ids for v in ids if l != v]
+    fecha_corte = '2025-01-01'
+
+    data = {
+        'resultado': {pair: store.average_result(*pair) for pair in all_pairs},
+        'corners': {pair: store.average_corners(*pair) for pair in all_pairs},
+        'tarjetas': {pair: store.average_tarjetas(*pair) for pair in all_pairs},
+    }
+    pair = PAIRS[0]
+    cases = {
+        'features.prepare_features': lambda: app.prepare_features(*pair, match_data=data['resultado'][pair]),
+        'features.prepare_corners_features': lambda: app.prepare_corners_features(data['corners'][pair]),
+        'features.prepare_tarjetas_features': lambda: app.prepare_tarjetas_features(data['tarjetas'][pair], *pair),
+    }
+
+    # Matrices de características de todos los cruces con datos
+    batches = {}
+    for campo, prepare in (('resultado', lambda p, d: app.prepare_features(*p, match_data=d)[0]),
+                           ('corners', lambda p, d: app.prepare_corners_features(d)[0]),
+                           ('tarjetas', lambda p, d: app.prepare_tarjetas_features(d, *p)[0])):
+        pairs = [p for p in all_pairs if data[campo][p]]
+        batches[campo] = (pairs, np.vstack([prepare(p, data[campo][p]) for p in pairs]))
+
+    models = app.model_manager.current
+    scorers = {
+        'resultado': lambda pairs, X: app.score_results(X),
+        'corners': lambda pairs, X: app.score_corners(X, [p[0] for p in pairs], [p[1] for p in pairs]),
+        'tarjetas': lambda pairs, X: app.score_tarjetas(X),
+    }
+    for campo, score in scorers.items():
+        if models is None:
+            print(f"Aviso: modelo de {campo} no disponible, se omiten sus benchmarks")
+            continue
+        pairs, X = batches[campo]
+        cases[f'predict.{campo}.single'] = lambda score=score, pairs=pairs, X=X: score(pairs[:1], X[:1])
+        cases[f'predict.{campo}.batch{len(pairs)}'] = lambda score=score, pairs=pairs, X=X: score(pairs, X)
+
+    for table in sorted(SQL_AVG_TABLES):
+        short = table[:-len('_tabla')]
+        cases[f'db.avg_query.{short}'] = cycling(
+            lambda l, v, table=table: avg_query(connection, table, l, v, fecha_corte))
+        cases[f'db.aggregate_lookup.{short}'] = cycling(
+            lambda l, v, table=table: aggregate_lookup(connection, table, l, v, fecha_corte))
+        cases[f'store.average.{short}'] = cycling(
+            lambda l, v, table=table: store.average(table, l, v, fecha_corte))
+    cases['store.enfrentamiento_stats'] = cycling(store.enfrentamiento_stats)
+
+    # Respuestas representativas para medir la serialización
+    if models is not None:
+        pairs, X = batches['resultado']
+        goles_local, goles_visitante = app.score_results(X[:1])
+        result = app.build_goals_prediction(float(goles_local[0]), float(goles_visitante[0]),
+                                            models.resultados['feature_columns'].tolist(),
+                                            models, models.versions['resultado'])
+        response = app.build_result_response(result, fecha_corte)
+        cases['json.predict'] = lambda: app.app.json.dumps(response)
+
+        historicos = app.build_historical_response(data['resultado'][pair], data['corners'][pair],
+                                                   store.enfrentamiento_stats(*pair))
+        response_all = dict(response, historicos=historicos)
+        cases['json.predict_all'] = lambda: app.app.json.dumps(response_all)
+
+        predicciones = [{'equipo_local_id': l, 'equipo_visitante_id': v, 'as_of': fecha_corte,
+                         'resultado': {key: value for key, value in result.items() if key != 'features_used'}}
+                        for l, v in all_pairs]
+        batch_response = {'total': len(predicciones), 'con_errores': 0, 'predicciones': predicciones}
+        cases[f'json.predict_batch{len(predicciones)}'] = lambda: app.app.json.dumps(batch_response)
+
+    return cases
+
+
+def measure(fn, repeat):
+    """Tiempo por llamada (mediana y mínimo de `repeat` rondas) en microsegundos"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, number // 4)
+    rounds = [elapsed / number * 1e6 for elapsed in timer.repeat(repeat, number)]
+    return {'median_us': statistics.median(rounds), 'min_us': min(rounds), 'number': number}
+
+
+def compare(results, baseline, threshold):
+    """
+    Lista de (nombre, actual, base, cambio) de los benchmarks que empeoraron
+    más que el umbral. Deben empeorar la mediana y el mínimo, para que una
+    ronda ruidosa aislada no cuente como regresión.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        change = result['median_us'] / base['median_us'] - 1
+        if change > threshold and result['min_us'] / base['min_us'] - 1 > threshold:
+            regressions.append((name, result['median_us'], base['median_us'], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks del pipeline de predicción')
+    parser.add_argument('--repeat', type=int, default=7, help='rondas por benchmark (por defecto 7)')
+    parser.add_argument('--filter', help='medir solo los benchmarks cuyo nombre contenga este texto')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help=f'archivo de resultados ({DEFAULT_OUTPUT})')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help=f'línea base ({DEFAULT_BASELINE})')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='empeoramiento máximo tolerado de la mediana (0.25 = 25%%)')
+    parser.add_argument('--update-baseline', action='store_true', help='guardar los resultados como línea base')
+    args = parser.parse_args()
+
+    app.wait_for_models()
+    connection = load_standin_db()
+    store = load_standin_store(connection)
+    cases = build_cases(store, connection)
+    if args.filter:
+        cases = {name: fn for name, fn in cases.items() if args.filter in name}
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    print(f"{'benchmark':<40} {'mediana':>12} {'mínimo':>12} {'base':>12}")
+    for name, fn in cases.items():
+        results[name] = measure(fn, args.repeat)
+        base = baseline.get(name, {}).get('median_us')
+        base_text = f"{base:>10.1f}us" if base else f"{'-':>12}"
+        print(f"{name:<40} {results[name]['median_us']:>10.1f}us {results[name]['min_us']:>10.1f}us {base_text}")
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'results': results,
+    }
+    path = args.baseline if args.update_baseline else args.output
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados guardados en {path}")
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, current, base, change in regressions:
+        print(f"REGRESIÓN {name}: {current:.1f}us frente a {base:.1f}us (+{change:.0%})")
+    if regressions:
+        return 1
+    if baseline:
+        print(f"Sin regresiones mayores al {args.threshold:.0%} respecto a {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""
+Pool de conexiones PostgreSQL compartido por todas las consultas del servidor
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+
+def db_config_from_env():
+    """Parámetros de conexión a PostgreSQL leídos de las variables de entorno (.env)"""
+    return {
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'user': os.getenv('DB_USER', 'user'),
+        'password': os.getenv('DB_PASSWORD', 'ups_bet05'),
+        'database': os.getenv('DB_NAME', 'UPS_BET'),
+        'port': int(os.getenv('DB_PORT', 5432))
+    }
+
+
+class PostgresPool:
+    """
+    Pool de conexiones thread-safe con tamaño mínimo/máximo configurable.
+
+    Las conexiones se prestan con get() y se devuelven con put(). Antes de
+    prestar una conexión que lleva tiempo inactiva se verifica con SELECT 1;
+    si falla se descarta y se abre una nueva (con reintentos). Las conexiones
+    por encima de minconn que llevan más de idle_timeout segundos sin usarse
+    se cierran al devolver o pedir una conexión (idle_timeout=0 las mantiene
+    abiertas).
+
+    El pool detecta cuándo se usa en un proceso hijo (fork de un servidor
+    pre-fork) y empieza vacío: las conexiones del padre no se comparten.
+    """
+
+    def __init__(self, db_config, minconn=1, maxconn=10, timeout=5.0,
+                 health_check_interval=30.0, connect_retries=3, retry_delay=0.5,
+                 idle_timeout=300.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Tamaño de pool inválido: min={minconn}, max={maxconn}")
+
+        self.db_config = db_config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.idle_timeout = idle_timeout
+        self.connect_retries = connect_retries
+        self.retry_delay = retry_delay
+
+        self._lock = threading.Condition()
+        self._idle = deque()          # (conexion, instante de último uso)
+        self._in_use = set()
+        self._opened = 0              # conexiones vivas (prestadas + inactivas)
+        self._pid = os.getpid()
+        self._inherited = []          # conexiones del proceso padre, nunca usadas ni cerradas
+        self._stats = {
+            'borrows': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+            'connect_errors': 0,
+            'health_check_failures': 0,
+            'idle_closed': 0,
+        }
+
+    def check_pid(self):
+        """Si el proceso cambió (fork), olvidar el estado heredado del padre"""
+        pid = os.getpid()
+        if pid == self._pid:
+            return
+        # Cerrar una conexión heredada enviaría el cierre por el socket que
+        # sigue usando el padre, así que solo se guarda la referencia
+        self._inherited.extend(connection for connection, _ in self._idle)
+        self._lock = threading.Condition()
+        self._idle = deque()
+        self._in_use = set()
+        self._opened = 0
+        self._pid = pid
+
+    def _connect(self):
+        """Abrir una conexión nueva reintentando con espera creciente"""
+        last_error = None
+        for attempt in range(self.connect_retries):
+            try:
+                connection = psycopg2.connect(**self.db_config)
+                with self._lock:
+                    self._stats['connections_created'] += 1
+                return connection
+            except psycopg2.OperationalError as e:
+                last_error = e
+                with self._lock:
+                    self._stats['connect_errors'] += 1
+                if attempt + 1 < self.connect_retries:
+                    time.sleep(self.retry_delay * (2 ** attempt))
+        raise last_error
+
+    def _is_healthy(self, connection, last_used):
+        """Comprobar que una conexión inactiva sigue siendo utilizable"""
+        if connection.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            with self._lock:
+                self._stats['health_check_failures'] += 1
+            return False
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+            self._stats['connections_discarded'] += 1
+            self._lock.notify()
+
+    def close_expired(self):
+        """Cerrar las conexiones inactivas por encima de minconn que superaron idle_timeout"""
+        if self.idle_timeout <= 0:
+            return
+        expired = []
+        limit = time.monotonic() - self.idle_timeout
+        with self._lock:
+            # Las más antiguas están al principio: get() toma siempre la última devuelta
+            while (self._idle and self._idle[0][1] < limit
+                   and self._opened - len(expired) > self.minconn):
+                expired.append(self._idle.popleft()[0])
+            self._stats['idle_closed'] += len(expired)
+        for connection in expired:
+            self._discard(connection)
+
+    def fill(self):
+        """Abrir conexiones hasta alcanzar el tamaño mínimo del pool"""
+        self.check_pid()
+        while True:
+            with self._lock:
+                if self._opened >= self.minconn:
+                    return
+                self._opened += 1
+            try:
+                connection = self._connect()
+            except psycopg2.Error:
+                with self._lock:
+                    self._opened -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self._idle.append((connection, time.monotonic()))
+                self._lock.notify()
+
+    def get(self, timeout=None):
+        """
+        Tomar una conexión del pool. Espera hasta `timeout` segundos si todas
+        están en uso y lanza psycopg2.pool.PoolError si no se libera ninguna.
+        """
+        self.check_pid()
+        self.close_expired()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        started = time.monotonic()
+
+        while True:
+            with self._lock:
+                while not self._idle and self._opened >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise psycopg2.pool.PoolError(
+                            f"Pool agotado: {self.maxconn} conexiones en uso"
+                        )
+                    waited = True
+                    self._lock.wait(remaining)
+
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                else:
+                    connection, last_used = None, None
+                    self._opened += 1
+
+            if connection is None:
+                try:
+                    connection = self._connect()
+                except psycopg2.Error:
+                    with self._lock:
+                        self._opened -= 1
+                        self._lock.notify()
+                    raise
+            elif not self._is_healthy(connection, last_used):
+                # Conexión caída: se descarta y se vuelve a intentar
+                self._discard(connection)
+                continue
+
+            with self._lock:
+                self._in_use.add(id(connection))
+                self._stats['borrows'] += 1
+                if waited:
+                    self._stats['waits'] += 1
+                    self._stats['wait_time_total'] += time.monotonic() - started
+            return connection
+
+    def put(self, connection):
+        """Devolver una conexión al pool, descartándola si quedó inservible"""
+        self.check_pid()
+        with self._lock:
+            self._in_use.discard(id(connection))
+
+        if connection.closed:
+            self._discard(connection)
+            return
+
+        try:
+            # Cerrar cualquier transacción abierta por las consultas SELECT
+            status = connection.get_transaction_status()
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._discard(connection)
+                return
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except psycopg2.Error:
+            self._discard(connection)
+            return
+
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+            self._lock.notify()
+        self.close_expired()
+
+    def close_all(self):
+        """Cerrar todas las conexiones inactivas"""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def stats(self):
+        """Estadísticas de uso del pool"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'open': self._opened,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+            })
+        stats['avg_wait_ms'] = (
+            stats['wait_time_total'] * 1000 / stats['waits'] if stats['waits'] else 0.0
+        )
+        return stats
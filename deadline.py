@@ -0,0 +1,107 @@
+"""
+Plazos por petición
+
+Cada petición HTTP recibe un plazo (start()). Las etapas que pueden tardar
+lo consultan: el pool espera una conexión como mucho el tiempo restante,
+cada consulta a PostgreSQL lleva ese tiempo como `SET LOCAL
+statement_timeout` y la espera de los micro-lotes de inferencia también se
+acota. Al agotarse se lanza DeadlineExceeded; los lectores de promedios
+(last_known_good en app.py) responden entonces con los últimos datos
+buenos que tengan, envueltos en Degraded para que la respuesta se marque
+como degradada y no se guarde en la caché.
+
+El plazo vive en una variable de contexto, así que llega a los hilos que
+reciben el contexto de la petición (metrics.bind_request). Fuera de una
+petición (arranque, matriz de enfrentamientos) no hay plazo.
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# Plazos agotados por endpoint y etapa, para ajustar los presupuestos
+EXPIRATIONS = metrics.Counter(
+    'upsbet_deadline_expirations_total',
+    'Plazos de petición agotados',
+    ['endpoint', 'stage']
+)
+
+
+class DeadlineExceeded(Exception):
+    """Se agotó el plazo de la petición en `stage`"""
+
+    status = 503
+    retry_after = 1
+    reason = 'plazo agotado'
+
+    def __init__(self, stage):
+        super().__init__(f'plazo de la petición agotado en {stage}')
+        self.stage = stage
+
+
+class Degraded(dict):
+    """Datos de respaldo (la última lectura buena) usados porque se agotó el plazo"""
+
+
+class _Budget:
+    def __init__(self, seconds, name):
+        self.name = name
+        self.expires = time.monotonic() + seconds
+
+
+_budget = contextvars.ContextVar('deadline', default=None)
+
+
+def start(seconds, name):
+    """Fijar el plazo de la petición actual (seconds <= 0 o None: sin plazo)"""
+    _budget.set(_Budget(seconds, name) if seconds and seconds > 0 else None)
+
+
+def clear():
+    _budget.set(None)
+
+
+@contextmanager
+def suspended(active=True):
+    """Ejecutar el bloque sin plazo si `active` (por ejemplo la predicción con datos de respaldo)"""
+    if not active:
+        yield
+        return
+    token = _budget.set(None)
+    try:
+        yield
+    finally:
+        _budget.reset(token)
+
+
+def remaining():
+    """Segundos que le quedan a la petición actual, o None si no tiene plazo"""
+    budget = _budget.get()
+    return None if budget is None else budget.expires - time.monotonic()
+
+
+def expired(stage):
+    """Contar un plazo agotado en `stage` y devolver la excepción para lanzarla"""
+    budget = _budget.get()
+    EXPIRATIONS.inc(budget.name if budget is not None else 'sin_plazo', stage)
+    return DeadlineExceeded(stage)
+
+
+def bound(timeout, stage):
+    """
+    El menor entre `timeout` (None: sin límite) y el tiempo restante; lanza
+    DeadlineExceeded si el plazo ya se agotó
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise expired(stage)
+    return left if timeout is None else min(timeout, left)
+
+
+def check(stage):
+    """Lanzar DeadlineExceeded si el plazo ya se agotó"""
+    bound(None, stage)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+UPSBet - Exportar los modelos a formatos nativos
+================================================
+Convierte los pickles de modelos/ a los formatos propios de cada librería
+(texto de LightGBM y JSON de XGBoost) y escribe modelos/manifest.json con
+las columnas del modelo de resultados, los parámetros del escalador de
+corners, el sha256 de cada archivo y el de los pickles de origen.
+
+Antes de escribir el manifest se comprueba que los modelos exportados
+predicen exactamente lo mismo que los pickles. El servidor usa los formatos
+nativos mientras los pickles de origen no cambien; si se reentrena un
+modelo hay que volver a ejecutar este script.
+
+Uso:
+    python export_models.py
+    python export_models.py --model-dir otra/carpeta
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from model_store import (MANIFEST, MANIFEST_FORMAT, NATIVE_FILES, PICKLES,
+                         file_sha256, load_models, native_loaders, run_loaders)
+
+
+def export(model_dir):
+    """Escribir los archivos nativos; devuelve el manifest (todavía sin guardar)"""
+    objects, info = load_models(model_dir, model_format='pickle')
+    resultados, corners, tarjetas, escalador = (objects[name] for name in PICKLES)
+
+    resultados['model_gl'].save_model(os.path.join(model_dir, 'resultado_goles_local.txt'))
+    resultados['model_gv'].save_model(os.path.join(model_dir, 'resultado_goles_visitante.txt'))
+    corners.save_model(os.path.join(model_dir, 'corners_totales.json'))
+    booster = tarjetas.booster_ if hasattr(tarjetas, 'booster_') else tarjetas
+    booster.save_model(os.path.join(model_dir, 'tarjetas_totales.txt'))
+
+    n_features = escalador.n_features_in_
+    return {
+        'format': MANIFEST_FORMAT,
+        'created_at': datetime.now().isoformat(),
+        'feature_columns': [str(col) for col in resultados['feature_columns']],
+        'equipos_dict': resultados.get('equipos_dict'),
+        'escalador': {
+            'mean': (escalador.mean_ if escalador.with_mean else np.zeros(n_features)).tolist(),
+            'scale': (escalador.scale_ if escalador.with_std else np.ones(n_features)).tolist(),
+        },
+        'types': info['types'],
+        'files': {name: file_sha256(os.path.join(model_dir, name)) for name in NATIVE_FILES},
+        'sources': {name: file_sha256(os.path.join(model_dir, name)) for name in PICKLES.values()},
+    }
+
+
+def verify(model_dir, manifest, rows=2000, seed=0):
+    """
+    Comparar las predicciones de los pickles y de los archivos nativos sobre
+    datos aleatorios. Devuelve la lista de artefactos que no coinciden.
+    """
+    originales, _ = load_models(model_dir, model_format='pickle')
+    nativos, _, _, _ = run_loaders(native_loaders(model_dir, manifest))
+
+    rng = np.random.default_rng(seed)
+    n_resultados = len(manifest['feature_columns'])
+    n_escalador = len(manifest['escalador']['mean'])
+    n_tarjetas = nativos['tarjetas'].num_feature()
+    X_resultados = rng.normal(size=(rows, n_resultados)) * 10
+    X_escalador = rng.normal(size=(rows, n_escalador)) * 10
+    X_corners = np.hstack([X_escalador, rng.integers(0, 23, size=(rows, 2))])
+    X_tarjetas = rng.normal(size=(rows, n_tarjetas)) * 10
+
+    checks = {
+        'resultados.model_gl': lambda m: m['resultados']['model_gl'].predict(X_resultados),
+        'resultados.model_gv': lambda m: m['resultados']['model_gv'].predict(X_resultados),
+        'resultados.feature_columns': lambda m: np.asarray(m['resultados']['feature_columns'].tolist()),
+        'corners': lambda m: m['corners'].predict(X_corners),
+        'tarjetas': lambda m: m['tarjetas'].predict(X_tarjetas),
+        'escalador': lambda m: m['escalador'].transform(X_escalador),
+    }
+    return [name for name, check in checks.items()
+            if not np.array_equal(check(originales), check(nativos))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exportar los modelos a formatos nativos')
+    parser.add_argument('--model-dir', default='modelos', help='carpeta de los modelos (por defecto modelos)')
+    args = parser.parse_args()
+
+    manifest = export(args.model_dir)
+    mismatches = verify(args.model_dir, manifest)
+    if mismatches:
+        print(f"Las predicciones no coinciden con los pickles: {', '.join(mismatches)}; no se escribe {MANIFEST}")
+        return 1
+
+    with open(os.path.join(args.model_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    for name in NATIVE_FILES:
+        path = os.path.join(args.model_dir, name)
+        print(f"{path:<45} {os.path.getsize(path):>9} bytes")
+    print(f"Predicciones idénticas a los pickles; manifest guardado en {os.path.join(args.model_dir, MANIFEST)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
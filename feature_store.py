@@ -0,0 +1,430 @@
+"""
+Almacén de características en memoria
+
+Carga al iniciar las tablas de características en arreglos NumPy indexados
+por (equipo_local_id, equipo_visitante_id) y responde los promedios de un
+enfrentamiento a cualquier fecha de corte (sumas acumuladas por fecha) sin
+consultar la base de datos. Un hilo en segundo plano
+compara periódicamente una huella de las tablas y las recarga si cambiaron.
+
+Las tablas también se pueden leer de un snapshot columnar (snapshot.py) en
+lugar de PostgreSQL; entonces la huella es la del archivo.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Columnas promediadas de cada tabla (mismo orden que las consultas AVG de app.py)
+RESULT_COLUMNS = [
+    'ataques_visitante', 'intentos_a_porteria_local', 'fuera_de_juego_local',
+    'posesion_local', 'corners_visitante', 'corners_local',
+    'tarjetas_amarillas_totales', 'ataques_peligrosos_local', 'ataques_local',
+    'faltas_local', 'posesion_visitante', 'atajadas_visitante',
+    'intentos_a_porteria_visitante', 'tiros_fuera_visitante',
+    'tarjetas_rojas_visitante', 'ataques_peligrosos_visitante',
+    'tarjetas_rojas_totales', 'tarjetas_rojas_local', 'tarjetas_amarillas_local',
+    'faltas_visitante', 'faltas_totales', 'tiros_fuera_local', 'tarjetas_totales',
+    'tarjetas_amarillas_visitante', 'tiros_esquina_totales', 'penales_visitante',
+    'tiros_a_puerta_visitante', 'tiros_bloqueados_visitante', 'tiros_a_puerta_local',
+    'fuera_de_juego_visitante', 'tiros_bloqueados_local', 'atajadas_local',
+    'penales_local'
+]
+
+CORNERS_COLUMNS = [
+    'consistencia_corners_local', 'corners_por_ataque_peligroso',
+    'corners_vs_rival_hist', 'diff_corners_equipo', 'diff_corners_local',
+    'diff_corners_visitante', 'local_avg_last3', 'local_avg_last5',
+    'visitante_avg_last3', 'visitante_avg_last5', 'local_corner_category',
+    'visitante_corner_category', 'diff_last3_vs_last5_local',
+    'diff_last3_vs_last5_visitante', 'tiros_bloqueados_local', 'last3_vs_media_liga'
+]
+
+TARJETAS_COLUMNS = [
+    'loc_for_prev5', 'loc_against_prev5', 'loc_for_prev10', 'loc_against_prev10',
+    'vis_for_prev5', 'vis_against_prev5', 'vis_for_prev10', 'vis_against_prev10',
+    'diff_for_prev5', 'diff_against_prev5', 'diff_for_prev10', 'diff_against_prev10'
+]
+
+# Columnas de resultado_historico_tabla usadas en las estadísticas del enfrentamiento
+HISTORICO_COLUMNS = [
+    'posesion_local', 'posesion_visitante', 'corners_local', 'corners_visitante',
+    'goles_local', 'goles_visitante', 'tarjetas_totales', 'resultado_1x2'
+]
+
+TABLES = {
+    'ganador_resultado_tabla': RESULT_COLUMNS,
+    'corners_tabla': CORNERS_COLUMNS,
+    'tarjetas_tabla': TARJETAS_COLUMNS,
+    'resultado_historico_tabla': HISTORICO_COLUMNS,
+}
+
+# Tablas que la base de datos promedia con AVG; resultado_historico_tabla se
+# promedia en Python con los valores tal como llegan del cursor
+SQL_AVG_TABLES = {'ganador_resultado_tabla', 'corners_tabla', 'tarjetas_tabla'}
+
+# OID de PostgreSQL para REAL (float4)
+FLOAT4_OID = 700
+
+
+def parse_fecha(fecha):
+    """Convertir una fecha (texto 'YYYY-MM-DD' o date) a datetime64[D]"""
+    if fecha is None:
+        return None
+    if isinstance(fecha, str):
+        fecha = fecha[:10]
+    return np.datetime64(fecha, 'D')
+
+
+class MatchupIndex:
+    """
+    Sumas acumuladas de un enfrentamiento ordenadas por fecha.
+
+    sums[k] y counts[k] son la suma y la cantidad de valores no nulos de cada
+    columna en los primeros k partidos, así que el promedio de cualquier
+    ventana de fechas es una búsqueda binaria más una resta.
+    """
+
+    __slots__ = ('rows', 'fechas', 'sums', 'counts')
+
+    def __init__(self, rows, fechas, values):
+        valid = ~np.isnan(values)
+        self.rows = rows
+        self.fechas = fechas
+        self.sums = np.zeros((len(rows) + 1, values.shape[1]))
+        self.counts = np.zeros((len(rows) + 1, values.shape[1]), dtype=np.int64)
+        np.cumsum(np.where(valid, values, 0.0), axis=0, out=self.sums[1:])
+        np.cumsum(valid, axis=0, out=self.counts[1:])
+
+    @classmethod
+    def from_sums(cls, rows, fechas, sums, counts):
+        """Índice con las sumas acumuladas ya calculadas (por ejemplo las de un snapshot)"""
+        index = cls.__new__(cls)
+        index.rows = rows
+        index.fechas = fechas
+        index.sums = sums
+        index.counts = counts
+        return index
+
+    def position(self, fecha):
+        """Cantidad de partidos con fecha estrictamente anterior a `fecha`"""
+        if fecha is None:
+            return len(self.rows)
+        return int(np.searchsorted(self.fechas, fecha, side='left'))
+
+
+class TableData:
+    """
+    Columnas de una tabla como arreglos NumPy y su índice por enfrentamiento
+    (`index`: (local, visitante) -> MatchupIndex; se calcula si no se pasa)
+    """
+
+    def __init__(self, columns, local_ids, visitante_ids, fechas, values, index=None):
+        self.columns = columns
+        self.local_ids = local_ids
+        self.visitante_ids = visitante_ids
+        self.fechas = fechas
+        self.values = values
+        known = fechas[~np.isnat(fechas)]
+        self.max_fecha = known.max() if len(known) else None
+        if index is not None:
+            self.index = index
+            return
+
+        self.index = {}
+        # Filas de cada enfrentamiento ordenadas por fecha (las fechas nulas quedan al final)
+        order = np.argsort(fechas, kind='stable')
+        pairs = {}
+        for row in order:
+            key = (int(local_ids[row]), int(visitante_ids[row]))
+            pairs.setdefault(key, []).append(row)
+        for key, rows in pairs.items():
+            rows = np.array(rows, dtype=np.int64)
+            self.index[key] = MatchupIndex(rows, fechas[rows], values[rows])
+
+    def __len__(self):
+        return len(self.local_ids)
+
+    def matchup(self, equipo_local_id, equipo_visitante_id):
+        try:
+            return self.index.get((int(equipo_local_id), int(equipo_visitante_id)))
+        except (TypeError, ValueError):
+            return None
+
+    def rows(self, equipo_local_id, equipo_visitante_id, fecha_corte=None):
+        """Índices de las filas del enfrentamiento anteriores a la fecha de corte"""
+        matchup = self.matchup(equipo_local_id, equipo_visitante_id)
+        if matchup is None:
+            return np.empty(0, dtype=np.int64)
+        return matchup.rows[:matchup.position(fecha_corte)]
+
+    def average(self, equipo_local_id, equipo_visitante_id, fecha_corte=None, fecha_desde=None):
+        """
+        Promedio de cada columna ignorando nulos (igual que AVG en SQL) de los
+        partidos en [fecha_desde, fecha_corte). Devuelve None si no hay partidos.
+        """
+        matchup = self.matchup(equipo_local_id, equipo_visitante_id)
+        if matchup is None:
+            return None
+        hi = matchup.position(fecha_corte)
+        lo = matchup.position(fecha_desde) if fecha_desde is not None else 0
+        if hi <= lo:
+            return None
+
+        sums = matchup.sums[hi] - matchup.sums[lo]
+        counts = matchup.counts[hi] - matchup.counts[lo]
+        result = {
+            column: (float(sums[j] / counts[j]) if counts[j] else None)
+            for j, column in enumerate(self.columns)
+        }
+        result['num_partidos'] = hi - lo
+        return result
+
+
+class FeatureStore:
+    """
+    Tablas de características cargadas en memoria.
+
+    `source` es cualquier objeto con get()/put() que entregue conexiones
+    DB-API (por ejemplo el PostgresPool del servidor). Con use_snapshot()
+    las tablas se leen de un snapshot en lugar de la base de datos.
+    """
+
+    def __init__(self, source, tables=None):
+        self.source = source
+        self.table_columns = tables or TABLES
+        self.snapshot = None
+        self._tables = None
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._refresh_thread = None
+        self.version = 0
+        self.loaded_at = None
+        self.last_error = None
+
+    @property
+    def ready(self):
+        return self._tables is not None
+
+    def on_refresh(self, callback):
+        """Registrar una función que se llama después de cada recarga"""
+        self._listeners.append(callback)
+
+    def _read_table(self, cursor, table, columns):
+        cursor.execute(
+            f"SELECT equipo_local_id, equipo_visitante_id, fecha, {', '.join(columns)} FROM {table}"
+        )
+        type_codes = [d[1] for d in cursor.description[3:]]
+        rows = cursor.fetchall()
+
+        local_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        visitante_ids = np.array([r[1] for r in rows], dtype=np.int64)
+        fechas = np.array([parse_fecha(r[2]) if r[2] is not None else np.datetime64('NaT')
+                           for r in rows], dtype='datetime64[D]')
+        values = np.array([[np.nan if v is None else float(v) for v in r[3:]] for r in rows],
+                          dtype=np.float64).reshape(len(rows), len(columns))
+
+        # Las columnas REAL llegan como texto redondeado: volver a float4 para
+        # promediar exactamente los mismos valores que AVG en PostgreSQL
+        if table in SQL_AVG_TABLES:
+            for j, type_code in enumerate(type_codes):
+                if type_code == FLOAT4_OID:
+                    values[:, j] = values[:, j].astype(np.float32)
+
+        return TableData(columns, local_ids, visitante_ids, fechas, values)
+
+    def use_snapshot(self, snapshot):
+        """
+        Leer las tablas de `snapshot` (snapshot.SnapshotFile o cualquier objeto
+        con fingerprint() y read_tables(table_columns)) en lugar de la base de datos
+        """
+        self.snapshot = snapshot
+
+    def fingerprint(self):
+        """Huella del contenido de las tablas para detectar cambios"""
+        if self.snapshot is not None:
+            return self.snapshot.fingerprint()
+        connection = self.source.get()
+        try:
+            cursor = connection.cursor()
+            parts = []
+            for table in self.table_columns:
+                cursor.execute(
+                    f"SELECT COUNT(*), md5(string_agg(md5(t::text), '' ORDER BY md5(t::text))) FROM {table} t"
+                )
+                parts.append(cursor.fetchone())
+            cursor.close()
+            return tuple(parts)
+        finally:
+            self.source.put(connection)
+
+    def read_tables(self, connection):
+        """Leer todas las tablas con una conexión DB-API"""
+        cursor = connection.cursor()
+        try:
+            return {
+                table: self._read_table(cursor, table, columns)
+                for table, columns in self.table_columns.items()
+            }
+        finally:
+            cursor.close()
+
+    def load(self):
+        """Cargar (o recargar) todas las tablas desde la base de datos o el snapshot"""
+        if self.snapshot is not None:
+            self._load(lambda: self.snapshot.read_tables(self.table_columns))
+            return
+
+        def read():
+            fingerprint = self.fingerprint()
+            connection = self.source.get()
+            try:
+                return fingerprint, self.read_tables(connection)
+            finally:
+                self.source.put(connection)
+        self._load(read)
+
+    def load_from(self, connection):
+        """
+        Cargar las tablas con una conexión dada (por ejemplo una copia SQLite
+        de los dumps de data/). No guarda huella: no se usa con auto-refresco.
+        """
+        self._load(lambda: (None, self.read_tables(connection)))
+
+    def _load(self, read):
+        with self._lock:
+            started = time.perf_counter()
+            fingerprint, tables = read()
+
+            # Reemplazo atómico: las consultas en curso siguen usando la versión anterior
+            self._tables = tables
+            self._fingerprint = fingerprint
+            self.version += 1
+            self.loaded_at = datetime.now().isoformat()
+            self.last_error = None
+
+            elapsed = (time.perf_counter() - started) * 1000
+            logger.info("Almacén de características v%d cargado en %.0f ms: %s", self.version, elapsed,
+                        ", ".join(f"{t}={len(d)}" for t, d in tables.items()))
+
+        for callback in self._listeners:
+            callback(self)
+
+    def refresh_if_changed(self):
+        """Recargar las tablas solo si su contenido cambió. Devuelve True si recargó"""
+        if self.ready and self.fingerprint() == self._fingerprint:
+            return False
+        self.load()
+        return True
+
+    def start_auto_refresh(self, interval):
+        """
+        Verificar cambios cada `interval` segundos en un hilo en segundo plano.
+        Se puede volver a llamar tras un fork para lanzar el hilo en el hijo.
+        """
+        if interval <= 0 or (self._refresh_thread is not None and self._refresh_thread.is_alive()):
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh_if_changed()
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.error("Error actualizando el almacén de características: %s", e)
+
+        self._refresh_thread = threading.Thread(target=run, name='feature-store-refresh', daemon=True)
+        self._refresh_thread.start()
+
+    def table(self, name):
+        return self._tables[name]
+
+    def average(self, table, equipo_local_id, equipo_visitante_id, fecha_corte=None, fecha_desde=None):
+        """
+        Promedio de las columnas de un enfrentamiento con partidos anteriores a
+        fecha_corte: primero el cruce directo y, si no hay partidos, el inverso.
+        Devuelve None si no hay ninguno.
+        """
+        data = self._tables[table]
+        fecha_corte = parse_fecha(fecha_corte)
+        fecha_desde = parse_fecha(fecha_desde)
+        for local_id, visitante_id in ((equipo_local_id, equipo_visitante_id),
+                                       (equipo_visitante_id, equipo_local_id)):
+            result = data.average(local_id, visitante_id, fecha_corte, fecha_desde)
+            if result is not None:
+                return result
+        return None
+
+    def average_result(self, equipo_local_id, equipo_visitante_id, fecha_corte=None):
+        return self.average('ganador_resultado_tabla', equipo_local_id, equipo_visitante_id, fecha_corte)
+
+    def average_corners(self, equipo_local_id, equipo_visitante_id, fecha_corte=None):
+        return self.average('corners_tabla', equipo_local_id, equipo_visitante_id, fecha_corte)
+
+    def average_tarjetas(self, equipo_local_id, equipo_visitante_id, fecha_corte=None):
+        return self.average('tarjetas_tabla', equipo_local_id, equipo_visitante_id, fecha_corte)
+
+    def covers(self, fecha_corte, tables=SQL_AVG_TABLES):
+        """
+        True si todos los partidos de las tablas son anteriores a fecha_corte,
+        es decir, si filtrar por esa fecha da lo mismo que no filtrar.
+        """
+        if not self.ready:
+            return False
+        if fecha_corte is None:
+            return True
+        fecha_corte = parse_fecha(fecha_corte)
+        for name in tables:
+            max_fecha = self._tables[name].max_fecha
+            if max_fecha is not None and max_fecha >= fecha_corte:
+                return False
+        return True
+
+    def enfrentamiento_stats(self, equipo_local_id, equipo_visitante_id):
+        """Estadísticas del historial entre dos equipos (ambos sentidos)"""
+        data = self._tables['resultado_historico_tabla']
+        rows = np.concatenate([data.rows(equipo_local_id, equipo_visitante_id),
+                               data.rows(equipo_visitante_id, equipo_local_id)])
+        if not len(rows):
+            return None
+
+        col = {name: data.values[rows, j] for j, name in enumerate(data.columns)}
+        required = ['posesion_local', 'posesion_visitante', 'corners_local', 'corners_visitante',
+                    'goles_local', 'goles_visitante', 'tarjetas_totales']
+        if any(np.isnan(col[name]).any() for name in required):
+            # Mismo comportamiento que la consulta: sin estadísticas si faltan valores
+            return None
+
+        total_partidos = len(rows)
+        resultado = col['resultado_1x2']
+        return {
+            'total_partidos': total_partidos,
+            'posesion_local_promedio': float((col['posesion_local'] * 100).sum()) / total_partidos,
+            'posesion_visitante_promedio': float((col['posesion_visitante'] * 100).sum()) / total_partidos,
+            'corners_promedio': float((col['corners_local'] + col['corners_visitante']).sum()) / (total_partidos * 2),
+            'goles_promedio': float((col['goles_local'] + col['goles_visitante']).sum()) / (total_partidos * 2),
+            'tarjetas_promedio': float(col['tarjetas_totales'].sum()) / (total_partidos * 2),
+            'victorias_local': int((resultado == 1).sum()),
+            'victorias_visitante': int((resultado == 2).sum()),
+            'empates': int(total_partidos - (resultado == 1).sum() - (resultado == 2).sum())
+        }
+
+    def stats(self):
+        """Estado del almacén para /api/health"""
+        tables = self._tables or {}
+        return {
+            'loaded': self.ready,
+            'source': 'snapshot' if self.snapshot is not None else 'postgres',
+            'snapshot': self.snapshot.info() if self.snapshot is not None else None,
+            'version': self.version,
+            'loaded_at': self.loaded_at,
+            'rows': {name: len(data) for name, data in tables.items()},
+            'last_error': self.last_error
+        }
@@ -0,0 +1,87 @@
+"""
+Configuración de gunicorn para producción (Linux/macOS)
+
+    gunicorn app:app
+
+gunicorn lee este archivo automáticamente desde el directorio actual.
+El proceso maestro importa app.py una sola vez (preload_app): modelos,
+escalador, almacén de características y matriz de enfrentamientos quedan
+en memoria antes del fork y los workers los comparten copy-on-write.
+
+Variables de entorno:
+    WEB_BIND                 dirección de escucha (por defecto 0.0.0.0:5000)
+    WEB_WORKERS              procesos worker (por defecto uno por CPU)
+    WEB_THREADS              hilos por worker (por defecto 4)
+    WEB_MAX_REQUESTS         peticiones tras las que se recicla un worker (por defecto 5000, 0 = nunca)
+    WEB_TIMEOUT              segundos sin responder antes de reiniciar un worker (por defecto 30)
+    WEB_GRACEFUL_TIMEOUT     segundos para terminar las peticiones en curso al reiniciar (por defecto 30)
+
+Actualizaciones: solo el maestro vigila el almacén de características y la
+carpeta de modelos (app.start_master_refresh, cada FEATURE_STORE_REFRESH y
+MODEL_RELOAD_CHECK segundos). Cuando algo cambia lo recarga una vez y se
+envía a sí mismo SIGHUP: los workers nuevos se crean con la versión nueva y
+la comparten, y los workers reciclados por max_requests también nacen con
+ella. Los workers no tienen hilos de actualización propios.
+
+Señales:
+    kill -HUP <pid del maestro>   crea un juego completo de workers nuevos y
+                                  luego detiene los anteriores cuando terminan
+                                  sus peticiones. Con preload_app no vuelve a
+                                  importar app.py: los workers nuevos usan el
+                                  código y los datos que tiene el maestro
+    kill -USR2 <pid del maestro>  arranca un maestro nuevo (que importa de nuevo
+                                  app.py y carga los modelos) junto al actual;
+                                  cuando responda, kill -QUIT <pid del maestro
+                                  anterior> lo detiene. Es la forma de
+                                  desplegar código nuevo sin cortar peticiones
+"""
+
+import gc
+import multiprocessing
+import os
+import signal
+
+# Le indica a app.py que los workers no lanzan hilos de actualización (los
+# cambios los detecta el maestro, ver when_ready)
+os.environ['SERVER_PREFORK'] = '1'
+
+bind = os.getenv('WEB_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.getenv('WEB_THREADS', 4))
+worker_class = 'gthread'
+
+preload_app = True
+
+# Reciclar los workers para acotar el crecimiento de memoria; el jitter evita
+# que todos se reinicien a la vez
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+timeout = int(os.getenv('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# La línea por petición ya la escribe app.py (logging_config)
+accesslog = None
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+
+
+def when_ready(server):
+    import app
+    app.start_master_refresh(lambda: os.kill(os.getpid(), signal.SIGHUP))
+
+
+def pre_fork(server, worker):
+    import app
+    app.before_fork()
+    # Mover los objetos ya cargados a la generación permanente: el recolector
+    # no los vuelve a recorrer, así que no escribe en sus páginas y estas
+    # siguen compartidas entre el maestro y los workers
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import app
+    app.after_fork()
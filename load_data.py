@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+UPSBet - Carga masiva de datos con COPY
+=======================================
+Envía los CSV de data/ a PostgreSQL con COPY (en streaming, sin un INSERT
+por fila). Cada tabla se carga en su propia transacción.
+
+Modos:
+    upsert  (por defecto) actualiza los partidos que ya existen, identificados
+            por (equipo_local_id, equipo_visitante_id, fecha), e inserta los nuevos
+    replace vacía la tabla y la vuelve a cargar completa
+
+Uso:
+    python load_data.py
+    python load_data.py --mode replace
+    python load_data.py --tables tarjetas_tabla
+    python load_data.py --csv corners_tabla=data/corners_features.csv
+    python load_data.py --strict   # termina con error si alguna tabla no tiene CSV
+"""
+
+import argparse
+import csv
+import io
+import re
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+from db_pool import db_config_from_env
+
+# CSV de data/ cuyas columnas corresponden a una tabla. corners_tabla y
+# resultado_historico_tabla no tienen: ningún CSV trae sus columnas (a
+# ligaPro_corners_datos_prueba.csv le faltan las diff_corners_* y a los
+# ligapro_general_* los goles y el resultado), así que se cargan con sus
+# dumps SQL o con --csv; main() avisa de ellas en cada ejecución
+DEFAULT_SOURCES = {
+    'ganador_resultado_tabla': 'data/ligapro_train_for_goals.csv',
+    'tarjetas_tabla': 'data/dataset_final.csv',
+}
+
+# Dumps con el CREATE TABLE de cada tabla, usados si la tabla aún no existe
+SCHEMA_DUMPS = {
+    'corners_tabla': 'data/datos_tabla_corners.sql',
+    'ganador_resultado_tabla': 'data/datos_tabla_ganador_resultado.sql',
+    'resultado_historico_tabla': 'data/datos_tabla_historico_resultado.sql',
+    'tarjetas_tabla': 'data/datos_tabla_tarjetas.sql',
+}
+
+KEY_COLUMNS = ['equipo_local_id', 'equipo_visitante_id', 'fecha']
+
+INTEGER_TYPES = {'smallint', 'integer', 'bigint'}
+
+# Filas por bloque enviado a COPY
+CHUNK_ROWS = 1000
+
+
+class CsvStream:
+    """Objeto tipo archivo que va generando el texto CSV a medida que COPY lo lee"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def table_columns(cursor, table):
+    """Columnas de la tabla en orden, con su tipo; vacío si la tabla no existe"""
+    cursor.execute(
+        """
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position
+        """,
+        (table,)
+    )
+    return dict(cursor.fetchall())
+
+
+def create_table(cursor, table):
+    """Crear la tabla con la definición del dump SQL correspondiente"""
+    with open(SCHEMA_DUMPS[table], encoding='utf-8') as f:
+        match = re.search(rf'CREATE TABLE {table} \(.*?\);', f.read(), re.S)
+    if not match:
+        raise ValueError(f"No se encontró CREATE TABLE {table} en {SCHEMA_DUMPS[table]}")
+    cursor.execute(match.group(0))
+    print(f"Tabla {table} creada (ejecuta python migrate.py para aplicar las migraciones)")
+
+
+def csv_chunks(path, columns, integer_columns):
+    """
+    Leer el CSV y generar bloques de texto CSV con solo `columns`, en ese orden.
+    Los enteros escritos como '2.0' se normalizan a '2' para las columnas INTEGER.
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        # Si una columna está repetida en el CSV se usa la primera
+        positions = [header.index(col) for col in columns]
+        integers = [col in integer_columns for col in columns]
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        count = 0
+        for row in reader:
+            values = []
+            for position, is_integer in zip(positions, integers):
+                value = row[position].strip()
+                if is_integer and value.endswith('.0'):
+                    value = value[:-2]
+                values.append(value)
+            writer.writerow(values)
+            count += 1
+            if count % CHUNK_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+
+def load_table(connection, table, path, mode='upsert'):
+    """Cargar un CSV en una tabla dentro de una transacción. Devuelve estadísticas"""
+    started = time.perf_counter()
+    with open(path, encoding='utf-8', newline='') as f:
+        header = next(csv.reader(f))
+
+    with connection.cursor() as cursor:
+        types = table_columns(cursor, table)
+        if not types:
+            create_table(cursor, table)
+            types = table_columns(cursor, table)
+
+        columns = [col for col in types if col in header]
+        missing = [col for col in KEY_COLUMNS if col not in columns]
+        if missing:
+            raise ValueError(f"{path} no tiene las columnas {missing} necesarias para {table}")
+        absent = [col for col in types if col not in header]
+        if absent:
+            print(f"  Aviso: {path} no tiene {len(absent)} columnas de {table} ({', '.join(absent)}); "
+                  f"{'se dejan sin modificar' if mode == 'upsert' else 'quedan en NULL'}")
+
+        integer_columns = {col for col, data_type in types.items() if data_type in INTEGER_TYPES}
+        column_list = ', '.join(columns)
+        stream = CsvStream(csv_chunks(path, columns, integer_columns))
+        stats = {'table': table, 'source': path, 'inserted': 0, 'updated': 0}
+
+        if mode == 'replace':
+            cursor.execute(f"TRUNCATE {table}")
+            copy_started = time.perf_counter()
+            cursor.copy_expert(f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT csv)", stream)
+            stats['rows'] = stats['inserted'] = cursor.rowcount
+            stats['copy_ms'] = (time.perf_counter() - copy_started) * 1000
+            stats['merge_ms'] = 0.0
+        else:
+            staging = f"carga_{table}"
+            cursor.execute(f"CREATE TEMP TABLE {staging} (LIKE {table}) ON COMMIT DROP")
+            copy_started = time.perf_counter()
+            cursor.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)", stream)
+            stats['rows'] = cursor.rowcount
+            stats['copy_ms'] = (time.perf_counter() - copy_started) * 1000
+
+            merge_started = time.perf_counter()
+            key_match = ' AND '.join(f"t.{col} IS NOT DISTINCT FROM s.{col}" for col in KEY_COLUMNS)
+            # Una fila por partido: si el CSV repite la clave gana la última línea
+            # (en la tabla temporal recién cargada el ctid sigue el orden del COPY)
+            key_list = ', '.join(KEY_COLUMNS)
+            latest = f"(SELECT DISTINCT ON ({key_list}) * FROM {staging} ORDER BY {key_list}, ctid DESC) s"
+            values = [col for col in columns if col not in KEY_COLUMNS]
+            if values:
+                cursor.execute(f"""
+                    UPDATE {table} t
+                    SET {', '.join(f'{col} = s.{col}' for col in values)}
+                    FROM {latest}
+                    WHERE {key_match}
+                      AND ({', '.join(f't.{col}' for col in values)})
+                          IS DISTINCT FROM ({', '.join(f's.{col}' for col in values)})
+                """)
+                stats['updated'] = cursor.rowcount
+            cursor.execute(f"""
+                INSERT INTO {table} ({column_list})
+                SELECT {', '.join(f's.{col}' for col in columns)} FROM {latest}
+                WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {key_match})
+            """)
+            stats['inserted'] = cursor.rowcount
+            stats['merge_ms'] = (time.perf_counter() - merge_started) * 1000
+
+        cursor.execute(f"ANALYZE {table}")
+    connection.commit()
+    stats['total_ms'] = (time.perf_counter() - started) * 1000
+    return stats
+
+
+def parse_sources(args):
+    sources = dict(DEFAULT_SOURCES)
+    for item in args.csv or []:
+        table, _, path = item.partition('=')
+        if not path or table not in SCHEMA_DUMPS:
+            raise SystemExit(f"--csv debe tener la forma tabla=ruta.csv con tabla en {sorted(SCHEMA_DUMPS)}")
+        sources[table] = path
+    if args.tables:
+        unknown = [table for table in args.tables if table not in sources]
+        if unknown:
+            raise SystemExit(f"Sin CSV configurado para {unknown}; usa --csv tabla=ruta.csv")
+        sources = {table: sources[table] for table in args.tables}
+    return sources
+
+
+def tables_without_source(args, sources):
+    """Tablas que una carga completa (sin --tables) dejaría sin cargar"""
+    if args.tables:
+        return []
+    return [table for table in SCHEMA_DUMPS if table not in sources]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Carga masiva de CSV en PostgreSQL con COPY')
+    parser.add_argument('--mode', choices=['upsert', 'replace'], default='upsert')
+    parser.add_argument('--tables', nargs='+', help='cargar solo estas tablas')
+    parser.add_argument('--csv', action='append', metavar='TABLA=RUTA',
+                        help='CSV para una tabla (se puede repetir)')
+    parser.add_argument('--strict', action='store_true',
+                        help='terminar con error si alguna tabla no tiene CSV')
+    args = parser.parse_args()
+    sources = parse_sources(args)
+    unsourced = tables_without_source(args, sources)
+    if unsourced:
+        print(f"AVISO: sin CSV para {', '.join(unsourced)}: estas tablas NO se cargan y conservan "
+              f"los datos que tengan (dumps SQL de data/); usa --csv tabla=ruta.csv", file=sys.stderr)
+        if args.strict:
+            return 1
+
+    load_dotenv()
+    try:
+        connection = psycopg2.connect(**db_config_from_env())
+    except psycopg2.Error as e:
+        print(f"Error conectando a la base de datos: {e}")
+        return 1
+
+    started = time.perf_counter()
+    failed = 0
+    try:
+        for table, path in sources.items():
+            print(f"Cargando {path} -> {table} ({args.mode})...")
+            try:
+                stats = load_table(connection, table, path, args.mode)
+            except (psycopg2.Error, OSError, ValueError) as e:
+                connection.rollback()
+                failed += 1
+                print(f"  Error cargando {table}: {e}")
+                continue
+            print(f"  {stats['rows']} filas leídas, {stats['inserted']} insertadas, "
+                  f"{stats['updated']} actualizadas | COPY {stats['copy_ms']:.0f} ms, "
+                  f"merge {stats['merge_ms']:.0f} ms, total {stats['total_ms']:.0f} ms")
+    finally:
+        connection.close()
+
+    print(f"Carga terminada en {(time.perf_counter() - started) * 1000:.0f} ms "
+          f"({len(sources) - failed}/{len(sources)} tablas)")
+    if unsourced:
+        print(f"AVISO: tablas sin cargar por no tener CSV: {', '.join(unsourced)}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+UPSBet - Prueba de carga con tráfico de día de partido
+======================================================
+Envía peticiones a todos los endpoints /api/* con una distribución de
+enfrentamientos parecida a la de una jornada: unos pocos clásicos concentran
+gran parte del tráfico y el resto se reparte entre todos los cruces.
+
+Cada hilo trabaja en bucle cerrado (envía la siguiente petición al recibir
+la respuesta). Al terminar se muestran el throughput y las latencias p50,
+p95 y p99 por endpoint y se guarda un informe JSON comparable entre corridas.
+
+Destinos:
+    --url http://localhost:5000   servidor ya levantado (con su PostgreSQL)
+    --standin                     levanta app.py en este proceso con los datos de
+                                  una copia SQLite en memoria de data/ (sin PostgreSQL).
+                                  Cliente y servidor comparten el proceso: compara
+                                  solo informes obtenidos en el mismo modo
+
+Uso:
+    python loadtest.py --standin --duration 30 --concurrency 16
+    python loadtest.py --url http://localhost:5000 --derby-share 0.7 --output antes.json
+    python loadtest.py --standin --compare antes.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import requests
+
+# Mismos IDs que EQUIPOS_LIGAPRO en app.py
+EQUIPOS = [0, 2, 4, 5, 6, 7, 8, 9, 10, 12, 13, 14, 15, 17, 20, 22]
+
+# Clásicos: Barcelona-Emelec, LDU-Aucas, LDU-El Nacional, IDV-LDU, El Nacional-Aucas, Barcelona-LDU
+DERBIES = [(0, 4), (5, 12), (5, 2), (7, 5), (2, 12), (0, 5)]
+
+# Peso relativo de cada endpoint en la mezcla de tráfico
+DEFAULT_MIX = {
+    'predict-all': 40,
+    'predict': 20,
+    'predict-corners': 10,
+    'predict-tarjetas': 10,
+    'historical-data': 10,
+    'predict-batch': 4,
+    'matchup-matrix': 3,
+    'health': 3,
+}
+
+GET_ENDPOINTS = {'matchup-matrix', 'health'}
+
+
+class TrafficModel:
+    """Elige endpoint, enfrentamiento y fecha de cada petición"""
+
+    def __init__(self, mix, derby_share, dated_share, seed=None):
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.derby_share = derby_share
+        self.dated_share = dated_share
+        self.pairs = [(l, v) for l in EQUIPOS for v in EQUIPOS if l != v]
+        self.random = random.Random(seed)
+
+    def pair(self):
+        if self.random.random() < self.derby_share:
+            local_id, visitante_id = self.random.choice(DERBIES)
+            # Los clásicos se juegan en las dos canchas
+            return (local_id, visitante_id) if self.random.random() < 0.5 else (visitante_id, local_id)
+        return self.random.choice(self.pairs)
+
+    def fecha(self):
+        """Fecha explícita (consulta de una jornada pasada) o None (hoy)"""
+        if self.random.random() >= self.dated_share:
+            return None
+        return f"{self.random.randint(2021, 2025)}-{self.random.randint(1, 12):02d}-{self.random.randint(1, 28):02d}"
+
+    def jornada(self):
+        """8 partidos sin equipos repetidos, como una fecha del campeonato"""
+        equipos = self.random.sample(EQUIPOS, len(EQUIPOS))
+        return [{'equipo_local_id': equipos[i], 'equipo_visitante_id': equipos[i + 1]}
+                for i in range(0, len(equipos), 2)]
+
+    def next_request(self):
+        """(endpoint, método, cuerpo JSON)"""
+        endpoint = self.random.choices(self.endpoints, self.weights)[0]
+        if endpoint in GET_ENDPOINTS:
+            return endpoint, 'GET', None
+        if endpoint == 'predict-batch':
+            body = {'partidos': self.jornada()}
+        else:
+            local_id, visitante_id = self.pair()
+            body = {'equipo_local_id': local_id, 'equipo_visitante_id': visitante_id}
+        fecha = self.fecha()
+        if fecha:
+            body['fecha'] = fecha
+        return endpoint, 'POST', body
+
+
+def start_standin_server():
+    """Levantar app.py en un hilo sirviendo desde la copia SQLite. Devuelve la URL"""
+    for name, value in (('FEATURE_STORE', '0'), ('AGGREGATE_TABLES', '0'),
+                        ('LOG_LEVEL', 'WARNING'), ('DB_POOL_MIN', '0'), ('SERVER_TASKS', '0')):
+        os.environ.setdefault(name, value)
+    from werkzeug.serving import make_server
+
+    import app
+    from sqlite_standin import load_standin_db, load_standin_store
+
+    load_standin_store(load_standin_db(), app.feature_store)
+    # Con SERVER_TASKS=0 el import no lanza los hilos: se lanzan ya con los datos cargados
+    app.start_background_threads()
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+
+    # Esperar a que la matriz de enfrentamientos termine de construirse
+    for _ in range(300):
+        if not app.matchup_matrix.last_error and (app.matchup_matrix.ready or os.getenv('MATCHUP_MATRIX') == '0'):
+            break
+        time.sleep(0.1)
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def run_worker(base_url, traffic, deadline, remaining, samples, lock, timeout):
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        with lock:
+            if remaining[0] is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            endpoint, method, body = traffic.next_request()
+        started = time.perf_counter()
+        try:
+            response = session.request(method, f"{base_url}/api/{endpoint}", json=body, timeout=timeout)
+            status = response.status_code
+        except requests.RequestException:
+            status = 0
+        elapsed = time.perf_counter() - started
+        samples.append((endpoint, status, elapsed))
+
+
+def run_load(base_url, traffic, concurrency, duration, total_requests, timeout):
+    """Lanzar los hilos y devolver (muestras, segundos transcurridos)"""
+    samples = []
+    lock = threading.Lock()
+    remaining = [total_requests]
+    deadline = time.monotonic() + duration
+    started = time.perf_counter()
+    workers = [
+        threading.Thread(target=run_worker, args=(base_url, traffic, deadline, remaining, samples, lock, timeout))
+        for _ in range(concurrency)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    """Throughput y percentiles por endpoint (los errores HTTP 5xx y de red cuentan como error)"""
+    def stats(rows):
+        latencies = np.array([row[2] for row in rows]) * 1000
+        return {
+            'requests': len(rows),
+            'errors': sum(1 for row in rows if row[1] == 0 or row[1] >= 500),
+            'rejected': sum(1 for row in rows if row[1] in (429, 503)),
+            'throughput_rps': len(rows) / elapsed if elapsed else 0.0,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'mean_ms': float(latencies.mean()),
+            'max_ms': float(latencies.max()),
+        }
+
+    by_endpoint = {}
+    for row in samples:
+        by_endpoint.setdefault(row[0], []).append(row)
+    return {
+        'total': stats(samples) if samples else {},
+        'endpoints': {name: stats(rows) for name, rows in sorted(by_endpoint.items())},
+    }
+
+
+def print_summary(summary, previous=None):
+    header = f"{'endpoint':<18} {'peticiones':>10} {'errores':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    print('-' * len(header))
+    rows = list(summary['endpoints'].items()) + [('TOTAL', summary['total'])]
+    for name, s in rows:
+        print(f"{name:<18} {s['requests']:>10} {s['errors']:>8} {s['throughput_rps']:>9.1f} "
+              f"{s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}")
+        if previous:
+            before = previous['total'] if name == 'TOTAL' else previous['endpoints'].get(name)
+            if before:
+                delta = lambda key: f"{(s[key] / before[key] - 1) * 100 if before[key] else 0:+.0f}%"
+                print(f"{'  vs anterior':<18} {'':>10} {'':>8} {delta('throughput_rps'):>9} "
+                      f"{delta('p50_ms'):>9} {delta('p95_ms'):>9} {delta('p99_ms'):>9}")
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name not in DEFAULT_MIX or not weight:
+            raise SystemExit(f"--mix debe tener la forma endpoint=peso,... con endpoint en {sorted(DEFAULT_MIX)}")
+        mix[name] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga de los endpoints /api/*')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', default='http://localhost:5000', help='servidor a probar')
+    target.add_argument('--standin', action='store_true', help='levantar app.py con la copia SQLite de data/')
+    parser.add_argument('--concurrency', type=int, default=8, help='hilos enviando peticiones (por defecto 8)')
+    parser.add_argument('--duration', type=float, default=20, help='segundos de prueba (por defecto 20)')
+    parser.add_argument('--requests', type=int, help='terminar tras este número de peticiones')
+    parser.add_argument('--warmup', type=int, default=50, help='peticiones previas no medidas (por defecto 50)')
+    parser.add_argument('--derby-share', type=float, default=0.6,
+                        help='fracción de peticiones sobre clásicos (por defecto 0.6)')
+    parser.add_argument('--dated-share', type=float, default=0.1,
+                        help='fracción de peticiones con fecha de corte pasada (por defecto 0.1)')
+    parser.add_argument('--mix', type=parse_mix, help='pesos por endpoint, p. ej. predict=5,predict-all=1')
+    parser.add_argument('--timeout', type=float, default=10, help='timeout por petición en segundos')
+    parser.add_argument('--seed', type=int, help='semilla para repetir la misma secuencia')
+    parser.add_argument('--output', default='loadtest_report.json', help='archivo del informe')
+    parser.add_argument('--compare', help='informe anterior con el que comparar')
+    args = parser.parse_args()
+
+    base_url = start_standin_server() if args.standin else args.url.rstrip('/')
+    traffic = TrafficModel(args.mix or DEFAULT_MIX, args.derby_share, args.dated_share, args.seed)
+
+    print(f"Destino: {base_url} | {args.concurrency} hilos | "
+          f"{args.requests or 'sin límite de'} peticiones | {args.duration:.0f} s como máximo")
+    if args.warmup:
+        run_load(base_url, traffic, min(args.concurrency, args.warmup), args.duration, args.warmup, args.timeout)
+
+    samples, elapsed = run_load(base_url, traffic, args.concurrency, args.duration, args.requests, args.timeout)
+    if not samples:
+        print("No se completó ninguna petición")
+        return 1
+    summary = summarize(samples, elapsed)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+    print_summary(summary, previous)
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'target': 'standin' if args.standin else base_url,
+        'config': {
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'requests': args.requests,
+            'derby_share': args.derby_share,
+            'dated_share': args.dated_share,
+            'mix': args.mix or DEFAULT_MIX,
+            'seed': args.seed,
+        },
+        'elapsed_s': elapsed,
+        **summary,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Informe guardado en {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+Configuración de logging del servidor
+
+Los módulos usan logging.getLogger(__name__). setup_logging() instala en el
+logger raíz un QueueHandler: el hilo de la petición solo encola el registro
+y un QueueListener en segundo plano lo formatea y lo escribe en stdout.
+
+Variables de entorno:
+    LOG_LEVEL        nivel mínimo (DEBUG, INFO, WARNING...), por defecto INFO
+    LOG_FORMAT       'json' (por defecto) o 'text'
+    LOG_SAMPLE_RATE  fracción de registros DEBUG que se conservan (0-1); la línea
+                     de cada petición (marcada con ACCESS_LOG) se escribe siempre
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Atributos propios de LogRecord; el resto son campos pasados con extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Atributo que marca la línea de log de cada petición: se pasa en extra
+# ({ACCESS_LOG: True}) y SamplingFilter no la descarta nunca. Empieza con _
+# para que JsonFormatter no lo escriba
+ACCESS_LOG = '_access_log'
+
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea con los campos pasados en extra"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Conservar solo una fracción de los registros DEBUG (el detalle de cada
+    etapa de la predicción). La línea de cada petición y los registros INFO
+    o superiores pasan siempre
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return (record.levelno >= logging.INFO or self.rate >= 1 or getattr(record, ACCESS_LOG, False)
+                or random.random() < self.rate)
+
+
+def setup_logging():
+    """Configurar el logger raíz (idempotente). Devuelve el QueueListener"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    level = os.getenv('LOG_LEVEL', 'INFO').upper()
+    if os.getenv('LOG_FORMAT', 'json') == 'text':
+        formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s')
+    else:
+        formatter = JsonFormatter()
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(float(os.getenv('LOG_SAMPLE_RATE', 1))))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+
+    # El servidor registra su propia línea por petición
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    _queue_handler = queue_handler
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Escribir los registros pendientes y detener el hilo de escritura"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def restart_after_fork():
+    """
+    Volver a lanzar el QueueListener en un proceso hijo. Los hilos no
+    sobreviven al fork: sin esto los registros se encolarían sin escribirse.
+    Se usa una cola nueva porque la heredada pudo quedar a medio usar.
+    """
+    global _listener
+    if _listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
@@ -0,0 +1,204 @@
+"""
+Matriz precalculada de predicciones para todos los cruces de equipos
+
+Con 16 equipos hay solo 240 enfrentamientos ordenados, así que se pueden
+predecir todos de una vez (un lote por modelo) y responder cada predicción
+individual con una búsqueda en un diccionario. La matriz se reconstruye
+cuando cambia su versión (datos de las tablas o archivos de modelos).
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class MatchupMatrix:
+    """
+    `build(partidos)` recibe la lista de cruces y devuelve una predicción por
+    cruce (mismo formato que predict_batch). `version()` devuelve una clave
+    que cambia cuando cambian los datos o los modelos.
+    """
+
+    CAMPOS = ('resultado', 'corners', 'tarjetas')
+
+    def __init__(self, equipos, build, version):
+        self.equipos = equipos
+        self._build = build
+        self._version = version
+        self._entries = None
+        self._built_version = None
+        self._generation = 0              # Aumenta con cada invalidate()
+        self._lock = threading.Lock()     # Reemplazo de la matriz
+        self._build_lock = threading.Lock()
+        self._watcher = None
+        self._builder = None
+        self.built_at = None
+        self.build_ms = None
+        self.builds = 0
+        self.hits = 0
+        self.misses = 0
+        self.last_error = None
+
+    @property
+    def ready(self):
+        return self._entries is not None
+
+    def pairs(self):
+        ids = sorted(self.equipos.values())
+        return [(local_id, visitante_id) for local_id in ids for visitante_id in ids
+                if local_id != visitante_id]
+
+    def rebuild(self):
+        """
+        Predecir todos los cruces y reemplazar la matriz. Si la matriz se
+        invalidó durante el cálculo, el resultado se descarta (quien la
+        invalidó lanza otra reconstrucción); si solo cambió la versión (por
+        ejemplo, terminaron de cargar los modelos) se vuelve a calcular
+        """
+        with self._build_lock:
+            with self._lock:
+                generation = self._generation
+            while True:
+                version = self._version()
+                started = time.perf_counter()
+                partidos = [{'equipo_local_id': local_id, 'equipo_visitante_id': visitante_id,
+                             'fecha_corte': None} for local_id, visitante_id in self.pairs()]
+                predicciones = self._build(partidos)
+                entries = {
+                    (p['equipo_local_id'], p['equipo_visitante_id']): p for p in predicciones
+                }
+                with self._lock:
+                    if generation != self._generation:
+                        logger.info("Matriz de enfrentamientos descartada: se invalidó durante el cálculo")
+                        return
+                    if version == self._version():
+                        self._entries = entries
+                        self._built_version = version
+                        break
+                logger.info("Matriz de enfrentamientos descartada: los datos o los modelos "
+                            "cambiaron durante el cálculo; se vuelve a calcular")
+            self.build_ms = (time.perf_counter() - started) * 1000
+            self.built_at = datetime.now().isoformat()
+            self.builds += 1
+            self.last_error = None
+            logger.info("Matriz de enfrentamientos construida: %d cruces en %.0f ms",
+                        len(predicciones), self.build_ms)
+
+    def invalidate(self):
+        """Descartar la matriz actual (las predicciones se calculan en vivo hasta reconstruirla)"""
+        with self._lock:
+            self._entries = None
+            self._built_version = None
+            self._generation += 1
+
+    def rebuild_in_background(self):
+        def run():
+            try:
+                self.rebuild()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error("Error construyendo la matriz de enfrentamientos: %s", e)
+        self._builder = threading.Thread(target=run, name='matchup-matrix-build', daemon=True)
+        self._builder.start()
+
+    def wait_for_build(self, timeout=None):
+        """Esperar a que termine la reconstrucción en segundo plano, si hay una"""
+        builder = self._builder
+        if builder is not None:
+            builder.join(timeout)
+
+    def is_stale(self):
+        return self._built_version != self._version()
+
+    def start_watcher(self, interval):
+        """
+        Reconstruir la matriz cuando cambie su versión, verificando cada `interval`
+        segundos. Se puede volver a llamar tras un fork para lanzar el hilo en el hijo.
+        """
+        if interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.is_stale():
+                        self.invalidate()
+                        self.rebuild()
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.error("Error actualizando la matriz de enfrentamientos: %s", e)
+
+        self._watcher = threading.Thread(target=run, name='matchup-matrix-watch', daemon=True)
+        self._watcher.start()
+
+    def get(self, equipo_local_id, equipo_visitante_id, campo):
+        """
+        Predicción precalculada de un cruce, o None si no existe, tuvo error o
+        la matriz es de una versión anterior de los datos o de los modelos
+        """
+        with self._lock:
+            entries, built_version = self._entries, self._built_version
+        if entries is None or built_version != self._version():
+            return None
+        if not all(isinstance(equipo_id, (int, float)) and not isinstance(equipo_id, bool)
+                   for equipo_id in (equipo_local_id, equipo_visitante_id)):
+            return None
+        entry = entries.get((equipo_local_id, equipo_visitante_id))
+        if entry is None or campo not in entry or 'error' in entry[campo]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[campo]
+
+    def as_dict(self):
+        """Matriz completa para /api/matchup-matrix"""
+        entries = self._entries or {}
+        ids = sorted(self.equipos.values())
+        nombres = {equipo_id: nombre for nombre, equipo_id in self.equipos.items()}
+
+        def matrix(campo, valor):
+            filas = []
+            for local_id in ids:
+                fila = []
+                for visitante_id in ids:
+                    prediccion = entries.get((local_id, visitante_id), {}).get(campo)
+                    fila.append(valor(prediccion) if prediccion and 'error' not in prediccion else None)
+                filas.append(fila)
+            return filas
+
+        # Versión del modelo con que se calculó cada campo (la llevan las predicciones)
+        model_versions = dict.fromkeys(self.CAMPOS)
+        for entry in entries.values():
+            for campo in self.CAMPOS:
+                if model_versions[campo] is None and 'model_version' in entry.get(campo, {}):
+                    model_versions[campo] = entry[campo]['model_version']
+
+        return {
+            'ready': self.ready,
+            'built_at': self.built_at,
+            'build_ms': self.build_ms,
+            'equipos': [{'id': equipo_id, 'nombre': nombres[equipo_id]} for equipo_id in ids],
+            'goles_local': matrix('resultado', lambda p: p['goles_local']['raw']),
+            'goles_visitante': matrix('resultado', lambda p: p['goles_visitante']['raw']),
+            'resultado_1x2': matrix('resultado', lambda p: p['resultado_1x2']),
+            'corners_totales': matrix('corners', lambda p: p['corners_totales']),
+            'tarjetas_totales': matrix('tarjetas', lambda p: p['tarjetas_totales']),
+            'model_versions': model_versions
+        }
+
+    def stats(self):
+        return {
+            'ready': self.ready,
+            'pairs': len(self._entries or {}),
+            'builds': self.builds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0,
+            'built_at': self.built_at,
+            'build_ms': self.build_ms,
+            'last_error': self.last_error
+        }
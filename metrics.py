@@ -0,0 +1,242 @@
+"""
+Métricas del servidor en formato de texto de Prometheus
+
+Cada petición acumula el tiempo que pasa en cada etapa del pipeline
+(conexión a la base de datos, consulta, armado de características,
+predicción, serialización...). Con esos tiempos se alimentan los
+histogramas de /metrics y la cabecera Server-Timing de la respuesta.
+
+Las etapas anidadas se registran con su tiempo exclusivo: si
+prepare_features consulta la base de datos, esa consulta se descuenta
+de prepare_features y queda en db_query.
+"""
+
+import contextvars
+import functools
+import math
+import threading
+import time
+
+# Límites de los buckets en segundos (de 100 µs a 10 s)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+class Counter:
+    """Contador monótono con etiquetas"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    """Histograma acumulativo con etiquetas y buckets fijos"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # etiquetas -> [conteos por bucket, suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, (list(counts), total, count))
+                            for labels, (counts, total, count) in self._series.items())
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _labels(self.labelnames, labels, [('le', _number(float(bound)))])
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            le = _labels(self.labelnames, labels, [('le', '+Inf')])
+            lines.append(f'{self.name}_bucket{le} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+def render_stats(name, documentation, stats, counters=(), labels=()):
+    """
+    Convertir un diccionario de estadísticas (como los de stats()) en
+    métricas: las claves de `counters` como contadores *_total y el resto
+    de valores numéricos como gauges. Se ignoran los valores no numéricos.
+    """
+    lines = []
+    label_text = _labels([key for key, _ in labels], [value for _, value in labels])
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, (int, float)):
+            continue
+        if key in counters:
+            metric = f'{name}_{key}' if key.endswith('_total') else f'{name}_{key}_total'
+            kind = 'counter'
+        else:
+            metric = f'{name}_{key}'
+            kind = 'gauge'
+        lines.append(f'# HELP {metric} {documentation}: {key}')
+        lines.append(f'# TYPE {metric} {kind}')
+        lines.append(f'{metric}{label_text} {_number(value)}')
+    return lines
+
+
+# Tiempo de cada etapa y de cada petición completa
+STAGE_SECONDS = Histogram(
+    'upsbet_stage_duration_seconds',
+    'Tiempo exclusivo de cada etapa del pipeline de predicción',
+    ['stage']
+)
+REQUEST_SECONDS = Histogram(
+    'upsbet_request_duration_seconds',
+    'Duración de las peticiones HTTP',
+    ['endpoint', 'method']
+)
+REQUESTS = Counter(
+    'upsbet_requests_total',
+    'Peticiones HTTP atendidas',
+    ['endpoint', 'method', 'status']
+)
+
+
+class RequestTimings:
+    """Tiempo acumulado por etapa durante una petición (compartido entre hilos)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self):
+        """Valor de la cabecera Server-Timing (duraciones en ms)"""
+        with self._lock:
+            stages = list(self.stages.items())
+        total = (time.perf_counter() - self.started) * 1000
+        parts = [f'{stage};dur={seconds * 1000:.3f}' for stage, seconds in stages]
+        parts.append(f'total;dur={total:.3f}')
+        return ', '.join(parts)
+
+
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+_active = threading.local()
+
+
+def start_request():
+    """Empezar a medir una petición en el contexto actual"""
+    timings = RequestTimings()
+    _request_timings.set(timings)
+    return timings
+
+
+def end_request():
+    _request_timings.set(None)
+
+
+def current_request():
+    return _request_timings.get()
+
+
+def bind_request(fn):
+    """
+    Envolver `fn` para ejecutarla en otro hilo (por ejemplo en un
+    ThreadPoolExecutor) sumando sus etapas a la petición actual
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+class stage:
+    """
+    Medir una etapa: `with stage('db_query'): ...` o `@stage('predict')`.
+    El tiempo de etapas anidadas en el mismo hilo se descuenta de la externa.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_active, 'stack', None)
+        if stack is None:
+            stack = _active.stack = []
+        # [nombre, inicio, tiempo de etapas hijas]
+        stack.append([self.name, time.perf_counter(), 0.0])
+        return self
+
+    def __exit__(self, *exc):
+        stack = _active.stack
+        name, started, children = stack.pop()
+        elapsed = time.perf_counter() - started
+        if stack:
+            stack[-1][2] += elapsed
+        exclusive = elapsed - children
+        STAGE_SECONDS.observe(exclusive, name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.add(name, exclusive)
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(self.name):
+                return fn(*args, **kwargs)
+        return wrapper
@@ -0,0 +1,138 @@
+"""
+Micro-lotes de inferencia: juntar las filas de peticiones concurrentes
+
+Cada modelo tiene un hilo de inferencia propio. Las peticiones dejan sus
+filas en la cola del modelo y esperan; el hilo toma lo que haya en la cola
+(hasta `max_batch` filas), hace un solo predict con todas y le devuelve a
+cada petición sus filas. Llamar al modelo una vez con 16 filas cuesta poco
+más que llamarlo con una, y un solo hilo por modelo evita que las
+peticiones compitan con los hilos internos de LightGBM y XGBoost.
+
+Si el lote anterior juntó más de una petición (hay concurrencia), antes de
+predecir se esperan hasta `window` segundos a que lleguen más filas. Con
+tráfico bajo los lotes son de una petición y no se espera nada.
+
+Las filas de dos versiones de modelos distintas (recarga en caliente) no
+se mezclan: cada lote se divide por versión.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def _rows(outputs, start, stop):
+    """Filas start:stop de la salida de un predict (un array o una tupla de arrays)"""
+    if isinstance(outputs, tuple):
+        return tuple(output[start:stop] for output in outputs)
+    return outputs[start:stop]
+
+
+class MicroBatcher:
+    """
+    `predict(features, row_args, models)` recibe la matriz de todas las
+    filas del lote, una lista por cada argumento por fila (por ejemplo los
+    IDs de los equipos) y la versión de los modelos, y devuelve un array (o
+    una tupla de arrays) con una fila por fila de entrada.
+    """
+
+    def __init__(self, name, predict, window=0.002, max_batch=64):
+        self.name = name
+        self._predict = predict
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._concurrent = False
+        self.batches = 0
+        self.requests = 0
+        self.rows = 0
+        self.largest_batch = 0
+        self.errors = 0
+
+    def submit(self, features, models, *row_args, timeout=None):
+        """
+        Predecir las filas de features en el próximo lote; bloquea hasta tener
+        el resultado o hasta `timeout` segundos (concurrent.futures.TimeoutError)
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._start()
+        future = Future()
+        self._queue.put((features, row_args, models, future))
+        return future.result(timeout)
+
+    def _start(self):
+        # Arranque perezoso: tras un fork el hilo del padre no existe en el hijo
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f'inferencia-{self.name}', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        """Esperar la primera petición y juntar las que lleguen según la ventana"""
+        batch = [self._queue.get()]
+        rows = len(batch[0][0])
+        deadline = time.perf_counter() + self.window if self._concurrent else None
+        while rows < self.max_batch:
+            try:
+                if deadline is None:
+                    item = self._queue.get_nowait()
+                else:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += len(item[0])
+        self._concurrent = len(batch) > 1
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for item in batch:
+                groups.setdefault(id(item[2]), []).append(item)
+            for items in groups.values():
+                self._execute(items)
+
+    def _execute(self, items):
+        models = items[0][2]
+        try:
+            features = items[0][0] if len(items) == 1 else np.vstack([item[0] for item in items])
+            row_args = [[value for item in items for value in item[1][k]] for k in range(len(items[0][1]))]
+            outputs = self._predict(features, row_args, models)
+        except Exception as e:
+            self.errors += 1
+            for item in items:
+                item[3].set_exception(e)
+            return
+
+        self.batches += 1
+        self.requests += len(items)
+        self.rows += len(features)
+        self.largest_batch = max(self.largest_batch, len(features))
+        start = 0
+        for item in items:
+            stop = start + len(item[0])
+            item[3].set_result(_rows(outputs, start, stop))
+            start = stop
+
+    def stats(self):
+        """Estadísticas de los lotes para /api/health y /metrics"""
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'rows': self.rows,
+            'avg_batch_rows': self.rows / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'errors': self.errors,
+            'window_ms': self.window * 1000,
+            'max_batch': self.max_batch
+        }
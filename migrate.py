@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+UPSBet - Migraciones del esquema de la base de datos
+=====================================================
+Aplica en orden las migraciones pendientes y registra cada versión en la
+tabla schema_version. El servidor comprueba esa versión al arrancar.
+
+Uso:
+    python migrate.py              # aplicar todas las migraciones pendientes
+    python migrate.py --status     # mostrar la versión actual y las pendientes
+    python migrate.py --target 1   # aplicar solo hasta la versión indicada
+"""
+
+import argparse
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+
+from aggregates import AGGREGATE_TABLES, aggregate_name
+from db_pool import db_config_from_env
+from feature_store import TABLES
+
+FEATURE_TABLES = list(TABLES)
+
+# Clave del bloqueo para que dos procesos no migren a la vez
+MIGRATION_LOCK_ID = 52006
+
+
+def column_type(cursor, table, column):
+    """Tipo de una columna (por ejemplo 'text' o 'date'), o None si no existe"""
+    cursor.execute(
+        """
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s
+        """,
+        (table, column)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def fecha_to_date(cursor):
+    """Convertir fecha de TEXT ('YYYY-MM-DD') a DATE"""
+    for table in FEATURE_TABLES:
+        if column_type(cursor, table, 'fecha') == 'text':
+            cursor.execute(
+                f"ALTER TABLE {table} ALTER COLUMN fecha TYPE DATE USING NULLIF(trim(fecha), '')::date"
+            )
+    # Las tablas de agregados guardan la fecha del último partido de cada cruce
+    for table in AGGREGATE_TABLES:
+        name = aggregate_name(table)
+        if column_type(cursor, name, 'fecha_max') == 'text':
+            cursor.execute(f"ALTER TABLE {name} ALTER COLUMN fecha_max TYPE DATE USING fecha_max::date")
+
+
+def composite_indexes(cursor):
+    """Índices (equipo_local_id, equipo_visitante_id, fecha) en las tablas de características"""
+    for table in FEATURE_TABLES:
+        if column_type(cursor, table, 'fecha') is None:
+            continue
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_enfrentamiento_idx "
+            f"ON {table} (equipo_local_id, equipo_visitante_id, fecha)"
+        )
+        cursor.execute(f"ANALYZE {table}")
+
+
+# (versión, descripción, función que recibe el cursor)
+MIGRATIONS = [
+    (1, 'Columna fecha como DATE en las tablas de características', fecha_to_date),
+    (2, 'Índices compuestos (equipo_local_id, equipo_visitante_id, fecha)', composite_indexes),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(connection):
+    """Versión del esquema registrada en la base de datos (0 si nunca se migró)"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass('schema_version')")
+        if cursor.fetchone()[0] is None:
+            return 0
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        return cursor.fetchone()[0]
+
+
+def migrate(connection, target=None):
+    """
+    Aplicar las migraciones pendientes hasta `target` (por defecto la última).
+    Cada migración corre en su propia transacción junto con su registro de versión.
+    Devuelve la lista de versiones aplicadas.
+    """
+    target = SCHEMA_VERSION if target is None else target
+    applied = []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    descripcion TEXT NOT NULL,
+                    aplicada_en TIMESTAMP NOT NULL DEFAULT now()
+                )
+                """
+            )
+            connection.commit()
+
+            version = current_version(connection)
+            for number, description, apply in MIGRATIONS:
+                if number <= version or number > target:
+                    continue
+                print(f"Aplicando migración {number}: {description}...")
+                try:
+                    apply(cursor)
+                    cursor.execute(
+                        "INSERT INTO schema_version (version, descripcion) VALUES (%s, %s)",
+                        (number, description)
+                    )
+                    connection.commit()
+                except psycopg2.Error:
+                    connection.rollback()
+                    raise
+                applied.append(number)
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            connection.commit()
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migraciones del esquema de UPSBet')
+    parser.add_argument('--status', action='store_true', help='mostrar la versión actual sin migrar')
+    parser.add_argument('--target', type=int, help='versión hasta la que migrar')
+    args = parser.parse_args()
+
+    load_dotenv()
+    try:
+        connection = psycopg2.connect(**db_config_from_env())
+    except psycopg2.Error as e:
+        print(f"Error conectando a la base de datos: {e}")
+        return 1
+
+    try:
+        version = current_version(connection)
+        connection.rollback()
+        print(f"Versión del esquema: {version} (última disponible: {SCHEMA_VERSION})")
+
+        if args.status:
+            for number, description, _ in MIGRATIONS:
+                estado = 'aplicada' if number <= version else 'pendiente'
+                print(f"  {number}. {description} [{estado}]")
+            return 0
+
+        applied = migrate(connection, args.target)
+        if applied:
+            print(f"Esquema actualizado a la versión {current_version(connection)}")
+        else:
+            print("No hay migraciones pendientes")
+        return 0
+    except psycopg2.Error as e:
+        print(f"Error aplicando migraciones: {e}")
+        return 1
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+Versiones de los modelos de modelos/ y recarga en caliente
+
+Cada carga de la carpeta produce un ModelSet: los cuatro artefactos, sus
+predictores compilados y la versión de cada modelo, que sale del sha256 de
+su contenido. Un ModelSet no se modifica nunca; para cambiar de versión se
+reemplaza entero (ModelManager.current), así que una petición que tomó
+`current` al empezar usa la misma versión hasta el final aunque entre
+tanto se cargue otra.
+
+ModelManager revisa cada `interval` segundos la firma de la carpeta
+(nombre, fecha de modificación y tamaño de cada archivo). Cuando cambia y
+se mantiene estable unos segundos (para no leer una copia a medias), carga
+la nueva versión en su propio hilo, la valida con una predicción de prueba
+y solo entonces la pone en `current`. Las peticiones nunca esperan la
+recarga; si la validación falla se sigue sirviendo la versión anterior.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import tree_predictor
+from model_store import load_models
+
+logger = logging.getLogger(__name__)
+
+# Campo de las respuestas -> (prefijo de la versión, artefactos que la determinan)
+VERSIONED_MODELS = {
+    'resultado': ('ligapro', ('resultados',)),
+    'corners': ('corners', ('corners', 'escalador')),
+    'tarjetas': ('tarjetas', ('tarjetas',)),
+}
+
+
+# Filas aleatorias con las que se compara cada predictor compilado con su modelo
+PARITY_ROWS = 256
+
+
+def directory_signature(model_dir):
+    """Firma de los archivos de model_dir (nombre, fecha de modificación y tamaño)"""
+    try:
+        return tuple(sorted(
+            (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+            for entry in os.scandir(model_dir) if entry.is_file()
+        ))
+    except OSError:
+        return ()
+
+
+def model_versions(sha256):
+    """Versión de cada modelo ('ligapro_3f9c0a1b2d4e', ...) a partir del sha256 de sus artefactos"""
+    versions = {}
+    for campo, (prefix, artifacts) in VERSIONED_MODELS.items():
+        digest = sha256[artifacts[0]] if len(artifacts) == 1 else hashlib.sha256(
+            ''.join(sha256[name] for name in artifacts).encode()).hexdigest()
+        versions[campo] = f'{prefix}_{digest[:12]}'
+    return versions
+
+
+def estimators(objects):
+    """Los cuatro ensambles por nombre (el mismo nombre que sus predictores compilados)"""
+    return {
+        'model_gl': objects['resultados']['model_gl'],
+        'model_gv': objects['resultados']['model_gv'],
+        'corners': objects['corners'],
+        'tarjetas': objects['tarjetas'],
+    }
+
+
+def predict_kwargs(model, threads):
+    """
+    Fijar el número de hilos de model: XGBoost lo guarda en el modelo
+    (n_jobs) y LightGBM lo recibe en cada predict (num_threads). Devuelve
+    los argumentos extra para predict. Con threads=0 se deja el valor por
+    defecto de la librería (todos los núcleos).
+    """
+    if threads <= 0:
+        return {}
+    if type(model).__module__.startswith('xgboost'):
+        if hasattr(model, 'set_params'):
+            model.set_params(n_jobs=threads)
+        else:
+            model.set_param('nthread', threads)
+        return {}
+    if type(model).__module__.startswith('lightgbm'):
+        return {'num_threads': threads}
+    return {}
+
+
+def build_tree_predictors(objects, parity_rows=PARITY_ROWS):
+    """
+    Predictores compilados de los cuatro ensambles; {} si alguno no se puede
+    compilar. Cada uno se compara antes con el predict de su modelo en
+    parity_rows filas aleatorias y se descarta si no coincide (ese modelo
+    sigue usando el predict de la librería)
+    """
+    started = time.perf_counter()
+    try:
+        models = estimators(objects)
+        predictors = {name: tree_predictor.from_model(model) for name, model in models.items()}
+        for predictor in predictors.values():
+            predictor.compile()
+    except Exception as e:
+        logger.warning("No se pudieron compilar los árboles (%s): se usa el predict de cada librería", e)
+        return {}
+    for seed, name in enumerate(list(predictors)):
+        try:
+            matches = all(tree_predictor.parity(predictors[name], models[name], parity_rows, seed))
+        except Exception as e:
+            logger.warning("No se pudo comprobar el predictor compilado de %s (%s): se usa el predict "
+                           "de la librería", name, e)
+            del predictors[name]
+            continue
+        if not matches:
+            logger.warning("El predictor compilado de %s no coincide con el modelo: se usa el predict "
+                           "de la librería", name)
+            del predictors[name]
+    logger.info("Árboles compilados y comprobados en %.0f ms (%s)", (time.perf_counter() - started) * 1000,
+                ', '.join(predictors) or 'ninguno')
+    return predictors
+
+
+class ModelSet:
+    """Modelos cargados de una versión de la carpeta (no se modifica)"""
+
+    def __init__(self, objects, info, predictors, signature, threads=0):
+        self.resultados = objects['resultados']
+        self.corners = objects['corners']
+        self.tarjetas = objects['tarjetas']
+        self.escalador = objects['escalador']
+        self.info = info
+        self.predictors = predictors
+        self.signature = signature
+        self.versions = model_versions(info['sha256'])
+        # Clave hashable para cachés y para la matriz de enfrentamientos
+        self.version = tuple(sorted(self.versions.items()))
+        self.loaded_at = datetime.now().isoformat()
+        self.threads = threads
+        self._estimators = estimators(objects)
+        self._predict_kwargs = {name: predict_kwargs(model, threads) for name, model in self._estimators.items()}
+
+    def predict(self, name, features):
+        """Predict de la librería del ensamble name ('model_gl', 'corners', ...) con los hilos configurados"""
+        return self._estimators[name].predict(features, **self._predict_kwargs[name])
+
+
+class ModelManager:
+    """
+    `validate(models)` recibe cada ModelSet recién cargado y debe lanzar una
+    excepción si no sirve (por ejemplo si una predicción de prueba falla).
+    `threads` es el número de hilos de LightGBM y XGBoost en cada predict
+    (0 para el valor por defecto de cada librería).
+    """
+
+    def __init__(self, model_dir, validate=None, compile_trees=True, settle=2.0, threads=0):
+        self.model_dir = model_dir
+        self.threads = threads
+        self._validate = validate
+        self.compile_trees = compile_trees
+        self.settle = settle
+        self.current = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._watcher = None
+        self._failed_signature = None
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_check = None
+        self.last_error = None
+
+    @property
+    def version(self):
+        """Versión de los modelos en uso (None si todavía no hay ninguna)"""
+        current = self.current
+        return current.version if current is not None else None
+
+    def on_reload(self, callback):
+        """Registrar una función que se llama después de reemplazar los modelos por otra versión"""
+        self._listeners.append(callback)
+
+    def load(self, signature=None):
+        """Cargar y validar la versión actual de la carpeta, sin ponerla en uso"""
+        if signature is None:
+            signature = directory_signature(self.model_dir)
+        objects, info = load_models(self.model_dir)
+        predictors = build_tree_predictors(objects) if self.compile_trees else {}
+        models = ModelSet(objects, info, predictors, signature, self.threads)
+        if self._validate is not None:
+            self._validate(models)
+        return models
+
+    def reload(self, if_changed=False):
+        """
+        Cargar la carpeta y, si la nueva versión pasa la validación, reemplazar
+        la actual. Devuelve el nuevo ModelSet, o None si la carga falló (o si
+        con if_changed=True los archivos son los de la versión actual).
+        """
+        with self._lock:
+            signature = directory_signature(self.model_dir)
+            previous = self.current
+            # Otra carga pudo terminar mientras se esperaba el lock
+            if if_changed and previous is not None and previous.signature == signature:
+                return None
+            try:
+                models = self.load(signature)
+            except Exception as e:
+                self._failed_signature = signature
+                self.failed_reloads += 1
+                self.last_error = str(e)
+                if previous is None:
+                    logger.exception("Error cargando modelos: %s", e)
+                else:
+                    logger.error("Nueva versión de modelos descartada, se siguen usando %s: %s",
+                                 ', '.join(previous.versions.values()), e)
+                return None
+
+            # Reemplazo atómico: las peticiones en curso terminan con la versión que tomaron
+            self.current = models
+            self._failed_signature = None
+            self.last_error = None
+            info = models.info
+            details = ', '.join(f"{name} {info['types'][name]} {info['load_ms'][name]:.0f} ms" for name in info['types'])
+            if previous is None:
+                logger.info("Modelos cargados en %.0f ms (formato %s): %s", info['total_ms'], info['format'], details,
+                            extra={'models_load_ms': info['load_ms'], 'models_format': info['format'],
+                                   'model_versions': models.versions})
+            else:
+                self.reloads += 1
+                logger.info("Modelos recargados en %.0f ms (formato %s): %s", info['total_ms'], info['format'],
+                            ', '.join(f'{previous.versions[campo]} -> {version}'
+                                      for campo, version in models.versions.items()),
+                            extra={'models_load_ms': info['load_ms'], 'models_format': info['format'],
+                                   'model_versions': models.versions})
+
+        if previous is not None:
+            for callback in self._listeners:
+                callback(models)
+        return models
+
+    def reload_if_changed(self):
+        """Recargar si cambiaron los archivos de la carpeta. Devuelve True si reemplazó los modelos"""
+        self.last_check = datetime.now().isoformat()
+        signature = directory_signature(self.model_dir)
+        current = self.current
+        if (current is not None and signature == current.signature) or signature == self._failed_signature:
+            return False
+        # Esperar a que termine la copia de los archivos nuevos
+        time.sleep(self.settle)
+        if directory_signature(self.model_dir) != signature:
+            return False
+        return self.reload(if_changed=True) is not None
+
+    def start_watcher(self, interval):
+        """
+        Buscar versiones nuevas cada `interval` segundos en un hilo en segundo
+        plano. Se puede volver a llamar tras un fork para lanzar el hilo en el hijo.
+        """
+        if interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.error("Error revisando la carpeta de modelos: %s", e)
+
+        self._watcher = threading.Thread(target=run, name='model-reload-watch', daemon=True)
+        self._watcher.start()
+
+    def stats(self):
+        """Estado de los modelos para /api/health"""
+        current = self.current
+        return {
+            'loaded': current is not None,
+            'versions': dict(current.versions) if current is not None else None,
+            'loaded_at': current.loaded_at if current is not None else None,
+            'reloads': self.reloads,
+            'failed_reloads': self.failed_reloads,
+            'threads': self.threads,
+            'last_check': self.last_check,
+            'last_error': self.last_error
+        }
@@ -0,0 +1,224 @@
+"""
+Carga de los modelos de predicción desde modelos/
+
+Los modelos existen en dos formatos:
+
+- los pickles del entrenamiento (modelo_ligapro.pkl, ...), que necesitan
+  pandas, scikit-learn y versiones compatibles de las librerías con que se
+  guardaron
+- los formatos nativos que genera export_models.py: texto de LightGBM, JSON
+  de XGBoost y un manifest.json con las columnas, el escalador y el sha256
+  de cada archivo
+
+Si manifest.json existe y sus pickles de origen no cambiaron desde la
+exportación se usan los formatos nativos; si no, los pickles. Los cuatro
+artefactos se cargan en paralelo y cada cargador importa su librería
+(lightgbm, xgboost, joblib) solo al usarla: importar este módulo no carga
+ninguna de ellas.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+MANIFEST_FORMAT = 1
+
+# Artefacto -> pickle original
+PICKLES = {
+    'resultados': 'modelo_ligapro.pkl',
+    'corners': 'prediccion_corners_totales.pkl',
+    'tarjetas': 'modelo_lightgbm_final.pkl',
+    'escalador': 'escalador_corners.pkl',
+}
+
+# Archivos nativos -> formato
+NATIVE_FILES = {
+    'resultado_goles_local.txt': 'lightgbm',
+    'resultado_goles_visitante.txt': 'lightgbm',
+    'corners_totales.json': 'xgboost',
+    'tarjetas_totales.txt': 'lightgbm',
+}
+
+
+class StandardScaler:
+    """(x - media) / desviación: el mismo cálculo que StandardScaler.transform de scikit-learn"""
+
+    def __init__(self, mean, scale):
+        self.mean_ = np.asarray(mean, dtype=float)
+        self.scale_ = np.asarray(scale, dtype=float)
+        self.n_features_in_ = len(self.mean_)
+
+    def transform(self, X):
+        X = np.array(X, dtype=float)
+        X -= self.mean_
+        X /= self.scale_
+        return X
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(model_dir):
+    """manifest.json de model_dir, o None si no existe"""
+    path = os.path.join(model_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != MANIFEST_FORMAT:
+        raise ValueError(f"{MANIFEST}: formato {manifest.get('format')!r} no soportado (se espera {MANIFEST_FORMAT})")
+    return manifest
+
+
+def stale_sources(model_dir, manifest):
+    """Pickles que cambiaron desde la exportación (los que no existen no cuentan)"""
+    stale = []
+    for name, digest in manifest['sources'].items():
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path) and file_sha256(path) != digest:
+            stale.append(name)
+    return stale
+
+
+def _native_path(model_dir, manifest, name):
+    """Ruta de un archivo nativo comprobando su sha256"""
+    path = os.path.join(model_dir, name)
+    if file_sha256(path) != manifest['files'][name]:
+        raise ValueError(f"{name}: el sha256 no coincide con {MANIFEST}")
+    return path
+
+
+def native_loaders(model_dir, manifest):
+    """Artefacto -> función que devuelve (objeto, tipo original, archivos)"""
+    def resultados():
+        import lightgbm
+        files = ['resultado_goles_local.txt', 'resultado_goles_visitante.txt']
+        model_gl, model_gv = (lightgbm.Booster(model_file=_native_path(model_dir, manifest, name)) for name in files)
+        modelo = {
+            'model_gl': model_gl,
+            'model_gv': model_gv,
+            'feature_columns': np.array(manifest['feature_columns'], dtype=object),
+            'equipos_dict': manifest['equipos_dict'],
+        }
+        return modelo, 'dict', files
+
+    def corners():
+        import xgboost
+        model = xgboost.XGBRegressor()
+        model.load_model(_native_path(model_dir, manifest, 'corners_totales.json'))
+        return model, manifest['types']['corners'], ['corners_totales.json']
+
+    def tarjetas():
+        import lightgbm
+        model = lightgbm.Booster(model_file=_native_path(model_dir, manifest, 'tarjetas_totales.txt'))
+        return model, manifest['types']['tarjetas'], ['tarjetas_totales.txt']
+
+    def escalador():
+        params = manifest['escalador']
+        return StandardScaler(params['mean'], params['scale']), manifest['types']['escalador'], [MANIFEST]
+
+    return {'resultados': resultados, 'corners': corners, 'tarjetas': tarjetas, 'escalador': escalador}
+
+
+def pickle_loaders(model_dir):
+    """Artefacto -> función que carga su pickle original"""
+    def loader(name):
+        def load():
+            path = os.path.join(model_dir, PICKLES[name])
+            if name == 'resultados':
+                import joblib
+                obj = joblib.load(path)
+            else:
+                import pickle
+                with open(path, 'rb') as f:
+                    obj = pickle.load(f)
+            return obj, type(obj).__name__, [PICKLES[name]]
+        return load
+    return {name: loader(name) for name in PICKLES}
+
+
+def run_loaders(loaders):
+    """Ejecutar los cargadores en paralelo; devuelve (objetos, tipos, archivos, ms por artefacto)"""
+    def timed(load):
+        started = time.perf_counter()
+        result = load()
+        return result, (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=len(loaders), thread_name_prefix='carga-modelos') as executor:
+        futures = {name: executor.submit(timed, load) for name, load in loaders.items()}
+        results = {name: future.result() for name, future in futures.items()}
+
+    objects, types, files, timings = {}, {}, {}, {}
+    for name, ((obj, type_name, names), elapsed_ms) in results.items():
+        objects[name] = obj
+        types[name] = type_name
+        files[name] = names
+        timings[name] = round(elapsed_ms, 1)
+    return objects, types, files, timings
+
+
+def load_models(model_dir='modelos', model_format=None):
+    """
+    Cargar los cuatro artefactos. Devuelve (objetos, info), donde objetos
+    tiene las claves de PICKLES e info el formato usado, el tipo original, los
+    archivos y el sha256 del pickle de origen de cada artefacto (el mismo con
+    los dos formatos) y los milisegundos de carga.
+    model_format='pickle' (o MODEL_FORMAT=pickle) ignora los formatos nativos.
+    """
+    started = time.perf_counter()
+    requested = model_format or os.getenv('MODEL_FORMAT', 'auto')
+    model_format = 'pickle'
+    loaders = None
+
+    if requested != 'pickle':
+        try:
+            manifest = read_manifest(model_dir)
+            stale = stale_sources(model_dir, manifest) if manifest else []
+            if manifest is None:
+                logger.info("Sin %s en %s: se cargan los pickles (python export_models.py los exporta)",
+                            MANIFEST, model_dir)
+            elif stale:
+                logger.warning("%s desactualizado (cambiaron %s): se cargan los pickles",
+                               MANIFEST, ', '.join(stale))
+            else:
+                loaders = native_loaders(model_dir, manifest)
+                model_format = 'native'
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("No se pudo leer %s (%s): se cargan los pickles", MANIFEST, e)
+
+    objects = None
+    sources = None
+    if loaders is not None:
+        try:
+            sources = {name: manifest['sources'][PICKLES[name]] for name in PICKLES}
+            objects, types, files, timings = run_loaders(loaders)
+        except Exception as e:
+            logger.warning("Error cargando los modelos nativos (%s): se cargan los pickles", e)
+            model_format = 'pickle'
+    if objects is None:
+        objects, types, files, timings = run_loaders(pickle_loaders(model_dir))
+        sources = {name: file_sha256(os.path.join(model_dir, PICKLES[name])) for name in PICKLES}
+
+    info = {
+        'format': model_format,
+        'types': types,
+        'files': {name: [os.path.join(model_dir, f) for f in names] for name, names in files.items()},
+        'sha256': sources,
+        'load_ms': timings,
+        'total_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+    return objects, info
+
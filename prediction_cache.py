@@ -0,0 +1,123 @@
+"""
+Caché en memoria de predicciones con expiración (TTL) y desalojo LRU
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LastValues:
+    """Último valor de cada clave, sin expiración, acotado a `maxsize` claves (LRU)"""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._values.get(key)
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+    def __len__(self):
+        return len(self._values)
+
+
+class PredictionCache:
+    """
+    Caché acotada a `maxsize` entradas que expiran a los `ttl` segundos.
+    Las claves deben incluir las versiones de datos y modelos con las que se
+    calculó la predicción; invalidate() vacía la caché cuando cambian.
+
+    Además se guarda el último valor de cada `stale_key` (una clave sin
+    versiones), que no expira ni se invalida: get_stale() lo devuelve cuando
+    el servidor está saturado y es preferible una predicción vieja a ninguna.
+    """
+
+    def __init__(self, maxsize=4096, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()   # clave -> (instante de expiración, valor)
+        self._stale = LastValues(maxsize)
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+            'stale_hits': 0,
+        }
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, key):
+        """Valor guardado para `key`, o None si no existe o expiró"""
+        if key is None or not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def put(self, key, value, stale_key=None):
+        if key is None or not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        if stale_key is not None:
+            self._stale.put(stale_key, value)
+
+    def get_stale(self, stale_key):
+        """Último valor guardado para `stale_key` aunque haya expirado o sea de otra versión, o None"""
+        if stale_key is None:
+            return None
+        value = self._stale.get(stale_key)
+        if value is not None:
+            with self._lock:
+                self._stats['stale_hits'] += 1
+        return value
+
+    def invalidate(self, *args):
+        """Vaciar la caché (acepta argumentos para usarse como listener)"""
+        with self._lock:
+            self._entries.clear()
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'size': len(self._entries),
+                'stale_size': len(self._stale),
+                'max_size': self.maxsize,
+                'ttl': self.ttl,
+            })
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -22,7 +22,7 @@ const equipos_dict = {
 
 //Configuración de rutas
 const ASSETS_BASE = "./img/";
-const API_ENDPOINT = "/api/predict"; 
+const API_ENDPOINT = "/api/predict-all"; 
 
 const NAME_TO_FILE = {
   "Barcelona SC": "Barcelona_Sporting_Club_Logo.png",
@@ -144,63 +144,18 @@ async function predict(){
       equipo_visitante_id: equipos_dict[awaySel.value]
     };
 
-    // Hacer predicción de resultado
-    const resResultado = await fetch("/api/predict", {
+    // Una sola petición: resultado, corners, tarjetas e historial
+    const res = await fetch(API_ENDPOINT, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify(payload)
     });
     
-    if(!resResultado.ok) {
-      throw new Error(`HTTP ${resResultado.status}`);
+    const combinedData = await res.json().catch(() => null);
+    if(!combinedData) {
+      throw new Error(`HTTP ${res.status}`);
     }
     
-    const dataResultado = await resResultado.json();
-    
-    // Hacer predicción de corners
-    const resCorners = await fetch("/api/predict-corners", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(payload)
-    });
-    
-    // Hacer predicción de tarjetas
-    const resTarjetas = await fetch("/api/predict-tarjetas", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(payload)
-    });
-    
-    // Obtener datos históricos
-    const resHistoricos = await fetch("/api/historical-data", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(payload)
-    });
-    
-    let dataCorners = null;
-    if(resCorners.ok) {
-      dataCorners = await resCorners.json();
-    }
-    
-    let dataTarjetas = null;
-    if(resTarjetas.ok) {
-      dataTarjetas = await resTarjetas.json();
-    }
-    
-    let dataHistoricos = null;
-    if(resHistoricos.ok) {
-      dataHistoricos = await resHistoricos.json();
-    }
-    
-    // Combinar resultados
-    const combinedData = {
-      ...dataResultado,
-      corners_data: dataCorners,
-      tarjetas_data: dataTarjetas,
-      historicos: dataHistoricos
-    };
-    
     renderResults(combinedData);
   } catch(e){
     console.error(e);
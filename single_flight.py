@@ -0,0 +1,112 @@
+"""
+Coalescencia de cálculos idénticos en curso (single flight)
+
+Cuando llegan a la vez varias peticiones iguales (el mismo cruce, fecha de
+corte y versiones de datos y modelos), la primera hace el cálculo y las
+demás esperan su resultado en lugar de repetir las consultas y la
+predicción. Si el cálculo lanza una excepción, la reciben todas; quien
+espera deja de hacerlo al agotarse el plazo de su petición (deadline.py)
+con DeadlineExceeded, sin cancelar el cálculo. Una vez terminado, la
+siguiente petición con la misma clave vuelve a calcular (o la resuelve la
+caché de predicciones).
+
+SingleFlight sirve para hilos (Flask, el executor de predicciones) y
+AsyncSingleFlight para corrutinas de un mismo event loop (asgi_app.py).
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import deadline
+
+
+class _Stats:
+    def __init__(self):
+        self._calls = {}   # clave -> futuro del cálculo en curso
+        self.calls = 0
+        self.shared = 0
+        self.errors = 0
+
+    def stats(self):
+        """Cálculos hechos, peticiones que esperaron uno en curso y errores"""
+        requests = self.calls + self.shared
+        return {
+            'calls': self.calls,
+            'shared': self.shared,
+            'errors': self.errors,
+            'in_flight': len(self._calls),
+            'shared_rate': self.shared / requests if requests else 0.0
+        }
+
+
+class SingleFlight(_Stats):
+    """Coalescencia entre hilos; con clave None se calcula sin coalescer"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        """Resultado de fn(*args), compartido con las llamadas simultáneas con la misma clave"""
+        if key is None:
+            return fn(*args)
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+            else:
+                self._calls[key] = leader = Future()
+                self.calls += 1
+        if future is not None:
+            # Quien espera no puede pasarse de su propio plazo, aunque el cálculo siga
+            try:
+                return future.result(timeout=deadline.bound(None, 'predict'))
+            except FutureTimeout:
+                raise deadline.expired('predict') from None
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            with self._lock:
+                del self._calls[key]
+                self.errors += 1
+            leader.set_exception(e)
+            raise
+        with self._lock:
+            del self._calls[key]
+        leader.set_result(result)
+        return result
+
+
+class AsyncSingleFlight(_Stats):
+    """Coalescencia entre corrutinas; con clave None se calcula sin coalescer"""
+
+    async def do(self, key, fn, *args):
+        """Resultado de await fn(*args), compartido con las llamadas simultáneas con la misma clave"""
+        if key is None:
+            return await fn(*args)
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            # shield: si se cancela una petición que espera, el cálculo sigue para las demás
+            return await asyncio.shield(future)
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self.calls += 1
+        try:
+            result = await fn(*args)
+        except BaseException as e:
+            self.errors += 1
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Marcar la excepción como leída si nadie más la esperaba
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
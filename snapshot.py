@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+UPSBet - Snapshot columnar de las tablas de características
+===========================================================
+Exporta ganador_resultado_tabla, corners_tabla, tarjetas_tabla y
+resultado_historico_tabla a un archivo binario con cada columna como un
+arreglo contiguo, junto con el índice por enfrentamiento del almacén de
+características (filas ordenadas por fecha y sumas acumuladas). El
+servidor lo abre con mmap en modo de solo lectura (FEATURE_SNAPSHOT) y
+responde todos los endpoints sin consultar PostgreSQL: los arreglos se usan
+directamente sobre el archivo mapeado, sin copiarlos, así que el arranque es
+casi inmediato y los workers de un servidor pre-fork comparten las mismas
+páginas.
+
+Formato (little-endian):
+    0    8 bytes   MAGIC
+    8    uint32    versión del formato (FORMAT_VERSION)
+    12   uint32    longitud de la cabecera JSON
+    16   32 bytes  sha256 de todo lo que sigue (cabecera y arreglos)
+    48   cabecera JSON: fecha de exportación, versión del esquema y, por
+         tabla, columnas, filas y posición, tipo y forma de cada arreglo
+         arreglos, cada uno alineado a ALIGN bytes
+
+El sha256 se verifica al abrir el archivo y es también su versión: el
+servidor recarga el snapshot cuando cambia. El archivo se escribe en uno
+temporal y se renombra, así que un servidor que lo vigila nunca lee uno a
+medio escribir.
+
+Uso:
+    python snapshot.py export                       # escribir data/features.snap
+    python snapshot.py export --output otro.snap
+    python snapshot.py verify [data/features.snap]  # comprobar el checksum y mostrar el contenido
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from datetime import datetime
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+from db_pool import db_config_from_env
+from feature_store import TABLES, FeatureStore, MatchupIndex, TableData
+from migrate import current_version
+
+MAGIC = b'UPSBSNAP'
+FORMAT_VERSION = 1
+PREFIX = struct.Struct('<8sII32s')
+ALIGN = 64
+DEFAULT_PATH = os.path.join('data', 'features.snap')
+
+
+class SnapshotError(Exception):
+    """Snapshot ilegible, corrupto o de otro formato"""
+
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def _concatenate(parts, empty):
+    return np.concatenate(parts) if parts else empty
+
+
+def table_arrays(data):
+    """
+    Arreglos de una TableData para el snapshot: las columnas y el índice por
+    enfrentamiento aplanado (el enfrentamiento k ocupa order[starts[k]:starts[k+1]]
+    y sus sumas acumuladas sums[starts[k] + k:starts[k+1] + k + 1])
+    """
+    pairs = list(data.index)
+    indexes = [data.index[pair] for pair in pairs]
+    n_columns = len(data.columns)
+    starts = np.zeros(len(pairs) + 1, dtype=np.int64)
+    np.cumsum([len(index.rows) for index in indexes], out=starts[1:])
+    return {
+        'local_ids': data.local_ids,
+        'visitante_ids': data.visitante_ids,
+        'fechas': data.fechas,
+        'values': data.values,
+        'pairs': np.array(pairs, dtype=np.int64).reshape(len(pairs), 2),
+        'starts': starts,
+        'order': _concatenate([index.rows for index in indexes], np.empty(0, dtype=np.int64)),
+        'sorted_fechas': _concatenate([index.fechas for index in indexes], np.empty(0, dtype='datetime64[D]')),
+        'sums': _concatenate([index.sums for index in indexes], np.empty((0, n_columns))),
+        'counts': _concatenate([index.counts for index in indexes], np.empty((0, n_columns), dtype=np.int64)),
+    }
+
+
+def table_from_arrays(columns, arrays):
+    """TableData sobre los arreglos del snapshot (vistas del archivo mapeado, sin copias)"""
+    starts = arrays['starts']
+    index = {}
+    for k, (local_id, visitante_id) in enumerate(arrays['pairs'].tolist()):
+        lo, hi = int(starts[k]), int(starts[k + 1])
+        index[(local_id, visitante_id)] = MatchupIndex.from_sums(
+            arrays['order'][lo:hi], arrays['sorted_fechas'][lo:hi],
+            arrays['sums'][lo + k:hi + k + 1], arrays['counts'][lo + k:hi + k + 1]
+        )
+    return TableData(columns, arrays['local_ids'], arrays['visitante_ids'], arrays['fechas'],
+                     arrays['values'], index=index)
+
+
+def write_snapshot(path, tables, schema_version=None):
+    """
+    Escribir `tables` (nombre -> TableData) en `path`; devuelve el sha256.
+    Se escribe en un temporal que reemplaza a `path` al terminar.
+    """
+    blobs = []
+    header = {
+        'created_at': datetime.now().isoformat(),
+        'schema_version': schema_version,
+        'tables': {}
+    }
+    offset = 0
+    for name, data in tables.items():
+        described = {}
+        for array_name, array in table_arrays(data).items():
+            array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+            described[array_name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+            blobs.append((offset, array))
+            offset = _aligned(offset + array.nbytes)
+        header['tables'][name] = {'columns': list(data.columns), 'rows': len(data), 'arrays': described}
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    header_bytes += b' ' * (_aligned(PREFIX.size + len(header_bytes)) - PREFIX.size - len(header_bytes))
+    data_start = PREFIX.size + len(header_bytes)
+
+    digest = hashlib.sha256(header_bytes)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes), b'\0' * 32))
+        f.write(header_bytes)
+        for array_offset, array in blobs:
+            padding = b'\0' * (data_start + array_offset - f.tell())
+            raw = array.tobytes()
+            f.write(padding)
+            f.write(raw)
+            digest.update(padding)
+            digest.update(raw)
+        f.seek(0)
+        f.write(PREFIX.pack(MAGIC, FORMAT_VERSION, len(header_bytes), digest.digest()))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return digest.hexdigest()
+
+
+def _read_prefix(f):
+    prefix = f.read(PREFIX.size)
+    if len(prefix) < PREFIX.size:
+        raise SnapshotError('archivo truncado')
+    magic, format_version, header_size, digest = PREFIX.unpack(prefix)
+    if magic != MAGIC:
+        raise SnapshotError('no es un snapshot de UPSBet')
+    if format_version != FORMAT_VERSION:
+        raise SnapshotError(f'formato {format_version} no soportado (se espera {FORMAT_VERSION})')
+    return header_size, digest
+
+
+class SnapshotFile:
+    """
+    Snapshot en disco como fuente del almacén de características
+    (FeatureStore.use_snapshot). Cada lectura mapea el archivo de nuevo: un
+    snapshot reemplazado sigue mapeado mientras lo usen las consultas en curso.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.header = None
+        self.digest = None
+        self.size = None
+
+    def fingerprint(self):
+        """sha256 guardado en el archivo (solo se leen los primeros bytes)"""
+        with open(self.path, 'rb') as f:
+            return _read_prefix(f)[1].hex()
+
+    def read_tables(self, table_columns=TABLES):
+        """Mapear el archivo, verificar el checksum y devolver (sha256, tablas)"""
+        with open(self.path, 'rb') as f:
+            header_size, digest = _read_prefix(f)
+            size = os.fstat(f.fileno()).st_size
+            if size < PREFIX.size + header_size:
+                raise SnapshotError('archivo truncado')
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if hashlib.sha256(memoryview(buffer)[PREFIX.size:]).digest() != digest:
+            raise SnapshotError('el checksum no coincide (archivo corrupto o incompleto)')
+        header = json.loads(bytes(buffer[PREFIX.size:PREFIX.size + header_size]))
+        data_start = PREFIX.size + header_size
+
+        tables = {}
+        for name, columns in table_columns.items():
+            described = header['tables'].get(name)
+            if described is None:
+                raise SnapshotError(f'falta la tabla {name}')
+            if described['columns'] != list(columns):
+                raise SnapshotError(f'las columnas de {name} no coinciden con las del servidor; hay que volver a exportarlo')
+            arrays = {}
+            for array_name, spec in described['arrays'].items():
+                dtype = np.dtype(spec['dtype'])
+                shape = tuple(spec['shape'])
+                count = int(np.prod(shape))
+                start = data_start + spec['offset']
+                if start + count * dtype.itemsize > size:
+                    raise SnapshotError(f'{name}.{array_name} fuera del archivo')
+                arrays[array_name] = (np.frombuffer(buffer, dtype=dtype, count=count, offset=start).reshape(shape)
+                                      if count else np.empty(shape, dtype=dtype))
+            tables[name] = table_from_arrays(described['columns'], arrays)
+
+        self.header = header
+        self.digest = digest.hex()
+        self.size = size
+        return self.digest, tables
+
+    def info(self):
+        """Versión y origen del snapshot cargado para /api/health"""
+        return {
+            'path': self.path,
+            'format': FORMAT_VERSION,
+            'version': self.digest[:12] if self.digest else None,
+            'sha256': self.digest,
+            'created_at': self.header['created_at'] if self.header else None,
+            'schema_version': self.header['schema_version'] if self.header else None,
+            'bytes': self.size
+        }
+
+
+def export(connection, path, tables=TABLES):
+    """
+    Leer las tablas con `connection` (en una sola transacción de solo lectura,
+    para que el snapshot sea consistente) y escribir el snapshot en `path`
+    """
+    connection.set_session(readonly=True, isolation_level='REPEATABLE READ')
+    try:
+        schema_version = current_version(connection)
+        data = FeatureStore(None, tables).read_tables(connection)
+    finally:
+        connection.rollback()
+    return write_snapshot(path, data, schema_version), data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snapshot columnar de las tablas de características')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='exportar las tablas desde PostgreSQL')
+    export_parser.add_argument('--output', default=DEFAULT_PATH, help=f'archivo de salida (por defecto {DEFAULT_PATH})')
+    verify_parser = commands.add_parser('verify', help='comprobar el checksum de un snapshot')
+    verify_parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'verify':
+        snapshot = SnapshotFile(args.path)
+        try:
+            _, data = snapshot.read_tables()
+        except (OSError, SnapshotError, ValueError) as e:
+            print(f"Snapshot inválido ({args.path}): {e}")
+            return 1
+        info = snapshot.info()
+        print(f"{args.path}: versión {info['version']}, exportado {info['created_at']}, "
+              f"esquema {info['schema_version']}, {info['bytes']} bytes")
+        for name, table in data.items():
+            print(f"  {name:<28} {len(table):>6} filas  {len(table.index):>4} enfrentamientos")
+        return 0
+
+    load_dotenv()
+    try:
+        connection = psycopg2.connect(**db_config_from_env())
+    except psycopg2.Error as e:
+        print(f"Error conectando a la base de datos: {e}")
+        return 1
+    try:
+        digest, data = export(connection, args.output)
+    except psycopg2.Error as e:
+        print(f"Error leyendo las tablas: {e}")
+        return 1
+    finally:
+        connection.close()
+
+    for name, table in data.items():
+        print(f"{name:<28} {len(table):>6} filas")
+    print(f"Snapshot {digest[:12]} guardado en {args.output} ({os.path.getsize(args.output)} bytes)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Copia SQLite en memoria de la base de datos, cargada desde los dumps de data/
+
+La usan benchmark.py y loadtest.py para medir sin un PostgreSQL local:
+mismas tablas y filas, el índice compuesto de la migración 2 y las tablas
+de agregados de aggregates.py (mismo nombre, mismas columnas y misma
+consulta por cruce, con el respaldo del cruce inverso). En lugar de
+triggers se calculan una sola vez al cargar la copia.
+"""
+
+import sqlite3
+
+from aggregates import AGGREGATE_TABLES, _select_pair_sql, aggregate_name
+from feature_store import FeatureStore
+from load_data import SCHEMA_DUMPS
+
+
+def create_standin_aggregates(connection, table, columns):
+    """Tabla de agregados de `table` con una fila por cruce, como refrescar_<agregado> en PostgreSQL"""
+    name = aggregate_name(table)
+    select = _select_pair_sql(table, columns, ':l', ':v')
+    connection.execute(f"CREATE TABLE {name} AS SELECT 0 AS equipo_local_id, 0 AS equipo_visitante_id, s.* "
+                       f"FROM ({select}) s WHERE 0", {'l': 0, 'v': 0})
+    pairs = set()
+    for local_id, visitante_id in connection.execute(
+            f"SELECT DISTINCT equipo_local_id, equipo_visitante_id FROM {table} "
+            f"WHERE equipo_local_id IS NOT NULL AND equipo_visitante_id IS NOT NULL"):
+        pairs.update({(local_id, visitante_id), (visitante_id, local_id)})
+    connection.executemany(f"INSERT INTO {name} SELECT :l, :v, s.* FROM ({select}) s",
+                           [{'l': local_id, 'v': visitante_id} for local_id, visitante_id in sorted(pairs)])
+    connection.execute(f"CREATE UNIQUE INDEX {name}_pk ON {name} (equipo_local_id, equipo_visitante_id)")
+
+
+def load_standin_db():
+    """Base SQLite en memoria con las tablas de los dumps, índices y agregados"""
+    connection = sqlite3.connect(':memory:', check_same_thread=False)
+    for table, path in SCHEMA_DUMPS.items():
+        with open(path, encoding='utf-8') as f:
+            connection.executescript(f.read())
+        # Mismo índice que la migración 2
+        connection.execute(f"CREATE INDEX {table}_enfrentamiento_idx "
+                           f"ON {table} (equipo_local_id, equipo_visitante_id, fecha)")
+    for table, columns in AGGREGATE_TABLES.items():
+        create_standin_aggregates(connection, table, columns)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def load_standin_store(connection, store=None):
+    """Cargar un almacén de características (nuevo o el dado) desde la base SQLite"""
+    store = store or FeatureStore(None)
+    store.load_from(connection)
+    return store
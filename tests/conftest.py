@@ -0,0 +1,32 @@
+"""
+Fixtures comunes: app.py servido desde la copia SQLite de data/ (como
+`loadtest.py --standin`), sin PostgreSQL ni hilos de fondo
+"""
+
+import os
+import time
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def upsbet():
+    """Módulo app con el almacén de características cargado desde la copia SQLite"""
+    for name, value in (('FEATURE_STORE', '0'), ('AGGREGATE_TABLES', '0'), ('DB_HOST', '/nonexistent'),
+                        ('LOG_LEVEL', 'WARNING'), ('DB_POOL_MIN', '0'), ('SERVER_TASKS', '0')):
+        os.environ.setdefault(name, value)
+    import app
+    from sqlite_standin import load_standin_db, load_standin_store
+
+    load_standin_store(load_standin_db(), app.feature_store)
+    app.start_background_threads()
+    for _ in range(300):
+        if app.matchup_matrix.ready or app.matchup_matrix.last_error:
+            break
+        time.sleep(0.1)
+    return app
+
+
+@pytest.fixture
+def client(upsbet):
+    return upsbet.app.test_client()
@@ -0,0 +1,57 @@
+"""
+Control de admisión: rechazo inmediato (429) con la cola llena o una espera
+estimada excesiva, y 503 con Retry-After si la espera en cola se agota
+"""
+
+import threading
+
+import pytest
+
+from admission import AdmissionController, Overloaded
+
+
+def test_espera_agotada_503():
+    controller = AdmissionController('prueba', limit=1, queue_size=1, max_wait=0.05)
+    controller.acquire()
+    with pytest.raises(Overloaded) as error:
+        controller.acquire()
+    assert error.value.status == 503
+    assert error.value.retry_after >= 1
+    assert (controller.timeouts, controller.waiting, controller.in_flight) == (1, 0, 1)
+
+
+def test_cola_llena_429():
+    controller = AdmissionController('prueba', limit=1, queue_size=0, max_wait=1)
+    controller.acquire()
+    with pytest.raises(Overloaded) as error:
+        controller.acquire()
+    assert (error.value.status, error.value.reason) == (429, 'cola llena')
+
+
+def test_latencia_estimada_429():
+    controller = AdmissionController('prueba', limit=1, queue_size=4, max_wait=0.5)
+    controller.acquire()
+    controller.release(2.0)         # cada cálculo tarda ~2 s: no hay espera posible en 0.5 s
+    controller.acquire()
+    with pytest.raises(Overloaded) as error:
+        controller.acquire()
+    assert (error.value.status, error.value.reason) == (429, 'latencia')
+    assert error.value.retry_after == 2
+
+
+def test_lugar_liberado_admite_al_que_espera():
+    controller = AdmissionController('prueba', limit=1, queue_size=1, max_wait=2)
+    controller.acquire()
+    threading.Timer(0.05, controller.release, (0.01,)).start()
+    controller.acquire()
+    assert (controller.queued, controller.admitted) == (1, 2)
+
+
+def test_endpoint_saturado_503(upsbet, client, monkeypatch):
+    controller = AdmissionController('predict_batch', limit=1, queue_size=1, max_wait=0.05)
+    controller.acquire()
+    monkeypatch.setitem(upsbet.admission, 'predict_batch', controller)
+    response = client.post('/api/predict-batch', json={'partidos': [{'equipo_local_id': 0, 'equipo_visitante_id': 4}]})
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+    assert 'saturado' in response.get_json()['error']
@@ -0,0 +1,98 @@
+"""
+PostgresPool con conexiones simuladas: espera acotada cuando está agotado,
+cierre de conexiones inactivas y estado nuevo después de un fork
+"""
+
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+import pytest
+
+import db_pool
+from db_pool import PostgresPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Conexiones abiertas por el pool, en orden"""
+    opened = []
+
+    def connect(**config):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(db_pool.psycopg2, 'connect', connect)
+    return opened
+
+
+def test_agotado_espera_hasta_el_timeout(connections):
+    pool = PostgresPool({}, minconn=0, maxconn=1)
+    pool.get()
+    started = time.monotonic()
+    with pytest.raises(psycopg2.pool.PoolError):
+        pool.get(timeout=0.05)
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()['timeouts'] == 1
+    assert len(connections) == 1
+
+
+def test_conexion_devuelta_despierta_al_que_espera(connections):
+    pool = PostgresPool({}, minconn=0, maxconn=1)
+    connection = pool.get()
+    threading.Timer(0.05, pool.put, (connection,)).start()
+    assert pool.get(timeout=2) is connection
+    assert pool.stats()['waits'] == 1
+
+
+def test_inactivas_se_cierran_por_encima_del_minimo(connections):
+    pool = PostgresPool({}, minconn=1, maxconn=3, idle_timeout=0.05)
+    borrowed = [pool.get() for _ in range(3)]
+    for connection in borrowed:
+        pool.put(connection)
+    assert pool.stats()['idle'] == 3
+
+    time.sleep(0.1)
+    pool.close_expired()
+    stats = pool.stats()
+    assert (stats['open'], stats['idle'], stats['idle_closed']) == (1, 1, 2)
+    # Se cierran las más antiguas y queda la última devuelta
+    assert [c.closed for c in borrowed] == [1, 1, 0]
+
+
+def test_sin_idle_timeout_no_se_cierran(connections):
+    pool = PostgresPool({}, minconn=0, maxconn=2, idle_timeout=0)
+    pool.put(pool.get())
+    pool.close_expired()
+    assert pool.stats()['idle'] == 1
+
+
+def test_fork_empieza_vacio_sin_cerrar_las_del_padre(connections, monkeypatch):
+    pool = PostgresPool({}, minconn=0, maxconn=2)
+    inherited = pool.get()
+    pool.put(inherited)
+    pool.get()
+
+    monkeypatch.setattr(db_pool.os, 'getpid', lambda: -1)
+    connection = pool.get()
+    assert connection is not inherited
+    stats = pool.stats()
+    assert (stats['open'], stats['in_use'], stats['idle']) == (1, 1, 0)
+    # Cerrarla en el hijo cortaría el socket que sigue usando el padre
+    assert not inherited.closed
@@ -0,0 +1,78 @@
+"""
+Los promedios del almacén en memoria (sumas acumuladas de MatchupIndex)
+deben coincidir con AVG en SQL para cualquier fecha de corte, incluidas
+las fechas exactas de los partidos (el corte es estricto)
+"""
+
+import numpy as np
+import pytest
+
+from feature_store import SQL_AVG_TABLES, TABLES
+from sqlite_standin import load_standin_db, load_standin_store
+
+
+@pytest.fixture(scope='module')
+def standin():
+    connection = load_standin_db()
+    return connection, load_standin_store(connection)
+
+
+def sql_average(connection, table, local_id, visitante_id, fecha_corte, fecha_desde=None):
+    columns = TABLES[table]
+    sql = (f"SELECT COUNT(*), {', '.join(f'AVG({col})' for col in columns)} FROM {table} "
+           f"WHERE equipo_local_id = ? AND equipo_visitante_id = ? AND fecha < ?")
+    params = [local_id, visitante_id, fecha_corte]
+    if fecha_desde is not None:
+        sql += " AND fecha >= ?"
+        params.append(fecha_desde)
+    count, *averages = connection.execute(sql, params).fetchone()
+    return count, dict(zip(columns, averages))
+
+
+def cutoffs(matchup):
+    """Antes del primer partido, cada fecha de partido, el día siguiente y después del último"""
+    fechas = matchup.fechas[~np.isnat(matchup.fechas)]
+    values = {fechas[0] - 1, fechas[-1] + 365}
+    for fecha in fechas:
+        values.update((fecha, fecha + 1))
+    return sorted(str(value) for value in values)
+
+
+@pytest.mark.parametrize('table', sorted(SQL_AVG_TABLES))
+def test_promedios_iguales_a_sql(standin, table):
+    connection, store = standin
+    data = store._tables[table]
+    # Los cruces con más partidos tienen más fechas de corte distintas
+    pairs = sorted(data.index, key=lambda pair: -len(data.index[pair].rows))[:15]
+    compared = 0
+    for local_id, visitante_id in pairs:
+        for fecha_corte in cutoffs(data.index[(local_id, visitante_id)]):
+            count, expected = sql_average(connection, table, local_id, visitante_id, fecha_corte)
+            result = data.average(local_id, visitante_id, np.datetime64(fecha_corte, 'D'))
+            if count == 0:
+                assert result is None
+                continue
+            assert result['num_partidos'] == count
+            assert {col: result[col] for col in expected} == pytest.approx(expected, rel=1e-9, nan_ok=True)
+            compared += 1
+    assert compared > 0
+
+
+def test_ventana_de_fechas(standin):
+    connection, store = standin
+    data = store._tables['ganador_resultado_tabla']
+    local_id, visitante_id = max(data.index, key=lambda pair: len(data.index[pair].rows))
+    fechas = [str(f) for f in data.index[(local_id, visitante_id)].fechas]
+    desde, corte = fechas[1], fechas[-1]
+    count, expected = sql_average(connection, 'ganador_resultado_tabla', local_id, visitante_id, corte, desde)
+    result = data.average(local_id, visitante_id, np.datetime64(corte, 'D'), np.datetime64(desde, 'D'))
+    assert result['num_partidos'] == count == len(fechas) - 2
+    assert {col: result[col] for col in expected} == pytest.approx(expected, rel=1e-9, nan_ok=True)
+
+
+def test_cruce_inverso_si_no_hay_directo(standin):
+    _, store = standin
+    data = store._tables['ganador_resultado_tabla']
+    local_id, visitante_id = next(pair for pair in data.index if pair[::-1] not in data.index)
+    assert data.average(visitante_id, local_id) is None
+    assert store.average('ganador_resultado_tabla', visitante_id, local_id) == data.average(local_id, visitante_id)
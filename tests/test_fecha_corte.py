@@ -0,0 +1,31 @@
+"""La fecha de corte se acota a hoy y solo se admite exactamente YYYY-MM-DD"""
+
+from datetime import date
+
+import pytest
+
+
+def test_fecha_valida(upsbet):
+    assert upsbet.get_fecha_corte('2023-06-01') == '2023-06-01'
+
+
+def test_fecha_futura_se_acota_a_hoy(upsbet):
+    assert upsbet.get_fecha_corte('2999-01-01') == date.today().isoformat()
+
+
+@pytest.mark.parametrize('fecha', [None, ''])
+def test_sin_fecha(upsbet, fecha):
+    assert upsbet.get_fecha_corte(fecha) == date.today().isoformat()
+
+
+@pytest.mark.parametrize('fecha', ['20230601', '2023-06-01T10:00', '2023-06-01 10:00', '2023-6-1',
+                                   '2023-02-30', '01-06-2023', 20230601])
+def test_fecha_invalida(upsbet, fecha):
+    with pytest.raises(upsbet.InvalidFecha):
+        upsbet.get_fecha_corte(fecha)
+
+
+@pytest.mark.parametrize('fecha', ['20230601', '2023-06-01T10:00'])
+def test_fecha_invalida_400(client, fecha):
+    response = client.post('/api/predict', json={'equipo_local_id': 1, 'equipo_visitante_id': 2, 'fecha': fecha})
+    assert response.status_code == 400
@@ -0,0 +1,35 @@
+"""/api/predict-batch responde 200 con los errores de cada partido por separado"""
+
+
+def test_errores_parciales(upsbet, client):
+    response = client.post('/api/predict-batch', json={'partidos': [
+        {'equipo_local_id': 0, 'equipo_visitante_id': 4},
+        {'equipo_local_id': 4, 'equipo_visitante_id': 4},
+        {'equipo_local_id': 0},
+        'no es un partido',
+    ]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['total'], body['con_errores']) == (4, 3)
+
+    valido, iguales, sin_visitante, invalido = body['predicciones']
+    for campo in ('resultado', 'corners', 'tarjetas'):
+        assert 'error' not in valido[campo]
+        assert 'features_used' not in valido[campo] and 'model_version' not in valido[campo]
+    assert valido['resultado']['resultado_1x2'] in (0, 1, 2)
+    assert iguales['error'] == 'Los equipos local y visitante no pueden ser iguales'
+    assert sin_visitante['error'] == invalido['error'] == 'Faltan IDs de equipos'
+    assert body['model_versions'] == upsbet.model_versions(upsbet.model_manager.current)
+
+
+def test_cruce_sin_historial(client):
+    response = client.post('/api/predict-batch', json={'partidos': [{'equipo_local_id': 9999, 'equipo_visitante_id': 4}]})
+    assert response.status_code == 200
+    prediccion = response.get_json()['predicciones'][0]
+    assert all('error' in prediccion[campo] for campo in ('resultado', 'corners', 'tarjetas'))
+
+
+def test_lote_invalido(client):
+    assert client.post('/api/predict-batch', json={'partidos': []}).status_code == 400
+    assert client.post('/api/predict-batch', json={'partidos': [{}],
+                                                   'fecha': '2023-06-01T10:00'}).status_code == 400
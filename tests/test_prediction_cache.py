@@ -0,0 +1,45 @@
+"""PredictionCache: expiración por TTL, desalojo LRU e invalidación"""
+
+import time
+
+from prediction_cache import PredictionCache
+
+
+def test_expira_a_los_ttl_segundos():
+    cache = PredictionCache(maxsize=8, ttl=0.05)
+    cache.put('k', 1)
+    assert cache.get('k') == 1
+    time.sleep(0.1)
+    assert cache.get('k') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations'], stats['size']) == (1, 1, 1, 0)
+
+
+def test_desaloja_la_menos_usada():
+    cache = PredictionCache(maxsize=2, ttl=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1      # 'b' pasa a ser la menos usada
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_invalidar_conserva_los_valores_de_respaldo():
+    cache = PredictionCache(maxsize=8, ttl=60)
+    cache.put(('resultado', 1, 2, 'v1'), 'vieja', stale_key=('resultado', 1, 2))
+    cache.invalidate(object())      # se usa como listener de las recargas
+    assert cache.get(('resultado', 1, 2, 'v1')) is None
+    assert cache.get_stale(('resultado', 1, 2)) == 'vieja'
+    stats = cache.stats()
+    assert (stats['invalidations'], stats['stale_hits'], stats['size']) == (1, 1, 0)
+
+
+def test_desactivada():
+    for cache in (PredictionCache(maxsize=0, ttl=60), PredictionCache(maxsize=8, ttl=0)):
+        cache.put('k', 1)
+        assert cache.get('k') is None
+    cache = PredictionCache()
+    cache.put(None, 1)
+    assert cache.get(None) is None
@@ -0,0 +1,102 @@
+"""
+SingleFlight: las llamadas simultáneas con la misma clave comparten un
+solo cálculo, y quien espera respeta el plazo de su propia petición
+"""
+
+import threading
+import time
+
+import pytest
+
+import deadline
+from single_flight import SingleFlight
+
+
+def start_leader(flight, key, release, result='hecho'):
+    """Lanzar en otro hilo un cálculo que no termina hasta `release`"""
+    started = threading.Event()
+    out = {}
+
+    def compute():
+        started.set()
+        release.wait(5)
+        return result
+
+    def run():
+        try:
+            out['result'] = flight.do(key, compute)
+        except BaseException as e:
+            out['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert started.wait(5)
+    return thread, out
+
+
+def test_espera_acotada_por_el_plazo():
+    flight = SingleFlight()
+    release = threading.Event()
+    thread, out = start_leader(flight, 'k', release)
+    try:
+        deadline.start(0.05, 'prueba')
+        with pytest.raises(deadline.DeadlineExceeded):
+            flight.do('k', lambda: pytest.fail('no debe calcular'))
+    finally:
+        deadline.clear()
+        release.set()
+        thread.join(5)
+    # El cálculo del primero sigue y termina con normalidad
+    assert out == {'result': 'hecho'}
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_resultado_compartido():
+    flight = SingleFlight()
+    release = threading.Event()
+    thread, out = start_leader(flight, 'k', release)
+    follower = {}
+    waiter = threading.Thread(target=lambda: follower.update(result=flight.do('k', lambda: 'otro')))
+    waiter.start()
+    while flight.stats()['shared'] == 0:
+        time.sleep(0.001)
+    release.set()
+    thread.join(5)
+    waiter.join(5)
+    assert out == follower == {'result': 'hecho'}
+    assert (flight.stats()['calls'], flight.stats()['shared']) == (1, 1)
+
+
+def test_error_llega_a_todos_y_no_queda_en_curso():
+    flight = SingleFlight()
+    release = threading.Event()
+    started = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError('sin datos')
+
+    def call(fn):
+        try:
+            flight.do('k', fn)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call, args=(failing,))
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=call, args=(lambda: pytest.fail('no debe calcular'),))
+    follower.start()
+    while flight.stats()['shared'] == 0:
+        time.sleep(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(errors) == 2 and errors[0] is errors[1]
+    stats = flight.stats()
+    assert (stats['errors'], stats['in_flight']) == (1, 0)
+    # La siguiente llamada vuelve a calcular
+    assert flight.do('k', lambda: 'ok') == 'ok'
@@ -0,0 +1,103 @@
+"""
+Los árboles compilados deben dar las mismas predicciones que LightGBM y
+XGBoost para los modelos de modelos/ (en los dos formatos) y para modelos
+pequeños entrenados aquí con categorías y valores faltantes
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import tree_predictor
+from model_manager import estimators
+from model_store import load_models
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'modelos')
+
+
+def edge_rows(ensemble):
+    """Filas con NaN, ceros, infinitos, umbrales exactos y categorías fuera de rango"""
+    n = ensemble.n_features
+    rows = [np.full(n, np.nan), np.zeros(n), np.full(n, -0.0), np.full(n, 1e-40),
+            np.full(n, np.inf), np.full(n, -np.inf), np.full(n, 1e12)]
+    # Cada umbral exacto y los valores inmediatamente a cada lado
+    for node in range(0, ensemble.n_nodes, max(1, ensemble.n_nodes // 40)):
+        if ensemble.categorical[node]:
+            continue
+        threshold = float(ensemble.threshold[node])
+        for value in (threshold, np.nextafter(threshold, -np.inf), np.nextafter(threshold, np.inf)):
+            row = np.zeros(n)
+            row[ensemble.feature[node]] = value
+            rows.append(row)
+    for f in sorted(set(ensemble.feature[ensemble.categorical].tolist())):
+        for value in (-1.0, -0.5, 0.0, 0.5, 1.0, 31.0, 32.0, 1e6, np.nan):
+            row = np.zeros(n)
+            row[f] = value
+            rows.append(row)
+    return np.vstack(rows)
+
+
+def assert_parity(ensemble, model, X):
+    expected = model.predict(X)
+    np.testing.assert_allclose(ensemble.predict(X), expected, rtol=1e-7, atol=1e-12)
+    np.testing.assert_allclose(ensemble.predict_rows(X), expected, rtol=1e-7, atol=1e-12)
+
+
+@pytest.fixture(scope='module', params=['native', 'pickle'])
+def loaded_models(request):
+    try:
+        objects, _ = load_models(MODEL_DIR, request.param)
+    except (OSError, ValueError) as e:
+        pytest.skip(f'modelos en formato {request.param} no disponibles: {e}')
+    return estimators(objects)
+
+
+@pytest.mark.parametrize('name', ['model_gl', 'model_gv', 'corners', 'tarjetas'])
+def test_modelos_aleatorios(loaded_models, name):
+    model = loaded_models[name]
+    ensemble = tree_predictor.from_model(model)
+    assert all(tree_predictor.parity(ensemble, model, 2000, seed=7))
+
+
+@pytest.mark.parametrize('name', ['model_gl', 'model_gv', 'corners', 'tarjetas'])
+def test_modelos_casos_limite(loaded_models, name):
+    model = loaded_models[name]
+    ensemble = tree_predictor.from_model(model)
+    assert_parity(ensemble, model, edge_rows(ensemble))
+
+
+def training_data(seed=0, rows=400):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(rows, 5))
+    X[:, 4] = rng.integers(0, 20, size=rows)
+    y = X[:, 0] * 2 + np.where(np.isin(X[:, 4], [1, 3, 7, 15]), 3.0, -1.0) + rng.normal(scale=0.1, size=rows)
+    X[rng.random(X.shape) < 0.1] = np.nan
+    return X, y
+
+
+def test_lightgbm_categorico():
+    lightgbm = pytest.importorskip('lightgbm')
+    X, y = training_data()
+    model = lightgbm.LGBMRegressor(n_estimators=30, num_leaves=8, min_child_samples=5, verbose=-1)
+    model.fit(X, y, categorical_feature=[4])
+    ensemble = tree_predictor.from_model(model)
+    assert ensemble.categorical.any()
+    assert_parity(ensemble, model, np.vstack([tree_predictor.parity_inputs(5, 500, 1, [4]), edge_rows(ensemble)]))
+
+
+def test_xgboost_faltantes():
+    xgboost = pytest.importorskip('xgboost')
+    X, y = training_data(seed=1)
+    model = xgboost.XGBRegressor(n_estimators=30, max_depth=4, n_jobs=1)
+    model.fit(X, y)
+    ensemble = tree_predictor.from_model(model)
+    assert_parity(ensemble, model, np.vstack([tree_predictor.parity_inputs(5, 500, 2), edge_rows(ensemble)]))
+
+
+def test_objetivo_no_soportado():
+    lightgbm = pytest.importorskip('lightgbm')
+    X, y = training_data()
+    model = lightgbm.LGBMClassifier(n_estimators=5, verbose=-1).fit(np.nan_to_num(X), y > 0)
+    with pytest.raises(ValueError):
+        tree_predictor.from_model(model)
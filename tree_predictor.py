@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+UPSBet - Predicción con ensambles de árboles aplanados
+======================================================
+Para una sola fila casi todo el tiempo de Booster.predict (LightGBM) y
+XGBRegressor.predict se va en validar la entrada y en preparar los hilos
+de la librería; recorrer los árboles es una parte mínima. Este módulo
+convierte cada ensamble ya cargado en tablas de nodos (arrays de NumPy) y
+en una función de Python generada a partir de esas tablas, con un if por
+nodo, para predecir filas sueltas sin pasar por la librería.
+
+- TreeEnsemble.predict(X): recorre todos los árboles y filas a la vez con
+  NumPy (un paso por nivel)
+- TreeEnsemble.predict_rows(X): llama a la función compilada fila por fila;
+  es la más rápida para pocas filas
+
+Ambos reproducen exactamente las reglas de decisión de cada librería
+(valores faltantes, divisiones categóricas de LightGBM, comparación en
+float32 de XGBoost) y el orden en que suman las hojas, así que el
+resultado es idéntico bit a bit al del modelo original. Solo se aceptan
+los modelos de regresión que usa el servidor (una salida, objetivo sin
+transformación); para cualquier otro from_model lanza ValueError.
+
+ModelManager compara cada ensamble con su modelo (parity) antes de usarlo;
+si no coinciden se sigue usando el predict de la librería.
+
+Comprobación (compara con los modelos originales y mide la latencia):
+    python tree_predictor.py
+    python tree_predictor.py --model-dir otra/carpeta --rows 5000
+
+Las mismas comparaciones, con casos límite, están en tests/test_tree_predictor.py.
+"""
+
+import argparse
+import json
+import sys
+import time
+from array import array
+
+import numpy as np
+
+# kZeroThreshold de LightGBM (1e-35 en float32)
+ZERO_THRESHOLD = float(np.float32(1e-35))
+
+# Tipos de valor faltante de LightGBM (bits 2-3 de decision_type)
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+
+# Objetivos cuya predicción es la suma de las hojas sin transformar
+LIGHTGBM_OBJECTIVES = {'regression', 'regression_l1', 'huber', 'fair', 'quantile', 'mape'}
+XGBOOST_OBJECTIVES = {'reg:squarederror', 'reg:absoluteerror', 'reg:pseudohubererror', 'reg:quantileerror'}
+
+
+class TreeEnsemble:
+    """
+    Ensamble de árboles en tablas de nodos.
+
+    Los nodos internos de todos los árboles comparten los arrays feature,
+    threshold, left, right, default_left, missing_type y categorical; un hijo
+    negativo c es la hoja ~c de leaf_value. roots tiene el nodo raíz de cada
+    árbol (negativo si el árbol es una sola hoja).
+    """
+
+    def __init__(self, kind, n_features, trees, base_score=0.0):
+        self.kind = kind
+        self.n_features = n_features
+        self.base_score = base_score
+        self.dtype = np.float32 if kind == 'xgboost' else np.float64
+
+        columns = {name: [] for name in ('feature', 'threshold', 'default_left', 'missing_type', 'categories')}
+        left, right, leaf_value, roots = [], [], [], []
+        for tree in trees:
+            node_offset, leaf_offset = len(left), len(leaf_value)
+
+            def shift(child):
+                return child + node_offset if child >= 0 else ~(~child + leaf_offset)
+
+            for name in columns:
+                columns[name].extend(tree[name])
+            left.extend(shift(c) for c in tree['left'])
+            right.extend(shift(c) for c in tree['right'])
+            leaf_value.extend(tree['leaf_value'])
+            roots.append(node_offset if tree['left'] else ~leaf_offset)
+
+        self.feature = np.array(columns['feature'], dtype=np.int32)
+        self.threshold = np.array(columns['threshold'], dtype=np.float64)
+        self.left = np.array(left, dtype=np.int32)
+        self.right = np.array(right, dtype=np.int32)
+        self.default_left = np.array(columns['default_left'], dtype=bool)
+        self.missing_type = np.array(columns['missing_type'], dtype=np.int8)
+        self.categorical = np.array([c is not None for c in columns['categories']], dtype=bool)
+        self.leaf_value = np.array(leaf_value, dtype=self.dtype)
+        self.roots = np.array(roots, dtype=np.int32)
+
+        # Categorías de cada nodo categórico como bitset: palabra v // 32, bit v % 32
+        self.categories = columns['categories']
+        self.cat_start = np.zeros(len(self.feature), dtype=np.int64)
+        self.cat_words = np.zeros(len(self.feature), dtype=np.int64)
+        words = []
+        for node, values in enumerate(self.categories):
+            if values is None:
+                continue
+            bitset = np.zeros(max(values, default=0) // 32 + 1, dtype=np.uint32)
+            for v in values:
+                bitset[v // 32] |= np.uint32(1 << (v % 32))
+            self.cat_start[node], self.cat_words[node] = len(words), len(bitset)
+            words.extend(bitset.tolist())
+        self.cat_bitset = np.array(words, dtype=np.uint32)
+
+        self._predict_row = None
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @property
+    def n_leaves(self):
+        return len(self.leaf_value)
+
+    def _check(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Se esperan {self.n_features} características por fila, se recibieron {X.shape[-1]}")
+        if self.kind == 'xgboost':
+            # XGBoost compara en float32
+            X = X.astype(np.float32).astype(np.float64)
+        return X
+
+    def _go_left(self, nodes, x):
+        """Para cada par (nodo, valor), True si la fila baja por la izquierda"""
+        nan = np.isnan(x)
+        if self.kind == 'xgboost':
+            return np.where(nan, self.default_left[nodes], x < self.threshold[nodes])
+
+        missing = self.missing_type[nodes]
+        z = np.where(nan & (missing != MISSING_NAN), 0.0, x)
+        go_left = z <= self.threshold[nodes]
+        use_default = (((missing == MISSING_ZERO) & (np.abs(z) <= ZERO_THRESHOLD))
+                       | ((missing == MISSING_NAN) & nan))
+        go_left = np.where(use_default, self.default_left[nodes], go_left)
+
+        categorical = np.flatnonzero(self.categorical[nodes])
+        if categorical.size:
+            go_left[categorical] = self._in_categories(nodes[categorical], x[categorical])
+        return go_left
+
+    def _in_categories(self, nodes, x):
+        """Divisiones categóricas: NaN y negativos a la derecha; si no, bit int(x) del bitset"""
+        valid = (x > -1.0) & (x < 2147483648.0)
+        values = np.where(valid, x, 0.0).astype(np.int64)
+        word = values // 32
+        valid &= word < self.cat_words[nodes]
+        bits = self.cat_bitset[np.where(valid, self.cat_start[nodes] + word, 0)]
+        return valid & ((bits >> (values % 32).astype(np.uint32)) & 1).astype(bool)
+
+    def predict(self, X):
+        """Predicción de todas las filas de X recorriendo los árboles nivel a nivel con NumPy"""
+        X = self._check(X)
+        n_rows = X.shape[0]
+        node = np.repeat(self.roots, n_rows)
+        row = np.tile(np.arange(n_rows), self.n_trees)
+        active = np.flatnonzero(node >= 0)
+        while active.size:
+            current = node[active]
+            go_left = self._go_left(current, X[row[active], self.feature[current]])
+            node[active] = np.where(go_left, self.left[current], self.right[current])
+            active = active[node[active] >= 0]
+
+        # Sumar árbol por árbol, en el mismo orden y precisión que la librería
+        leaves = self.leaf_value[~node].reshape(self.n_trees, n_rows)
+        if self.kind == 'xgboost':
+            leaves = np.vstack([np.full((1, n_rows), self.base_score, dtype=self.dtype), leaves])
+        return np.cumsum(leaves, axis=0, dtype=self.dtype)[-1]
+
+    def predict_rows(self, X):
+        """Predicción fila por fila con la función compilada (la más rápida para pocas filas)"""
+        X = self._check(X)
+        predict_row = self.compile()
+        return np.array([predict_row(row) for row in X.tolist()], dtype=self.dtype)
+
+    def compile(self):
+        """Función compilada row -> predicción (lista de floats); se genera una sola vez"""
+        if self._predict_row is None:
+            namespace = {'_float32_sum': _float32_sum}
+            exec(compile(self.source(), f'<{self.kind} {self.n_trees} árboles>', 'exec'), namespace)
+            self._predict_row = namespace['predict_row']
+        return self._predict_row
+
+    def source(self):
+        """Código Python de predict_row: una expresión condicional anidada por árbol"""
+        used = sorted(set(self.feature.tolist()))
+        zeroed = sorted({f for node, f in enumerate(self.feature.tolist())
+                         if self.kind == 'lightgbm' and not self.categorical[node]
+                         and self.missing_type[node] != MISSING_NAN})
+        categorical = sorted(set(self.feature[self.categorical].tolist()))
+
+        lines = ['def predict_row(row):']
+        lines.append('    ' + ''.join(f'x{f}, ' if f in used else '_, ' for f in range(self.n_features)) + '= row')
+        for f in zeroed:
+            lines.append(f'    z{f} = x{f} if x{f} == x{f} else 0.0')
+        for f in categorical:
+            lines.append(f'    c{f} = int(x{f}) if -1.0 < x{f} < 2147483648.0 else -1')
+
+        trees = [self._expression(int(root)) for root in self.roots]
+        if self.kind == 'xgboost':
+            lines.append(f'    return _float32_sum(({_literal(self.base_score)}, ' + ', '.join(trees) + '))')
+        else:
+            lines.append('    s = 0.0')
+            lines.extend(f'    s += {tree}' for tree in trees)
+            lines.append('    return s')
+        return '\n'.join(lines) + '\n'
+
+    def _expression(self, node):
+        if node < 0:
+            return _literal(self.leaf_value[~node])
+        return (f'({self._expression(int(self.left[node]))} if {self._condition(node)} '
+                f'else {self._expression(int(self.right[node]))})')
+
+    def _condition(self, node):
+        """Condición para bajar por la izquierda, en términos de x{f}, z{f} y c{f}"""
+        f = int(self.feature[node])
+        threshold = _literal(self.threshold[node])
+        default_left = bool(self.default_left[node])
+
+        if self.kind == 'xgboost':
+            # NaN hace falsa cualquier comparación
+            return f'not x{f} >= {threshold}' if default_left else f'x{f} < {threshold}'
+        if self.categorical[node]:
+            values = '{' + ', '.join(str(v) for v in sorted(self.categories[node])) + '}'
+            return f'c{f} in {values}' if self.categories[node] else 'False'
+
+        missing = self.missing_type[node]
+        if missing == MISSING_NAN:
+            return f'not x{f} > {threshold}' if default_left else f'x{f} <= {threshold}'
+        if missing == MISSING_ZERO:
+            zero = f'-{ZERO_THRESHOLD!r} <= z{f} <= {ZERO_THRESHOLD!r}'
+            return f'(z{f} <= {threshold} or {zero})' if default_left else f'(z{f} <= {threshold} and not {zero})'
+        return f'z{f} <= {threshold}'
+
+
+def _float32_sum(values):
+    """Suma secuencial en float32, como acumula XGBoost las hojas sobre base_score"""
+    return float(np.add.accumulate(np.frombuffer(array('f', values), dtype=np.float32))[-1])
+
+
+def _literal(value):
+    value = float(value)
+    return repr(value) if np.isfinite(value) else f"float('{value}')"
+
+
+def _lightgbm_trees(text):
+    """Parámetros de cabecera y bloques Tree=... del texto de un modelo de LightGBM"""
+    header, trees, current = {}, [], None
+    for line in text.splitlines():
+        if line == 'end of trees':
+            break
+        if line.startswith('Tree='):
+            current = {}
+            trees.append(current)
+        elif '=' in line:
+            key, value = line.split('=', 1)
+            (header if current is None else current)[key] = value
+    return header, trees
+
+
+def from_lightgbm(text):
+    """TreeEnsemble a partir de Booster.model_to_string()"""
+    header, blocks = _lightgbm_trees(text)
+    objective = header.get('objective', '').split(' ')[0]
+    if objective not in LIGHTGBM_OBJECTIVES:
+        raise ValueError(f"Objetivo de LightGBM no soportado: {objective!r}")
+    if header.get('num_tree_per_iteration', '1') != '1' or 'average_output' in header:
+        raise ValueError("Solo se soportan modelos de LightGBM con un árbol por iteración y sin promediar")
+
+    def values(block, key, cast):
+        return [cast(v) for v in block[key].split(' ')] if block.get(key) else []
+
+    trees = []
+    for block in blocks:
+        if block.get('is_linear', '0') != '0':
+            raise ValueError("Los árboles lineales de LightGBM no están soportados")
+        decision_type = values(block, 'decision_type', int)
+        threshold = values(block, 'threshold', float)
+        boundaries = values(block, 'cat_boundaries', int)
+        words = values(block, 'cat_threshold', int)
+
+        categories = []
+        for node, decision in enumerate(decision_type):
+            if not decision & 1:
+                categories.append(None)
+                continue
+            cat_idx = int(threshold[node])
+            bitset = words[boundaries[cat_idx]:boundaries[cat_idx + 1]]
+            categories.append(frozenset(i * 32 + bit for i, word in enumerate(bitset)
+                                        for bit in range(32) if word >> bit & 1))
+        trees.append({
+            'feature': values(block, 'split_feature', int),
+            'threshold': threshold,
+            'left': values(block, 'left_child', int),
+            'right': values(block, 'right_child', int),
+            'default_left': [bool(d & 2) for d in decision_type],
+            'missing_type': [(d >> 2) & 3 for d in decision_type],
+            'categories': categories,
+            'leaf_value': values(block, 'leaf_value', float),
+        })
+    return TreeEnsemble('lightgbm', int(header['max_feature_idx']) + 1, trees)
+
+
+def from_xgboost(model):
+    """TreeEnsemble a partir del JSON de un modelo de XGBoost (dict)"""
+    learner = model['learner']
+    objective = learner['objective']['name']
+    booster = learner['gradient_booster']
+    if objective not in XGBOOST_OBJECTIVES:
+        raise ValueError(f"Objetivo de XGBoost no soportado: {objective!r}")
+    if booster['name'] != 'gbtree' or learner['learner_model_param'].get('num_target', '1') not in ('0', '1'):
+        raise ValueError("Solo se soportan modelos gbtree de XGBoost con una salida")
+
+    f32 = lambda v: float(np.float32(v))
+    trees = []
+    for tree in booster['model']['trees']:
+        if any(tree['split_type']):
+            raise ValueError("Las divisiones categóricas de XGBoost no están soportadas")
+        children = tree['left_children']
+        # Numerar por separado nodos internos y hojas
+        index, n_internal, n_leaves = [], 0, 0
+        for child in children:
+            if child == -1:
+                index.append(~n_leaves)
+                n_leaves += 1
+            else:
+                index.append(n_internal)
+                n_internal += 1
+        internal = [i for i, child in enumerate(children) if child != -1]
+        trees.append({
+            'feature': [tree['split_indices'][i] for i in internal],
+            'threshold': [f32(tree['split_conditions'][i]) for i in internal],
+            'left': [index[children[i]] for i in internal],
+            'right': [index[tree['right_children'][i]] for i in internal],
+            'default_left': [bool(tree['default_left'][i]) for i in internal],
+            'missing_type': [MISSING_NAN] * len(internal),
+            'categories': [None] * len(internal),
+            'leaf_value': [f32(tree['split_conditions'][i]) for i, child in enumerate(children) if child == -1],
+        })
+
+    param = learner['learner_model_param']
+    base_score = f32(param['base_score'].strip('[]'))
+    return TreeEnsemble('xgboost', int(param['num_feature']), trees, base_score)
+
+
+def from_model(model):
+    """
+    TreeEnsemble de un modelo ya cargado: Booster o LGBMRegressor de
+    LightGBM, Booster o XGBRegressor de XGBoost. Respeta la mejor iteración
+    si el modelo se entrenó con early stopping, igual que su predict().
+    """
+    if hasattr(model, 'booster_'):
+        model = model.booster_
+    if hasattr(model, 'get_booster'):
+        model = model.get_booster()
+    library = type(model).__module__.split('.')[0]
+
+    if library == 'lightgbm':
+        return from_lightgbm(model.model_to_string())
+    if library == 'xgboost':
+        parsed = json.loads(bytes(model.save_raw('json')))
+        best_iteration = model.attr('best_iteration')
+        if best_iteration is not None:
+            trees = parsed['learner']['gradient_booster']['model']['trees']
+            del trees[int(best_iteration) + 1:]
+        return from_xgboost(parsed)
+    raise ValueError(f"Modelo no soportado: {type(model).__name__}")
+
+
+def parity_inputs(n_features, rows, seed, categorical=()):
+    """Filas aleatorias con ceros, NaN y enteros (para las columnas categóricas) mezclados"""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(rows, n_features)) * 10
+    X[rng.random(X.shape) < 0.05] = 0.0
+    X[rng.random(X.shape) < 0.02] = np.nan
+    for f in categorical:
+        X[:, f] = rng.integers(-2, 40, size=rows)
+    return X
+
+
+def parity(ensemble, model, rows, seed=0):
+    """
+    Comparar ensemble con el predict de model en filas aleatorias. Devuelve
+    (NumPy coincide, compilado coincide)
+    """
+    X = parity_inputs(ensemble.n_features, rows, seed,
+                      sorted(set(ensemble.feature[ensemble.categorical].tolist())))
+    expected = model.predict(X)
+    return (np.array_equal(ensemble.predict(X), expected, equal_nan=True),
+            np.array_equal(ensemble.predict_rows(X), expected, equal_nan=True))
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    from model_store import load_models
+
+    parser = argparse.ArgumentParser(description='Comparar el predictor compilado con los modelos originales')
+    parser.add_argument('--model-dir', default='modelos', help='carpeta de los modelos (por defecto modelos)')
+    parser.add_argument('--format', choices=['auto', 'native', 'pickle'], default='auto',
+                        help='formato de los modelos (por defecto el mismo que el servidor)')
+    parser.add_argument('--rows', type=int, default=2000, help='filas aleatorias por modelo (por defecto 2000)')
+    parser.add_argument('--repeat', type=int, default=2000, help='repeticiones para medir una fila')
+    args = parser.parse_args()
+
+    objects, info = load_models(args.model_dir, None if args.format == 'auto' else args.format)
+    models = {
+        'resultados.model_gl': objects['resultados']['model_gl'],
+        'resultados.model_gv': objects['resultados']['model_gv'],
+        'corners': objects['corners'],
+        'tarjetas': objects['tarjetas'],
+    }
+    print(f"Modelos en formato {info['format']}; {args.rows} filas aleatorias por modelo\n")
+    print(f"{'modelo':<22}{'árboles':>8}{'nodos':>7}{'predict':>9}{'filas':>7}"
+          f"{'original µs':>13}{'compilado µs':>14}{'×':>7}")
+
+    failures = []
+    for seed, (name, model) in enumerate(models.items()):
+        ensemble = from_model(model)
+        batch_ok, rows_ok = parity(ensemble, model, args.rows, seed)
+        if not (batch_ok and rows_ok):
+            failures.append(name)
+
+        row = parity_inputs(ensemble.n_features, 1, seed)
+        original = timed(lambda: model.predict(row), args.repeat)
+        compiled = timed(lambda: ensemble.predict_rows(row), args.repeat)
+        print(f"{name:<22}{ensemble.n_trees:>8}{ensemble.n_nodes:>7}{'OK' if batch_ok else 'DISTINTO':>9}"
+              f"{'OK' if rows_ok else 'DISTINTO':>7}{original:>13.1f}{compiled:>14.1f}{original / compiled:>7.1f}")
+
+    if failures:
+        print(f"\nLas predicciones no coinciden con los modelos originales: {', '.join(failures)}")
+        return 1
+    print("\nPredicciones idénticas a los modelos originales")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())